@@ -0,0 +1,257 @@
+import array
+import os
+import sys
+from typing import Any, Iterable, Iterator
+
+import numpy as np
+
+import blockchain_voting_client
+
+# Add compiled protos to the current path, since it's required by protoc
+sys.path.append(os.path.join(os.path.dirname(__file__), "exonum_modules", "main"))
+
+from exonum_modules.main import custom_types_pb2, transactions_pb2
+
+_STATUSES = list(blockchain_voting_client.BallotStatus)
+_STATUS_CODES = {status: code for code, status in enumerate(_STATUSES)}
+
+_NONCE_SIZE = 24
+_KEY_SIZE = 32
+_HASH_SIZE = 32
+
+
+class _VarColumn:
+    """Variable-length values in one contiguous buffer plus offsets."""
+
+    def __init__(self, buffer: bytearray | array.array):
+        self.buffer = buffer
+        self.offsets = array.array("Q", [0])
+
+    def append(self, value: bytes | Iterable[int]):
+        self.buffer.extend(value)
+        self.offsets.append(len(self.buffer))
+
+    def __getitem__(self, position: int):
+        return self.buffer[self.offsets[position] : self.offsets[position + 1]]
+
+    @property
+    def nbytes(self) -> int:
+        buffer_nbytes = len(self.buffer) * getattr(self.buffer, "itemsize", 1)
+        return buffer_nbytes + len(self.offsets) * self.offsets.itemsize
+
+
+class _FixedColumn:
+    """Fixed-size values back to back in one buffer."""
+
+    def __init__(self, size: int):
+        self.size = size
+        self.buffer = bytearray()
+
+    def append(self, value: bytes):
+        if len(value) != self.size:
+            raise ValueError(f"Expected {self.size} bytes, got {len(value)}")
+        self.buffer.extend(value)
+
+    def __getitem__(self, position: int) -> memoryview:
+        start = position * self.size
+        return memoryview(self.buffer)[start : start + self.size]
+
+    @property
+    def nbytes(self) -> int:
+        return len(self.buffer)
+
+
+class BallotStore:
+    """Compact columnar storage of ballots.
+
+    Index, district id and status live in typed array columns, encrypted
+    messages, sids and decrypted choices in contiguous buffers with offsets,
+    and keys and hashes in fixed-size byte columns. A stored ballot costs
+    about the size of its data instead of several Python objects per field.
+
+    `store[position]` and iteration build `Ballot` objects on demand for code
+    that needs them. The numpy column accessors return views of the store's
+    buffers, so nothing may be appended while they are in use.
+    """
+
+    def __init__(self):
+        self._indices = array.array("q")
+        self._district_ids = array.array("q")
+        self._statuses = array.array("b")
+
+        self._sids = _VarColumn(bytearray())
+        self._messages = _VarColumn(bytearray())
+        self._nonces = _FixedColumn(_NONCE_SIZE)
+        self._public_keys = _FixedColumn(_KEY_SIZE)
+
+        self._voter_keys = _FixedColumn(_KEY_SIZE)
+        self._store_tx_hashes = _FixedColumn(_HASH_SIZE)
+        # Zeroes for ballots that are not decrypted, see _has_decrypt_tx_hash.
+        self._decrypt_tx_hashes = _FixedColumn(_HASH_SIZE)
+        self._has_decrypt_tx_hash = array.array("b")
+        self._decrypted_choices = _VarColumn(array.array("I"))
+        self._has_decrypted_choices = array.array("b")
+
+    @classmethod
+    def from_ballots(cls, ballots: Iterable[blockchain_voting_client.Ballot]):
+        store = cls()
+        store.extend(ballots)
+        return store
+
+    def append(self, ballot: blockchain_voting_client.Ballot):
+        self._indices.append(ballot.index)
+        self._district_ids.append(ballot.district_id)
+        self._statuses.append(_STATUS_CODES[ballot.status])
+
+        self._sids.append(ballot.sid.encode("utf-8"))
+        self._messages.append(ballot.encrypted_choice.encrypted_message)
+        self._nonces.append(ballot.encrypted_choice.nonce.data)
+        self._public_keys.append(ballot.encrypted_choice.public_key.data)
+
+        self._voter_keys.append(bytes.fromhex(ballot.voter_key_hex))
+        self._store_tx_hashes.append(bytes.fromhex(ballot.store_tx_hash_hex))
+        if ballot.decrypt_tx_hash_hex is None:
+            self._decrypt_tx_hashes.append(bytes(_HASH_SIZE))
+            self._has_decrypt_tx_hash.append(0)
+        else:
+            self._decrypt_tx_hashes.append(bytes.fromhex(ballot.decrypt_tx_hash_hex))
+            self._has_decrypt_tx_hash.append(1)
+        self._decrypted_choices.append(ballot.decrypted_choices or ())
+        self._has_decrypted_choices.append(ballot.decrypted_choices is not None)
+
+    def extend(self, ballots: Iterable[blockchain_voting_client.Ballot]):
+        for ballot in ballots:
+            self.append(ballot)
+
+    def __len__(self) -> int:
+        return len(self._indices)
+
+    @property
+    def indices(self) -> np.ndarray:
+        return np.frombuffer(self._indices, dtype=np.int64)
+
+    @property
+    def district_ids(self) -> np.ndarray:
+        return np.frombuffer(self._district_ids, dtype=np.int64)
+
+    @property
+    def status_codes(self) -> np.ndarray:
+        """Positions of the statuses in `BallotStatus`."""
+        return np.frombuffer(self._statuses, dtype=np.int8)
+
+    @property
+    def decrypted_choices(self) -> tuple[np.ndarray, np.ndarray]:
+        """Decrypted choices of all ballots as one flat column and offsets into
+        it, empty for ballots that are not decrypted."""
+        return (
+            np.frombuffer(self._decrypted_choices.buffer, dtype=np.uint32),
+            np.frombuffer(self._decrypted_choices.offsets, dtype=np.uint64),
+        )
+
+    def encrypted_message(self, position: int) -> memoryview:
+        return memoryview(self._messages.buffer)[
+            self._messages.offsets[position] : self._messages.offsets[position + 1]
+        ]
+
+    def raw_encrypted_choices(
+        self, start: int = 0, stop: int | None = None
+    ) -> list[tuple[int, bytes, bytes, bytes]]:
+        """Encrypted choices of ballots [start, stop) in the form the decrypt
+        workers take (see finalize_voting.RawEncryptedChoice)."""
+        stop = len(self) if stop is None else stop
+        return [
+            (
+                self._district_ids[position],
+                bytes(self.encrypted_message(position)),
+                bytes(self._nonces[position]),
+                bytes(self._public_keys[position]),
+            )
+            for position in range(start, stop)
+        ]
+
+    def _decrypted_choices_at(self, position: int) -> list[int] | None:
+        if not self._has_decrypted_choices[position]:
+            return None
+        return self._decrypted_choices[position].tolist()
+
+    def __getitem__(self, position: int) -> blockchain_voting_client.Ballot:
+        if not 0 <= position < len(self):
+            raise IndexError(f"Ballot position {position} is out of range")
+        return blockchain_voting_client.Ballot(
+            index=self._indices[position],
+            sid=self._sids[position].decode("utf-8"),
+            district_id=self._district_ids[position],
+            status=_STATUSES[self._statuses[position]],
+            voter_key_hex=self._voter_keys[position].hex(),
+            store_tx_hash_hex=self._store_tx_hashes[position].hex(),
+            decrypt_tx_hash_hex=(
+                self._decrypt_tx_hashes[position].hex()
+                if self._has_decrypt_tx_hash[position]
+                else None
+            ),
+            decrypted_choices=self._decrypted_choices_at(position),
+            encrypted_choice=transactions_pb2.TxEncryptedChoice(
+                encrypted_message=bytes(self.encrypted_message(position)),
+                nonce=custom_types_pb2.SealedBoxNonce(
+                    data=bytes(self._nonces[position])
+                ),
+                public_key=custom_types_pb2.SealedBoxPublicKey(
+                    data=bytes(self._public_keys[position])
+                ),
+            ),
+        )
+
+    def __iter__(self) -> Iterator[blockchain_voting_client.Ballot]:
+        for position in range(len(self)):
+            yield self[position]
+
+    def to_columns(self) -> dict[str, Any]:
+        """All fields but the encrypted choice, one column per field, e.g.
+        for a pandas DataFrame."""
+        positions = range(len(self))
+        return {
+            "index": self.indices.copy(),
+            "sid": [self._sids[position].decode("utf-8") for position in positions],
+            "district_id": self.district_ids.copy(),
+            "status": [_STATUSES[code] for code in self._statuses],
+            "voter_key_hex": [
+                self._voter_keys[position].hex() for position in positions
+            ],
+            "store_tx_hash_hex": [
+                self._store_tx_hashes[position].hex() for position in positions
+            ],
+            "decrypt_tx_hash_hex": [
+                (
+                    self._decrypt_tx_hashes[position].hex()
+                    if self._has_decrypt_tx_hash[position]
+                    else None
+                )
+                for position in positions
+            ],
+            "decrypted_choices": [
+                self._decrypted_choices_at(position) for position in positions
+            ],
+        }
+
+    @property
+    def nbytes(self) -> int:
+        columns = (
+            self._indices,
+            self._district_ids,
+            self._statuses,
+            self._has_decrypt_tx_hash,
+            self._has_decrypted_choices,
+        )
+        return sum(len(column) * column.itemsize for column in columns) + sum(
+            column.nbytes
+            for column in (
+                self._sids,
+                self._messages,
+                self._nonces,
+                self._public_keys,
+                self._voter_keys,
+                self._store_tx_hashes,
+                self._decrypt_tx_hashes,
+                self._decrypted_choices,
+            )
+        )
@@ -0,0 +1,134 @@
+"""Measures memory of ballots held as a list of Ballot objects and as a
+BallotStore.
+
+Every measurement builds the ballots in a fresh process and reports its
+resident memory growth, since the protobuf messages inside a Ballot are
+allocated outside of the Python allocator and are not seen by tracemalloc.
+Ballots carry random payloads of the real sizes; encrypting them for real
+would dominate the run time without changing the memory picture. Sizes above
+--max-build are extrapolated from the largest built size.
+
+Usage: python ballot_store_benchmark.py --sizes 100000 1000000 10000000
+"""
+
+import argparse
+import concurrent.futures
+import gc
+import multiprocessing
+import os
+import time
+
+import ballot_store
+import blockchain_voting_client
+import synthetic_ballots
+
+
+def _resident_bytes() -> int:
+    with open("/proc/self/statm") as statm:
+        return int(statm.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+
+
+def _random_ballots(
+    num_ballots: int, message_size: int
+) -> list[blockchain_voting_client.Ballot]:
+    template = synthetic_ballots.generate_election(num_ballots=1).ballots[0]
+    encrypted_choice_type = type(template.encrypted_choice)
+    nonce_type = type(template.encrypted_choice.nonce)
+    public_key_type = type(template.encrypted_choice.public_key)
+    return [
+        blockchain_voting_client.Ballot(
+            index=index,
+            sid=f"sid_{index}",
+            district_id=index % 50 + 1,
+            status=blockchain_voting_client.BallotStatus.UNKNOWN,
+            voter_key_hex=os.urandom(32).hex(),
+            store_tx_hash_hex=os.urandom(32).hex(),
+            decrypt_tx_hash_hex=None,
+            decrypted_choices=None,
+            encrypted_choice=encrypted_choice_type(
+                encrypted_message=os.urandom(message_size),
+                nonce=nonce_type(data=os.urandom(24)),
+                public_key=public_key_type(data=os.urandom(32)),
+            ),
+        )
+        for index in range(num_ballots)
+    ]
+
+
+def _measure(num_ballots: int, message_size: int) -> tuple[int, int, float]:
+    """Runs in a fresh process: returns the memory of the ballot list, of the
+    store built from it and the seconds it took to build the store."""
+    gc.collect()
+    resident_before = _resident_bytes()
+    ballots = _random_ballots(num_ballots, message_size)
+    list_bytes = _resident_bytes() - resident_before
+
+    start = time.perf_counter()
+    store = ballot_store.BallotStore.from_ballots(ballots)
+    elapsed = time.perf_counter() - start
+    if store[num_ballots - 1] != ballots[-1]:
+        raise ValueError("Ballot store returned a different ballot")
+    return list_bytes, store.nbytes, elapsed
+
+
+def _report(num_ballots: int, list_bytes: float, store_bytes: float, note: str):
+    print(
+        f"{num_ballots:>10} ballots  list {list_bytes / 2**20:10.1f} MiB  "
+        f"store {store_bytes / 2**20:10.1f} MiB  "
+        f"{list_bytes / store_bytes:5.1f}x smaller{note}"
+    )
+
+
+def main(args: argparse.Namespace):
+    # Encrypted message of a real ballot: two sealed-box layers around the
+    # padded choices.
+    message_size = len(
+        synthetic_ballots.generate_election(num_ballots=1)
+        .ballots[0]
+        .encrypted_choice.encrypted_message
+    )
+    built_sizes = sorted(size for size in args.sizes if size <= args.max_build)
+    if not built_sizes:
+        built_sizes = [args.max_build]
+
+    per_ballot = None
+    for num_ballots in built_sizes:
+        with concurrent.futures.ProcessPoolExecutor(
+            max_workers=1, mp_context=multiprocessing.get_context("spawn")
+        ) as executor:
+            list_bytes, store_bytes, elapsed = executor.submit(
+                _measure, num_ballots, message_size
+            ).result()
+        per_ballot = (list_bytes / num_ballots, store_bytes / num_ballots)
+        if num_ballots in args.sizes:
+            _report(
+                num_ballots,
+                list_bytes,
+                store_bytes,
+                f"  (store built at {num_ballots / elapsed:.0f} ballots/sec)",
+            )
+
+    list_per_ballot, store_per_ballot = per_ballot
+    for num_ballots in sorted(args.sizes):
+        if num_ballots > args.max_build:
+            _report(
+                num_ballots,
+                list_per_ballot * num_ballots,
+                store_per_ballot * num_ballots,
+                "  (extrapolated)",
+            )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument(
+        "--sizes", type=int, nargs="+", default=[100_000, 1_000_000, 10_000_000]
+    )
+    parser.add_argument(
+        "--max-build",
+        type=int,
+        default=1_000_000,
+        help="Largest number of ballots to actually build, larger sizes are "
+        "extrapolated",
+    )
+    main(parser.parse_args())
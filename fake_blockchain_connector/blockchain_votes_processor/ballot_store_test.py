@@ -0,0 +1,66 @@
+import dataclasses
+
+import pytest
+
+import ballot_store
+import blockchain_voting_client
+import finalize_voting
+import synthetic_ballots
+
+
+def _ballots() -> list[blockchain_voting_client.Ballot]:
+    ballots = synthetic_ballots.generate_election(
+        num_ballots=20, num_districts=3, max_choices=2
+    ).ballots
+    # Cover decrypted ballots, including ones decrypted to an empty choice.
+    ballots[3] = dataclasses.replace(
+        ballots[3],
+        status=blockchain_voting_client.BallotStatus.VALID,
+        decrypt_tx_hash_hex="ab" * 32,
+        decrypted_choices=[2, 1],
+    )
+    ballots[7] = dataclasses.replace(
+        ballots[7],
+        status=blockchain_voting_client.BallotStatus.INVALID,
+        decrypt_tx_hash_hex="cd" * 32,
+        decrypted_choices=[],
+    )
+    return ballots
+
+
+def test_ballots_round_trip():
+    ballots = _ballots()
+    store = ballot_store.BallotStore.from_ballots(ballots)
+
+    assert len(store) == len(ballots)
+    assert list(store) == ballots
+    assert store[7] == ballots[7]
+    with pytest.raises(IndexError):
+        store[len(ballots)]
+
+
+def test_raw_encrypted_choices_match_ballots():
+    ballots = _ballots()
+    store = ballot_store.BallotStore.from_ballots(ballots)
+
+    assert store.raw_encrypted_choices(5, 12) == [
+        finalize_voting.ballot_to_raw_encrypted_choice(ballot)
+        for ballot in ballots[5:12]
+    ]
+
+
+def test_columns():
+    ballots = _ballots()
+    store = ballot_store.BallotStore.from_ballots(ballots)
+
+    assert store.indices.tolist() == [ballot.index for ballot in ballots]
+    assert store.district_ids.tolist() == [ballot.district_id for ballot in ballots]
+    statuses = list(blockchain_voting_client.BallotStatus)
+    assert [statuses[code] for code in store.status_codes] == [
+        ballot.status for ballot in ballots
+    ]
+
+    columns = store.to_columns()
+    assert "encrypted_choice" not in columns
+    for name, column in columns.items():
+        assert list(column) == [getattr(ballot, name) for ballot in ballots]
@@ -1,16 +1,22 @@
 import asyncio
+import datetime
 import functools
+import json
 import logging
-from typing import Any, Self
+from typing import Any
 
 import aiohttp
 import aiohttp.web
 import nacl.public
 
 import config
+import decryption_jobs
 import blockchain_voting_client
+import finalization_checkpoint
 import finalize_voting
 import deanonimization
+import metrics
+import response_cache
 import telegram_api
 
 logger = logging.getLogger(__name__)
@@ -19,17 +25,46 @@ logger = logging.getLogger(__name__)
 routes = aiohttp.web.RouteTableDef()
 
 
+_blockchain_clients: dict[str, blockchain_voting_client.BlockchainVotingClient] = {}
+
+
 def _get_blockchain_client(
     voting_id: str,
 ) -> blockchain_voting_client.BlockchainVotingClient:
-    return blockchain_voting_client.BlockchainVotingClient(
-        voting_id=voting_id,
-        url=config.BLOCKCHAIN_API_HOSTNAME,
-        public_api_port=config.BLOCKCHAIN_API_PUBLIC_PORT,
-        private_api_port=config.BLOCKCHAIN_API_PRIVATE_PORT,
-        service_api_private_key_hex=config.BLOCKCHAIN_API_PRIVATE_KEY,
-        service_api_public_key_hex=config.BLOCKCHAIN_API_PUBLIC_KEY,
-    )
+    client = _blockchain_clients.get(voting_id)
+    if client is None:
+        client = blockchain_voting_client.BlockchainVotingClient(
+            voting_id=voting_id,
+            url=config.BLOCKCHAIN_API_HOSTNAME,
+            public_api_port=config.BLOCKCHAIN_API_PUBLIC_PORT,
+            private_api_port=config.BLOCKCHAIN_API_PRIVATE_PORT,
+            service_api_private_key_hex=config.BLOCKCHAIN_API_PRIVATE_KEY,
+            service_api_public_key_hex=config.BLOCKCHAIN_API_PUBLIC_KEY,
+            connection_limit_per_host=config.BLOCKCHAIN_API_CONNECTION_LIMIT_PER_HOST,
+            keepalive_timeout=datetime.timedelta(
+                seconds=config.BLOCKCHAIN_API_KEEPALIVE_TIMEOUT_SECONDS
+            ),
+            dns_cache_ttl=datetime.timedelta(
+                seconds=config.BLOCKCHAIN_API_DNS_CACHE_TTL_SECONDS
+            ),
+            backoff_time=datetime.timedelta(
+                seconds=config.BLOCKCHAIN_API_TX_BACKOFF_SECONDS
+            ),
+            max_backoff_time=datetime.timedelta(
+                seconds=config.BLOCKCHAIN_API_TX_MAX_BACKOFF_SECONDS
+            ),
+            tx_timeout=datetime.timedelta(
+                seconds=config.BLOCKCHAIN_API_TX_TIMEOUT_SECONDS
+            ),
+        )
+        _blockchain_clients[voting_id] = client
+    return client
+
+
+async def close_blockchain_clients(unused_app):
+    clients = list(_blockchain_clients.values())
+    _blockchain_clients.clear()
+    await asyncio.gather(*(client.close() for client in clients))
 
 
 @functools.cache
@@ -42,39 +77,39 @@ def _get_re_encryption_private_key() -> nacl.public.PrivateKey:
     return private_key
 
 
-class DecryptionHandler:
-    def __init__(self):
-        self._running_task = None
+_response_cache = response_cache.ResponseCache()
 
-    def is_running(self) -> bool:
-        if self._running_task is None:
-            return False
-        return not self._running_task.done()
 
-    def add_decryption(self, coro):
-        if self.is_running():
-            raise ValueError("Decryption is already running")
-        self._running_task = asyncio.create_task(coro)
+def _ttl_for_state(state: blockchain_voting_client.VotingState | None) -> float | None:
+    if state == blockchain_voting_client.VotingState.FINISHED:
+        # Nothing changes after the voting is finalized.
+        return None
+    return config.BLOCKCHAIN_SERVICE_RESPONSE_CACHE_TTL_SECONDS
 
-    @classmethod
-    def instance(cls) -> Self:
-        if not hasattr(cls, "_instance"):
-            cls._instance = cls()
-        return cls._instance
 
+def _cached_voting_state(voting_id: str) -> blockchain_voting_client.VotingState | None:
+    cached = _response_cache.peek((voting_id, "voting_state"))
+    if cached is None:
+        return None
+    return blockchain_voting_client.VotingState(cached["state"])
 
-@routes.get("/blockchain_service/voting_state")
-async def voting_state(request: aiohttp.web.Request) -> aiohttp.web.Response:
-    client = _get_blockchain_client(request.query["voting_id"])
+
+async def _cached(voting_id: str, endpoint: str, load) -> Any:
+    return await _response_cache.get(
+        (voting_id, endpoint),
+        load,
+        lambda unused_value: _ttl_for_state(_cached_voting_state(voting_id)),
+    )
+
+
+async def _load_voting_state(
+    client: blockchain_voting_client.BlockchainVotingClient,
+) -> dict[str, Any]:
     voting_state, crypto_system_settings = await asyncio.gather(
         client.voting_state(), client.crypto_system_settings()
     )
 
-    decryption_running = DecryptionHandler.instance().is_running()
-    response_json: dict[str, Any] = {
-        "state": voting_state.value,
-        "decryption_running": decryption_running,
-    }
+    response_json: dict[str, Any] = {"state": voting_state.value}
     response_json.update(crypto_system_settings.to_json())
     match voting_state:
         case blockchain_voting_client.VotingState.REGISTRATION:
@@ -98,21 +133,52 @@ async def voting_state(request: aiohttp.web.Request) -> aiohttp.web.Response:
                 await client.decryption_statistics()
             ).to_json()
             response_json["voting_results"] = (await client.voting_results()).to_json()
+    return response_json
+
 
+@routes.get("/blockchain_service/voting_state")
+async def voting_state(request: aiohttp.web.Request) -> aiohttp.web.Response:
+    voting_id = request.query["voting_id"]
+    client = _get_blockchain_client(voting_id)
+    blockchain_state = await _response_cache.get(
+        (voting_id, "voting_state"),
+        functools.partial(_load_voting_state, client),
+        lambda state_json: _ttl_for_state(
+            blockchain_voting_client.VotingState(state_json["state"])
+        ),
+    )
+
+    # Job progress is local and live, so it is never cached.
+    decryption_job = decryption_jobs.DecryptionJobManager.instance().latest(voting_id)
+    response_json: dict[str, Any] = {
+        **blockchain_state,
+        "decryption_running": (
+            decryption_job is not None and decryption_job.is_running()
+        ),
+        "decryption_job": (
+            None if decryption_job is None else decryption_job.to_json()
+        ),
+    }
     return aiohttp.web.json_response(response_json)
 
 
 @routes.get("/blockchain_service/stored_ballots_amount")
 async def stored_ballots_amount(request: aiohttp.web.Request) -> aiohttp.web.Response:
-    client = _get_blockchain_client(request.query["voting_id"])
-    stored_ballots_amount = await client.stored_ballots_amount()
+    voting_id = request.query["voting_id"]
+    client = _get_blockchain_client(voting_id)
+    stored_ballots_amount = await _cached(
+        voting_id, "stored_ballots_amount", client.stored_ballots_amount
+    )
     return aiohttp.web.json_response({"stored_ballots_amount": stored_ballots_amount})
 
 
 @routes.get("/blockchain_service/crypto_system_settings")
 async def crypto_system_settings(request: aiohttp.web.Request) -> aiohttp.web.Response:
-    client = _get_blockchain_client(request.query["voting_id"])
-    crypto_system_settings = await client.crypto_system_settings()
+    voting_id = request.query["voting_id"]
+    client = _get_blockchain_client(voting_id)
+    crypto_system_settings = await _cached(
+        voting_id, "crypto_system_settings", client.crypto_system_settings
+    )
     return aiohttp.web.json_response(crypto_system_settings.to_json())
 
 
@@ -120,18 +186,51 @@ async def crypto_system_settings(request: aiohttp.web.Request) -> aiohttp.web.Re
 async def stop_voting(request: aiohttp.web.Request) -> aiohttp.web.Response:
     client = _get_blockchain_client(request.query["voting_id"])
     stop_voting_tx_hash = await client.stop_voting()
+    _response_cache.invalidate(request.query["voting_id"])
     return aiohttp.web.json_response({"status": "ok", "tx_hash": stop_voting_tx_hash})
 
 
+async def _run_decryption(
+    voting_id: str,
+    client: blockchain_voting_client.BlockchainVotingClient,
+    voting_private_key: nacl.public.PrivateKey,
+    counters: finalize_voting.PipelineCounters,
+) -> list[str]:
+    checkpoint = finalization_checkpoint.FinalizationCheckpoint(
+        config.BLOCKCHAIN_SERVICE_CHECKPOINT_PATH, voting_id
+    )
+    try:
+        return await finalize_voting.finalize_voting(
+            voting_client=client,
+            first_layer_private_key=voting_private_key,
+            re_encryption_private_key=_get_re_encryption_private_key(),
+            decrypt_workers=config.BLOCKCHAIN_SERVICE_DECRYPT_WORKERS,
+            decrypt_chunk_size=config.BLOCKCHAIN_SERVICE_DECRYPT_CHUNK_SIZE,
+            fetch_batch_size=config.BLOCKCHAIN_SERVICE_FETCH_BATCH_SIZE,
+            fetch_max_in_flight=config.BLOCKCHAIN_SERVICE_FETCH_MAX_IN_FLIGHT,
+            decrypt_queue_size=config.BLOCKCHAIN_SERVICE_DECRYPT_QUEUE_SIZE,
+            publish_queue_size=config.BLOCKCHAIN_SERVICE_PUBLISH_QUEUE_SIZE,
+            publish_concurrency=config.BLOCKCHAIN_SERVICE_PUBLISH_CONCURRENCY,
+            progress_log_interval=config.BLOCKCHAIN_SERVICE_PROGRESS_LOG_INTERVAL_SECONDS,
+            checkpoint=checkpoint,
+            counters=counters,
+        )
+    finally:
+        checkpoint.close()
+        _response_cache.invalidate(voting_id)
+
+
 @routes.post("/blockchain_service/start_decryption")
 async def start_decryption(request: aiohttp.web.Request) -> aiohttp.web.Response:
     try:
-        if DecryptionHandler.instance().is_running():
-            raise ValueError("Decryption is already running")
-
         request_json = await request.json()
+        voting_id = request_json["voting_id"]
 
-        client = _get_blockchain_client(request_json["voting_id"])
+        job_manager = decryption_jobs.DecryptionJobManager.instance()
+        if job_manager.is_running(voting_id):
+            raise ValueError("Decryption is already running")
+
+        client = _get_blockchain_client(voting_id)
 
         current_voting_state = await client.voting_state()
         if current_voting_state != blockchain_voting_client.VotingState.STOPPED:
@@ -145,24 +244,64 @@ async def start_decryption(request: aiohttp.web.Request) -> aiohttp.web.Response
 
         await client.verify_private_key(voting_private_key)
 
-        re_encryption_private_key = _get_re_encryption_private_key()
+        # Fail fast on a missing key instead of inside the job.
+        _get_re_encryption_private_key()
 
-        # DecryptionHandler.instance().add_decryption(
-        await finalize_voting.finalize_voting(
-            voting_client=client,
-            first_layer_private_key=voting_private_key,
-            re_encryption_private_key=re_encryption_private_key,
-            decrypt_workers=config.BLOCKCHAIN_SERVICE_DECRYPT_WORKERS,
-        )  # ,
-        # )
-
-        return aiohttp.web.json_response({"status": "ok"})
+        job = job_manager.start(
+            voting_id,
+            functools.partial(_run_decryption, voting_id, client, voting_private_key),
+        )
+        return aiohttp.web.json_response({"status": "ok", "job": job.to_json()})
     except ValueError as e:
         return aiohttp.web.json_response(
             {"status": "error", "message": str(e)}, status=400
         )
 
 
+def _find_decryption_job(params: dict[str, Any]) -> decryption_jobs.DecryptionJob:
+    if "job_id" not in params and "voting_id" not in params:
+        raise aiohttp.web.HTTPBadRequest(
+            text=json.dumps(
+                {"status": "error", "message": "Either job_id or voting_id is required"}
+            ),
+            content_type="application/json",
+        )
+    job_manager = decryption_jobs.DecryptionJobManager.instance()
+    if "job_id" in params:
+        return job_manager.get(params["job_id"])
+    job = job_manager.latest(params["voting_id"])
+    if job is None:
+        raise ValueError(f"No decryption job for {params['voting_id']}")
+    return job
+
+
+@routes.get("/blockchain_service/decryption_job")
+async def decryption_job(request: aiohttp.web.Request) -> aiohttp.web.Response:
+    try:
+        job = _find_decryption_job(request.query)
+        return aiohttp.web.json_response(job.to_json())
+    except ValueError as e:
+        return aiohttp.web.json_response(
+            {"status": "error", "message": str(e)}, status=404
+        )
+
+
+@routes.post("/blockchain_service/cancel_decryption")
+async def cancel_decryption(request: aiohttp.web.Request) -> aiohttp.web.Response:
+    try:
+        job = _find_decryption_job(await request.json())
+        job = await decryption_jobs.DecryptionJobManager.instance().cancel(job.job_id)
+        return aiohttp.web.json_response({"status": "ok", "job": job.to_json()})
+    except ValueError as e:
+        return aiohttp.web.json_response(
+            {"status": "error", "message": str(e)}, status=404
+        )
+
+
+async def cancel_decryption_jobs(unused_app):
+    await decryption_jobs.DecryptionJobManager.instance().close()
+
+
 @routes.post("/blockchain_service/run_deanonimization")
 async def run_deanonimization(request: aiohttp.web.Request) -> aiohttp.web.Response:
     try:
@@ -214,6 +353,10 @@ async def run_deanonimization(request: aiohttp.web.Request) -> aiohttp.web.Respo
 
 app = aiohttp.web.Application()
 app.add_routes(routes)
+metrics.setup(app)
+
+app.on_cleanup.append(cancel_decryption_jobs)
+app.on_cleanup.append(close_blockchain_clients)
 
 if __name__ == "__main__":
     logging.basicConfig(level=logging.DEBUG)
@@ -0,0 +1,34 @@
+import asyncio
+
+import aiohttp
+
+import blockchain_service
+import stand_in_services
+
+
+async def _query_decryption_jobs() -> list[tuple[int, dict]]:
+    responses = []
+    async with stand_in_services.serve(blockchain_service.app) as base_url:
+        async with aiohttp.ClientSession() as session:
+            for method, path, kwargs in [
+                ("GET", "/blockchain_service/decryption_job", {}),
+                ("POST", "/blockchain_service/cancel_decryption", {"json": {}}),
+                (
+                    "GET",
+                    "/blockchain_service/decryption_job",
+                    {"params": {"voting_id": "unknown"}},
+                ),
+            ]:
+                async with session.request(method, base_url + path, **kwargs) as r:
+                    responses.append((r.status, await r.json()))
+    return responses
+
+
+def test_decryption_job_lookup_needs_job_or_voting_id():
+    missing_get, missing_post, unknown = asyncio.run(_query_decryption_jobs())
+    assert missing_get[0] == missing_post[0] == 400
+    assert missing_get[1]["message"] == "Either job_id or voting_id is required"
+    assert unknown == (
+        404,
+        {"status": "error", "message": "No decryption job for unknown"},
+    )
@@ -1,11 +1,16 @@
 import aiohttp
+import array
 import asyncio
+import collections
+from collections.abc import AsyncIterator, Iterator
 import dataclasses
 import datetime
 import enum
+import logging
 import os
 import random
 import sys
+import time
 from typing import Any, Self
 
 import exonum_client
@@ -18,9 +23,13 @@ sys.path.append(os.path.join(os.path.dirname(__file__), "exonum_modules", "main"
 
 from exonum_modules.main import schema_pb2, transactions_pb2, custom_types_pb2
 
+logger = logging.getLogger(__name__)
 
 _VOTING_API_PREFIX = "/services/votings_service/v1/"
 
+# Not wired in the upstream votings-service; used when a node exposes it.
+_BALLOTS_BY_INDEX_RANGE_ENDPOINT = "ballots-by-index-range"
+
 
 _VOTING_SERVICE_INSTANCE_ID = 1001
 
@@ -107,6 +116,31 @@ class Ballot:
         )
 
 
+def _is_transient_error(exc: BaseException) -> bool:
+    if isinstance(exc, aiohttp.ClientResponseError):
+        return exc.status >= 500 or exc.status == 429
+    return isinstance(exc, (aiohttp.ClientError, asyncio.TimeoutError))
+
+
+def _percentile(sorted_values: list[float], q: float) -> float | None:
+    if not sorted_values:
+        return None
+    return sorted_values[min(len(sorted_values) - 1, int(q * len(sorted_values)))]
+
+
+@dataclasses.dataclass(frozen=True)
+class TxWaitStats:
+    waits: int
+    polls: int
+    timeouts: int
+    latency_p50: float | None
+    latency_p90: float | None
+    latency_p99: float | None
+
+    def to_json(self) -> dict[str, Any]:
+        return dataclasses.asdict(self)
+
+
 class VotingState(enum.Enum):
     REGISTRATION = "Registration"
     IN_PROCESS = "InProcess"
@@ -114,6 +148,16 @@ class VotingState(enum.Enum):
     FINISHED = "Finished"
 
 
+# Voting data that never changes once it is cached, shared by all clients of a
+# voting on the same node. The ballots config can change only during the
+# registration, the crypto system settings change only once, when the
+# decryption key is published. Keyed by the node API prefix and the voting id.
+_voting_cache: dict[tuple[str, str], dict[str, Any]] = collections.defaultdict(dict)
+# Voting states only move forward, so a voting seen past the registration
+# stays there.
+_last_seen_voting_states: dict[tuple[str, str], VotingState] = {}
+
+
 @dataclasses.dataclass(frozen=True)
 class DecryptionStatistics:
     decrypted_ballots_amount: int
@@ -199,7 +243,13 @@ class BlockchainVotingClient:
         service_api_private_key_hex: str,
         service_api_public_key_hex: str,
         backoff_time: datetime.timedelta = datetime.timedelta(seconds=0.05),
+        max_backoff_time: datetime.timedelta = datetime.timedelta(seconds=2),
+        tx_timeout: datetime.timedelta | None = None,
         ssl: bool = False,
+        connection_limit_per_host: int = 100,
+        keepalive_timeout: datetime.timedelta = datetime.timedelta(seconds=30),
+        dns_cache_ttl: datetime.timedelta = datetime.timedelta(minutes=5),
+        session: aiohttp.ClientSession | None = None,
     ):
         self._exonum_client = exonum_client.ExonumClient(
             hostname=url,
@@ -217,6 +267,48 @@ class BlockchainVotingClient:
             ),
         )
         self._backoff_time = backoff_time
+        self._max_backoff_time = max_backoff_time
+        self._tx_timeout = tx_timeout
+
+        self._tx_waits = 0
+        self._tx_polls = 0
+        self._tx_timeouts = 0
+        self._tx_latencies = array.array("d")
+
+        self._connection_limit_per_host = connection_limit_per_host
+        self._keepalive_timeout = keepalive_timeout
+        self._dns_cache_ttl = dns_cache_ttl
+        # A session passed from outside is shared with other clients and is
+        # closed by its owner, not by this client.
+        self._session = session
+        self._owns_session = session is None
+        # None until the first range request tells us whether the node has it.
+        self._ballots_range_supported: bool | None = None
+
+    def _get_session(self) -> aiohttp.ClientSession:
+        if self._session is None or self._session.closed:
+            connector = aiohttp.TCPConnector(
+                limit=0,
+                limit_per_host=self._connection_limit_per_host,
+                keepalive_timeout=self._keepalive_timeout.total_seconds(),
+                use_dns_cache=True,
+                ttl_dns_cache=int(self._dns_cache_ttl.total_seconds()),
+            )
+            self._session = aiohttp.ClientSession(connector=connector)
+            self._owns_session = True
+        return self._session
+
+    async def close(self):
+        if self._owns_session and self._session is not None:
+            await self._session.close()
+        self._session = None
+
+    async def __aenter__(self) -> Self:
+        self._get_session()
+        return self
+
+    async def __aexit__(self, *unused_exc_info):
+        await self.close()
 
     async def _api_get(self, url_suffix: str, request_params: dict[str, Any]) -> Any:
         url_to_request = (
@@ -224,32 +316,87 @@ class BlockchainVotingClient:
             + _VOTING_API_PREFIX
             + url_suffix
         )
-        async with aiohttp.ClientSession() as session:
-            async with session.get(url_to_request, params=request_params) as response:
-                response.raise_for_status()
-                return await response.json()
+        session = self._get_session()
+        async with session.get(url_to_request, params=request_params) as response:
+            response.raise_for_status()
+            return await response.json()
 
-    async def _wait_for_tx(self, tx_hash: str):
+    async def _is_tx_committed(self, tx_hash: str) -> bool:
+        """Returns whether the tx is committed, raises if it failed."""
         tx_check_url = (
             self._exonum_client.public_api.endpoint_prefix + "/explorer/v1/transactions"
         )
-        async with aiohttp.ClientSession() as session:
-            while True:
-                async with session.get(
-                    tx_check_url, params={"hash": tx_hash}
-                ) as response:
-                    if response.status == 404:
-                        await asyncio.sleep(self._backoff_time.total_seconds())
-                        continue
-                    response.raise_for_status()
-                    response_json = await response.json()
-                    if response_json["type"] == "committed":
-                        if response_json["status"]["type"] != "success":
-                            raise ValueError(
-                                f"Got exception from blockchain: {response_json}"
-                            )
-                        break
-                    await asyncio.sleep(self._backoff_time.total_seconds())
+        session = self._get_session()
+        async with session.get(tx_check_url, params={"hash": tx_hash}) as response:
+            if response.status == 404:
+                return False
+            response.raise_for_status()
+            response_json = await response.json()
+        if response_json["type"] != "committed":
+            return False
+        if response_json["status"]["type"] != "success":
+            raise ValueError(f"Got exception from blockchain: {response_json}")
+        return True
+
+    async def _latest_block_height(self) -> int:
+        blocks_url = (
+            self._exonum_client.public_api.endpoint_prefix + "/explorer/v1/blocks"
+        )
+        session = self._get_session()
+        async with session.get(blocks_url, params={"count": 1}) as response:
+            response.raise_for_status()
+            response_json = await response.json()
+        return response_json["range"]["end"]
+
+    def _backoff_delays(self) -> Iterator[float]:
+        """Exponential backoff with equal jitter, capped at max_backoff_time."""
+        delay = self._backoff_time.total_seconds()
+        max_delay = self._max_backoff_time.total_seconds()
+        while True:
+            yield delay / 2 + random.uniform(0, delay / 2)
+            delay = min(delay * 2, max_delay)
+
+    async def _wait_for_tx(
+        self, tx_hash: str, timeout: datetime.timedelta | None = None
+    ):
+        if timeout is None:
+            timeout = self._tx_timeout
+        started_at = time.monotonic()
+        self._tx_waits += 1
+        deadline = asyncio.timeout(None if timeout is None else timeout.total_seconds())
+        try:
+            async with deadline:
+                for delay in self._backoff_delays():
+                    self._tx_polls += 1
+                    try:
+                        if await self._is_tx_committed(tx_hash):
+                            break
+                    except Exception as e:
+                        # HTTP timeouts are TimeoutErrors too, they are retried
+                        # like the other transient errors until the deadline.
+                        if not _is_transient_error(e):
+                            raise
+                        logger.warning(f"Failed to check tx {tx_hash}: {e!r}")
+                    await asyncio.sleep(delay)
+        except TimeoutError as e:
+            if not deadline.expired():
+                raise
+            self._tx_timeouts += 1
+            raise TimeoutError(
+                f"Transaction {tx_hash} is not committed after {timeout}"
+            ) from e
+        self._tx_latencies.append(time.monotonic() - started_at)
+
+    def tx_wait_stats(self) -> TxWaitStats:
+        latencies = sorted(self._tx_latencies)
+        return TxWaitStats(
+            waits=self._tx_waits,
+            polls=self._tx_polls,
+            timeouts=self._tx_timeouts,
+            latency_p50=_percentile(latencies, 0.5),
+            latency_p90=_percentile(latencies, 0.9),
+            latency_p99=_percentile(latencies, 0.99),
+        )
 
     async def _send_transaction(
         self, tx: exonum_client.ExonumMessage, wait: bool = True
@@ -257,20 +404,40 @@ class BlockchainVotingClient:
         tx_send_url = (
             self._exonum_client.public_api.endpoint_prefix + "/explorer/v1/transactions"
         )
-        async with aiohttp.ClientSession() as session:
-            async with session.post(
-                tx_send_url,
-                headers={"content-type": "application/json"},
-                data=tx.pack_into_json(),
-            ) as response:
-                response.raise_for_status()
-                response_json = await response.json()
-                tx_hash = response_json["tx_hash"]
-                if wait:
-                    await self._wait_for_tx(tx_hash)
-                return tx_hash
+        session = self._get_session()
+        async with session.post(
+            tx_send_url,
+            headers={"content-type": "application/json"},
+            data=tx.pack_into_json(),
+        ) as response:
+            response.raise_for_status()
+            response_json = await response.json()
+            tx_hash = response_json["tx_hash"]
+        if wait:
+            await self._wait_for_tx(tx_hash)
+        return tx_hash
+
+    def _voting_cache_key(self) -> tuple[str, str]:
+        return (self._exonum_client.public_api.endpoint_prefix, self._voting_id)
+
+    async def _is_registration_over(self) -> bool:
+        state = _last_seen_voting_states.get(self._voting_cache_key())
+        if state is None or state == VotingState.REGISTRATION:
+            state = await self.voting_state()
+        return state != VotingState.REGISTRATION
 
     async def crypto_system_settings(self) -> CryptoSystemSettings:
+        cache = _voting_cache[self._voting_cache_key()]
+        if "crypto_system_settings" in cache:
+            return cache["crypto_system_settings"]
+        crypto_system_settings = await self._fetch_crypto_system_settings()
+        # Without the private key the settings are not final yet, the key may
+        # be published at any moment, also by another process.
+        if crypto_system_settings.private_key is not None:
+            cache["crypto_system_settings"] = crypto_system_settings
+        return crypto_system_settings
+
+    async def _fetch_crypto_system_settings(self) -> CryptoSystemSettings:
         result = await self._api_get(
             "crypto-system-settings",
             {
@@ -296,6 +463,18 @@ class BlockchainVotingClient:
         )
 
     async def ballots_config(self) -> list[schema_pb2.BallotConfig]:
+        cache = _voting_cache[self._voting_cache_key()]
+        if "ballots_config" in cache:
+            return list(cache["ballots_config"])
+        # Checked before fetching, so that a config read during the
+        # registration is never cached.
+        is_registration_over = await self._is_registration_over()
+        ballots_config = await self._fetch_ballots_config()
+        if is_registration_over:
+            cache["ballots_config"] = ballots_config
+        return list(ballots_config)
+
+    async def _fetch_ballots_config(self) -> list[schema_pb2.BallotConfig]:
         json_response = await self._api_get(
             "ballots-config",
             {
@@ -304,11 +483,9 @@ class BlockchainVotingClient:
         )
         result = []
         for encoded_config in json_response:
-            encoded_config_bytes = b"".join(
-                val.to_bytes(1, "big") for val in encoded_config
-            )
             result_pb = schema_pb2.BallotConfig()
-            result_pb.ParseFromString(encoded_config_bytes)
+            # The config comes as a JSON list of byte values.
+            result_pb.ParseFromString(bytes(encoded_config))
             result.append(result_pb)
         return result
 
@@ -322,6 +499,7 @@ class BlockchainVotingClient:
         state_str = result["state"]
         for state in VotingState:
             if state.value == state_str:
+                _last_seen_voting_states[self._voting_cache_key()] = state
                 return state
         raise ValueError(f"Unknown voting state: {state_str}")
 
@@ -344,6 +522,97 @@ class BlockchainVotingClient:
         )
         return Ballot.from_json(result)
 
+    async def _ballots_by_index_range(self, start: int, stop: int) -> list[Ballot]:
+        if self._ballots_range_supported is not False:
+            try:
+                result = await self._api_get(
+                    _BALLOTS_BY_INDEX_RANGE_ENDPOINT,
+                    {
+                        "voting_id": self._voting_id,
+                        "from_index": start,
+                        "to_index": stop,
+                    },
+                )
+                self._ballots_range_supported = True
+                return [Ballot.from_json(ballot_json) for ballot_json in result]
+            except aiohttp.ClientResponseError as e:
+                if e.status != 404 or self._ballots_range_supported:
+                    raise
+                logger.info(
+                    f"Node has no {_BALLOTS_BY_INDEX_RANGE_ENDPOINT} endpoint, "
+                    "fetching ballots one by one"
+                )
+                self._ballots_range_supported = False
+
+        return list(
+            await asyncio.gather(
+                *(self.ballot_by_index(ballot_i) for ballot_i in range(start, stop))
+            )
+        )
+
+    async def _ballots_batch_with_retries(
+        self, start: int, stop: int, max_retries: int
+    ) -> list[Ballot]:
+        attempt = 0
+        while True:
+            try:
+                return await self._ballots_by_index_range(start, stop)
+            except Exception as e:
+                if attempt >= max_retries or not _is_transient_error(e):
+                    raise
+                attempt += 1
+                logger.warning(
+                    f"Failed to fetch ballots [{start}, {stop}), "
+                    f"retry {attempt}/{max_retries}: {e!r}"
+                )
+                await asyncio.sleep(
+                    self._backoff_time.total_seconds() * 2 ** (attempt - 1)
+                )
+
+    async def iter_ballots(
+        self,
+        start: int = 0,
+        stop: int | None = None,
+        batch_size: int = 100,
+        max_in_flight: int = 8,
+        max_retries: int = 3,
+    ) -> AsyncIterator[Ballot]:
+        """Yields ballots with indices in [start, stop) in index order.
+
+        At most `max_in_flight` batches of `batch_size` ballots are fetched
+        concurrently. Every batch is retried up to `max_retries` times on
+        transient errors. When `stop` is None, all stored ballots are fetched.
+        """
+        if batch_size <= 0 or max_in_flight <= 0:
+            raise ValueError(
+                f"Got invalid batch_size {batch_size} or max_in_flight {max_in_flight}"
+            )
+        if stop is None:
+            stop = await self.stored_ballots_amount()
+
+        pending_batches: collections.deque[asyncio.Task[list[Ballot]]] = (
+            collections.deque()
+        )
+        try:
+            for batch_start in range(start, stop, batch_size):
+                batch_stop = min(batch_start + batch_size, stop)
+                pending_batches.append(
+                    asyncio.create_task(
+                        self._ballots_batch_with_retries(
+                            batch_start, batch_stop, max_retries
+                        )
+                    )
+                )
+                if len(pending_batches) >= max_in_flight:
+                    for ballot in await pending_batches.popleft():
+                        yield ballot
+            while pending_batches:
+                for ballot in await pending_batches.popleft():
+                    yield ballot
+        finally:
+            for batch_task in pending_batches:
+                batch_task.cancel()
+
     async def decryption_statistics(self) -> DecryptionStatistics:
         result = await self._api_get(
             "decryption-statistics",
@@ -430,6 +699,7 @@ class BlockchainVotingClient:
         ballot_index: int,
         decrypted_choices: list[int] | None,
         is_invalid: bool,
+        submitter: "TransactionSubmitter | None" = None,
     ) -> str:
         tx_publish_decryption_result = transactions_pb2.TxPublishDecryptedBallot(
             voting_id=self._voting_id,
@@ -441,6 +711,8 @@ class BlockchainVotingClient:
             tx_publish_decryption_result,
             _PUBLISH_DECRYPTION_RESULT_MESSAGE_ID,
         )
+        if submitter is not None:
+            return await submitter.submit(exonum_message)
         return await self._send_transaction(exonum_message, wait=True)
 
     async def finalize_voting(self):
@@ -472,3 +744,191 @@ class BlockchainVotingClient:
             tx_finalize_voting, _FINALIZE_VOTING_MESSAGE_ID
         )
         return await self._send_transaction(exonum_message, wait=True)
+
+
+@dataclasses.dataclass(frozen=True)
+class SubmitterStats:
+    submitted: int
+    committed: int
+    failed: int
+    in_flight: int
+    latency_p50: float | None
+    latency_p90: float | None
+    latency_p99: float | None
+
+    def to_json(self) -> dict[str, Any]:
+        return dataclasses.asdict(self)
+
+
+class TransactionSubmitter:
+    """Submits transactions with a bounded in-flight window.
+
+    Instead of one polling loop per transaction, a single tracker checks all
+    the pending hashes at once, and only after a new block is committed.
+    """
+
+    def __init__(
+        self,
+        client: BlockchainVotingClient,
+        *,
+        max_in_flight: int = 256,
+        poll_interval: datetime.timedelta = datetime.timedelta(seconds=0.05),
+        lookup_concurrency: int = 32,
+        tx_timeout: datetime.timedelta | None = None,
+    ):
+        self._client = client
+        self._tx_timeout = client._tx_timeout if tx_timeout is None else tx_timeout
+        self._window = asyncio.Semaphore(max_in_flight)
+        self._poll_interval = poll_interval
+        self._lookup_concurrency = lookup_concurrency
+
+        self._pending: dict[str, asyncio.Future[None]] = {}
+        self._submitted_at: dict[str, float] = {}
+        self._unchecked: set[str] = set()
+        self._new_pending = asyncio.Event()
+        self._tracker: asyncio.Task | None = None
+
+        self._submitted = 0
+        self._committed = 0
+        self._failed = 0
+        self._latencies = array.array("d")
+
+    async def __aenter__(self) -> Self:
+        self._tracker = asyncio.create_task(self._track_commits())
+        return self
+
+    async def __aexit__(self, *unused_exc_info):
+        await self.close()
+
+    async def close(self):
+        if self._tracker is not None:
+            self._tracker.cancel()
+            try:
+                await self._tracker
+            except asyncio.CancelledError:
+                pass
+            self._tracker = None
+        for future in self._pending.values():
+            if not future.done():
+                future.cancel()
+        self._pending.clear()
+        self._submitted_at.clear()
+        self._unchecked.clear()
+
+    async def submit(self, tx: exonum_client.ExonumMessage) -> str:
+        """Sends the tx and returns its hash once it's committed."""
+        if self._tracker is None or self._tracker.done():
+            raise ValueError("TransactionSubmitter is not running")
+        async with self._window:
+            tx_hash = await self._client._send_transaction(tx, wait=False)
+            self._submitted += 1
+            future = asyncio.get_running_loop().create_future()
+            self._pending[tx_hash] = future
+            self._submitted_at[tx_hash] = time.monotonic()
+            self._unchecked.add(tx_hash)
+            self._new_pending.set()
+            await future
+            return tx_hash
+
+    def stats(self) -> SubmitterStats:
+        latencies = sorted(self._latencies)
+        return SubmitterStats(
+            submitted=self._submitted,
+            committed=self._committed,
+            failed=self._failed,
+            in_flight=len(self._pending),
+            latency_p50=_percentile(latencies, 0.5),
+            latency_p90=_percentile(latencies, 0.9),
+            latency_p99=_percentile(latencies, 0.99),
+        )
+
+    def _resolve(self, tx_hash: str, error: BaseException | None):
+        future = self._pending.pop(tx_hash)
+        submitted_at = self._submitted_at.pop(tx_hash)
+        if future.done():
+            # The submitter was cancelled while waiting for the commit.
+            return
+        if error is None:
+            self._committed += 1
+            self._latencies.append(time.monotonic() - submitted_at)
+            future.set_result(None)
+        else:
+            self._failed += 1
+            future.set_exception(error)
+
+    def _expire_timed_out(self):
+        if self._tx_timeout is None:
+            return
+        deadline = time.monotonic() - self._tx_timeout.total_seconds()
+        # Pending transactions are kept in the submission order.
+        for tx_hash, submitted_at in list(self._submitted_at.items()):
+            if submitted_at >= deadline:
+                break
+            self._resolve(
+                tx_hash,
+                TimeoutError(
+                    f"Transaction {tx_hash} is not committed after {self._tx_timeout}"
+                ),
+            )
+
+    async def _check_pending(self, tx_hashes: list[str]):
+        semaphore = asyncio.Semaphore(self._lookup_concurrency)
+
+        async def _check(tx_hash: str):
+            async with semaphore:
+                try:
+                    if await self._client._is_tx_committed(tx_hash):
+                        self._resolve(tx_hash, None)
+                except ValueError as e:
+                    self._resolve(tx_hash, e)
+
+        await asyncio.gather(
+            *(_check(tx_hash) for tx_hash in tx_hashes if tx_hash in self._pending)
+        )
+
+    async def _track_commits(self):
+        try:
+            await self._track_commits_loop()
+        except Exception as e:
+            logger.error(f"Transaction tracker failed: {e!r}")
+            for tx_hash in list(self._pending):
+                self._resolve(tx_hash, e)
+            raise
+
+    async def _track_commits_loop(self):
+        last_height = None
+        follow_blocks = True
+        while True:
+            if not self._pending:
+                self._new_pending.clear()
+                await self._new_pending.wait()
+
+            self._expire_timed_out()
+
+            # A tx can only get committed with a new block, so while the height
+            # stays the same only the newly submitted hashes are checked.
+            tx_hashes_to_check = list(self._pending)
+            # Taken before fetching the height: hashes submitted meanwhile stay
+            # unchecked until the next round.
+            unchecked, self._unchecked = list(self._unchecked), set()
+            if follow_blocks:
+                try:
+                    height = await self._client._latest_block_height()
+                except (aiohttp.ClientResponseError, KeyError) as e:
+                    logger.warning(
+                        f"Cannot follow blocks, checking every pending tx instead: {e!r}"
+                    )
+                    follow_blocks = False
+                else:
+                    if height == last_height:
+                        tx_hashes_to_check = unchecked
+                    last_height = height
+
+            try:
+                await self._check_pending(tx_hashes_to_check)
+            except Exception as e:
+                if not _is_transient_error(e):
+                    raise
+                logger.warning(f"Failed to check pending transactions: {e!r}")
+                self._unchecked.update(tx_hashes_to_check)
+            await asyncio.sleep(self._poll_interval.total_seconds())
@@ -0,0 +1,103 @@
+"""Compares requests/sec of a fresh session per request and the pooled client.
+
+Runs the votings service simulator and issues the same `stored_ballots_amount`
+requests through both approaches.
+
+Usage: python blockchain_voting_client_benchmark.py --requests 5000
+"""
+
+import argparse
+import asyncio
+import time
+import urllib.parse
+from typing import Any
+
+import aiohttp
+
+import blockchain_voting_client
+import stand_in_services
+import synthetic_ballots
+import votings_service_simulator
+
+_STUB_SERVICE_KEY_HEX = "00" * 64
+_STUB_SERVICE_PUBLIC_KEY_HEX = "00" * 32
+
+
+class _FreshSessionClient(blockchain_voting_client.BlockchainVotingClient):
+    """Reproduces the old behaviour: one ClientSession per API call."""
+
+    async def _api_get(self, url_suffix: str, request_params: dict[str, Any]) -> Any:
+        url_to_request = (
+            self._exonum_client.public_api.endpoint_prefix
+            + blockchain_voting_client._VOTING_API_PREFIX
+            + url_suffix
+        )
+        async with aiohttp.ClientSession() as session:
+            async with session.get(url_to_request, params=request_params) as response:
+                response.raise_for_status()
+                return await response.json()
+
+
+def _make_client(
+    client_cls: type[blockchain_voting_client.BlockchainVotingClient],
+    base_url: str,
+    connection_limit_per_host: int,
+) -> blockchain_voting_client.BlockchainVotingClient:
+    url = urllib.parse.urlsplit(base_url)
+    return client_cls(
+        voting_id="benchmark",
+        url=url.hostname,
+        public_api_port=url.port,
+        private_api_port=url.port,
+        service_api_private_key_hex=_STUB_SERVICE_KEY_HEX,
+        service_api_public_key_hex=_STUB_SERVICE_PUBLIC_KEY_HEX,
+        connection_limit_per_host=connection_limit_per_host,
+    )
+
+
+async def _run_requests(
+    client: blockchain_voting_client.BlockchainVotingClient,
+    num_requests: int,
+    concurrency: int,
+) -> float:
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def _single_request():
+        async with semaphore:
+            await client.stored_ballots_amount()
+
+    start = time.perf_counter()
+    await asyncio.gather(*(_single_request() for _ in range(num_requests)))
+    return num_requests / (time.perf_counter() - start)
+
+
+async def main(args: argparse.Namespace):
+    simulator = votings_service_simulator.VotingsServiceSimulator(
+        synthetic_ballots.generate_election(num_ballots=1), voting_id="benchmark"
+    )
+    async with stand_in_services.serve(simulator.app) as base_url:
+        fresh_client = _make_client(
+            _FreshSessionClient, base_url, args.connection_limit_per_host
+        )
+        fresh_rps = await _run_requests(fresh_client, args.requests, args.concurrency)
+
+        async with _make_client(
+            blockchain_voting_client.BlockchainVotingClient,
+            base_url,
+            args.connection_limit_per_host,
+        ) as pooled_client:
+            pooled_rps = await _run_requests(
+                pooled_client, args.requests, args.concurrency
+            )
+
+    print(f"Fresh session per request: {fresh_rps:.1f} requests/sec")
+    print(f"Pooled session:            {pooled_rps:.1f} requests/sec")
+    print(f"Speedup:                   {pooled_rps / fresh_rps:.2f}x")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--requests", type=int, default=2000)
+    parser.add_argument("--concurrency", type=int, default=50)
+    parser.add_argument("--connection-limit-per-host", type=int, default=100)
+    asyncio.run(main(parser.parse_args()))
@@ -0,0 +1,542 @@
+import asyncio
+import collections
+import contextlib
+import datetime
+import hashlib
+import socket
+from typing import Any, AsyncIterator
+
+import aiohttp
+import aiohttp.web
+import exonum_client.crypto
+import nacl.public
+import pytest
+
+import blockchain_voting_client
+from exonum_modules.main import schema_pb2
+
+_HOSTNAME = "127.0.0.1"
+_API_PREFIX = "/api/services/votings_service/v1/"
+_SERVICE_KEY_PAIR = exonum_client.crypto.KeyPair.generate()
+
+
+def _ballot_json(index: int) -> dict[str, Any]:
+    return {
+        "index": index,
+        "sid": f"sid_{index}",
+        "voter": "ab" * 32,
+        "district_id": 1,
+        "encrypted_choice": {
+            "message": "00",
+            "nonce": "11" * 24,
+            "public_key": "22" * 32,
+        },
+        "decrypted_choices": None,
+        "store_tx_hash": "33" * 32,
+        "decrypt_tx_hash": None,
+        "status": "Unknown",
+    }
+
+
+class _StubVotingsService:
+    def __init__(
+        self,
+        *,
+        num_ballots: int,
+        with_range_endpoint: bool = False,
+        failures_per_index: dict[int, int] | None = None,
+    ):
+        self.num_ballots = num_ballots
+        self.failures_left = dict(failures_per_index or {})
+        self.requested_indices: list[int] = []
+        self.range_requests: list[tuple[int, int]] = []
+        self.voting_state = "Stopped"
+        self.district_id = 1
+        self.public_key_hex = "11" * 32
+        self.private_key_hex: str | None = None
+        self.endpoint_requests: collections.Counter[str] = collections.Counter()
+
+        self.app = aiohttp.web.Application()
+        self.app.router.add_get(_API_PREFIX + "ballot-by-index", self._ballot_by_index)
+        self.app.router.add_get(
+            _API_PREFIX + "stored-ballots-amount", self._stored_ballots_amount
+        )
+        for endpoint, handler in (
+            ("voting-state", self._voting_state),
+            ("ballots-config", self._ballots_config),
+            ("crypto-system-settings", self._crypto_system_settings),
+        ):
+            self.app.router.add_get(_API_PREFIX + endpoint, handler)
+        if with_range_endpoint:
+            self.app.router.add_get(
+                _API_PREFIX + "ballots-by-index-range", self._ballots_by_index_range
+            )
+
+    async def _voting_state(
+        self, unused_request: aiohttp.web.Request
+    ) -> aiohttp.web.Response:
+        self.endpoint_requests["voting-state"] += 1
+        return aiohttp.web.json_response({"state": self.voting_state})
+
+    async def _ballots_config(
+        self, unused_request: aiohttp.web.Request
+    ) -> aiohttp.web.Response:
+        self.endpoint_requests["ballots-config"] += 1
+        ballot_config = schema_pb2.BallotConfig(
+            district_id=self.district_id,
+            options={1: "Candidate"},
+            min_choices=1,
+            max_choices=1,
+        )
+        return aiohttp.web.json_response([list(ballot_config.SerializeToString())])
+
+    async def _crypto_system_settings(
+        self, unused_request: aiohttp.web.Request
+    ) -> aiohttp.web.Response:
+        self.endpoint_requests["crypto-system-settings"] += 1
+        return aiohttp.web.json_response(
+            {"public_key": self.public_key_hex, "private_key": self.private_key_hex}
+        )
+
+    async def _stored_ballots_amount(
+        self, unused_request: aiohttp.web.Request
+    ) -> aiohttp.web.Response:
+        return aiohttp.web.json_response({"stored_ballots_amount": self.num_ballots})
+
+    async def _ballot_by_index(
+        self, request: aiohttp.web.Request
+    ) -> aiohttp.web.Response:
+        index = int(request.query["ballot_index"])
+        self.requested_indices.append(index)
+        if self.failures_left.get(index, 0) > 0:
+            self.failures_left[index] -= 1
+            return aiohttp.web.Response(status=503)
+        # Reverse the completion order to check that results are reordered.
+        await asyncio.sleep(0.001 * (self.num_ballots - index))
+        return aiohttp.web.json_response(_ballot_json(index))
+
+    async def _ballots_by_index_range(
+        self, request: aiohttp.web.Request
+    ) -> aiohttp.web.Response:
+        start = int(request.query["from_index"])
+        stop = int(request.query["to_index"])
+        self.range_requests.append((start, stop))
+        return aiohttp.web.json_response(
+            [_ballot_json(index) for index in range(start, stop)]
+        )
+
+
+class _StubExplorer:
+    """Commits every submitted tx with the block after the next one."""
+
+    def __init__(
+        self,
+        fail_all: bool = False,
+        commit_after_blocks: int = 2,
+        blocks_latency: float = 0,
+    ):
+        self.height = 0
+        self._fail_all = fail_all
+        self._commit_after_blocks = commit_after_blocks
+        self._blocks_latency = blocks_latency
+        self._commit_height: dict[str, int] = {}
+
+        self.app = aiohttp.web.Application()
+        self.app.router.add_post("/api/explorer/v1/transactions", self._submit)
+        self.app.router.add_get("/api/explorer/v1/transactions", self._status)
+        self.app.router.add_get("/api/explorer/v1/blocks", self._blocks)
+
+    async def produce_blocks(self):
+        while True:
+            await asyncio.sleep(0.01)
+            self.height += 1
+
+    async def _submit(self, request: aiohttp.web.Request) -> aiohttp.web.Response:
+        tx_json = await request.json()
+        tx_hash = hashlib.sha256(tx_json["tx_body"].encode()).hexdigest()
+        self._commit_height[tx_hash] = self.height + self._commit_after_blocks
+        return aiohttp.web.json_response({"tx_hash": tx_hash})
+
+    async def _status(self, request: aiohttp.web.Request) -> aiohttp.web.Response:
+        tx_hash = request.query["hash"]
+        if tx_hash not in self._commit_height:
+            return aiohttp.web.Response(status=404)
+        if self._commit_height[tx_hash] > self.height:
+            return aiohttp.web.json_response({"type": "in-pool"})
+        status = "panic" if self._fail_all else "success"
+        return aiohttp.web.json_response(
+            {"type": "committed", "status": {"type": status}}
+        )
+
+    async def _blocks(
+        self, unused_request: aiohttp.web.Request
+    ) -> aiohttp.web.Response:
+        await asyncio.sleep(self._blocks_latency)
+        return aiohttp.web.json_response(
+            {"range": {"start": self.height, "end": self.height + 1}, "blocks": []}
+        )
+
+
+def _client(
+    port: int, voting_id: str
+) -> blockchain_voting_client.BlockchainVotingClient:
+    return blockchain_voting_client.BlockchainVotingClient(
+        voting_id=voting_id,
+        url=_HOSTNAME,
+        public_api_port=port,
+        private_api_port=port,
+        service_api_private_key_hex=_SERVICE_KEY_PAIR.secret_key.hex(),
+        service_api_public_key_hex=_SERVICE_KEY_PAIR.public_key.hex(),
+    )
+
+
+@contextlib.asynccontextmanager
+async def _serve(stub) -> AsyncIterator[int]:
+    runner = aiohttp.web.AppRunner(stub.app)
+    await runner.setup()
+    with socket.socket() as sock:
+        sock.bind((_HOSTNAME, 0))
+        port = sock.getsockname()[1]
+    site = aiohttp.web.TCPSite(runner, _HOSTNAME, port)
+    await site.start()
+    try:
+        yield port
+    finally:
+        await runner.cleanup()
+
+
+async def _with_client(stub, coro_fn, voting_id="test_voting_id"):
+    async with _serve(stub) as port:
+        async with _client(port, voting_id) as client:
+            return await coro_fn(client)
+
+
+async def _collect_indices(client, **kwargs) -> list[int]:
+    return [ballot.index async for ballot in client.iter_ballots(**kwargs)]
+
+
+def test_iter_ballots_yields_all_ballots_in_index_order():
+    stub = _StubVotingsService(num_ballots=23)
+    indices = asyncio.run(
+        _with_client(
+            stub,
+            lambda client: _collect_indices(client, batch_size=5, max_in_flight=2),
+        )
+    )
+    assert indices == list(range(23))
+
+
+def test_iter_ballots_respects_start_and_stop():
+    stub = _StubVotingsService(num_ballots=23)
+    indices = asyncio.run(
+        _with_client(
+            stub,
+            lambda client: _collect_indices(client, start=4, stop=11, batch_size=3),
+        )
+    )
+    assert indices == list(range(4, 11))
+    assert sorted(stub.requested_indices) == list(range(4, 11))
+
+
+def test_iter_ballots_retries_transient_failures():
+    stub = _StubVotingsService(num_ballots=10, failures_per_index={3: 2, 7: 1})
+    indices = asyncio.run(
+        _with_client(
+            stub,
+            lambda client: _collect_indices(client, batch_size=4, max_retries=2),
+        )
+    )
+    assert indices == list(range(10))
+
+
+def test_iter_ballots_raises_when_retries_are_exhausted():
+    stub = _StubVotingsService(num_ballots=10, failures_per_index={3: 5})
+    with pytest.raises(aiohttp.ClientResponseError):
+        asyncio.run(
+            _with_client(
+                stub,
+                lambda client: _collect_indices(client, batch_size=4, max_retries=1),
+            )
+        )
+
+
+def test_iter_ballots_uses_range_endpoint_when_available():
+    stub = _StubVotingsService(num_ballots=10, with_range_endpoint=True)
+    indices = asyncio.run(
+        _with_client(
+            stub,
+            lambda client: _collect_indices(client, batch_size=4, max_in_flight=1),
+        )
+    )
+    assert indices == list(range(10))
+    assert stub.range_requests == [(0, 4), (4, 8), (8, 10)]
+    assert stub.requested_indices == []
+
+
+async def _publish_through_submitter(
+    client: blockchain_voting_client.BlockchainVotingClient,
+    explorer: _StubExplorer,
+    num_ballots: int,
+) -> tuple[list[str], blockchain_voting_client.SubmitterStats]:
+    block_producer = asyncio.create_task(explorer.produce_blocks())
+    try:
+        async with blockchain_voting_client.TransactionSubmitter(
+            client,
+            max_in_flight=8,
+            poll_interval=datetime.timedelta(seconds=0.005),
+        ) as submitter:
+            tx_hashes = await asyncio.gather(
+                *(
+                    client.publish_decrypted_ballot(
+                        ballot_index=ballot_index,
+                        decrypted_choices=[1],
+                        is_invalid=False,
+                        submitter=submitter,
+                    )
+                    for ballot_index in range(num_ballots)
+                )
+            )
+            return tx_hashes, submitter.stats()
+    finally:
+        block_producer.cancel()
+
+
+def test_transaction_submitter_waits_for_all_commits():
+    explorer = _StubExplorer()
+    tx_hashes, stats = asyncio.run(
+        _with_client(
+            explorer,
+            lambda client: _publish_through_submitter(client, explorer, 40),
+        )
+    )
+    assert len(set(tx_hashes)) == 40
+    assert stats.submitted == stats.committed == 40
+    assert stats.failed == stats.in_flight == 0
+    assert 0 < stats.latency_p50 <= stats.latency_p90 <= stats.latency_p99
+
+
+def test_transaction_submitter_propagates_failed_transactions():
+    explorer = _StubExplorer(fail_all=True)
+
+    async def _submit_failing(client):
+        block_producer = asyncio.create_task(explorer.produce_blocks())
+        try:
+            async with blockchain_voting_client.TransactionSubmitter(
+                client, poll_interval=datetime.timedelta(seconds=0.005)
+            ) as submitter:
+                with pytest.raises(ValueError, match="Got exception from blockchain"):
+                    await client.publish_decrypted_ballot(
+                        ballot_index=0,
+                        decrypted_choices=None,
+                        is_invalid=True,
+                        submitter=submitter,
+                    )
+                return submitter.stats()
+        finally:
+            block_producer.cancel()
+
+    stats = asyncio.run(_with_client(explorer, _submit_failing))
+    assert stats.submitted == stats.failed == 1
+    assert stats.committed == 0
+
+
+def test_backoff_delays_grow_with_jitter_up_to_the_cap():
+    client = blockchain_voting_client.BlockchainVotingClient(
+        voting_id="test_voting_id",
+        url=_HOSTNAME,
+        public_api_port=1,
+        private_api_port=1,
+        service_api_private_key_hex=_SERVICE_KEY_PAIR.secret_key.hex(),
+        service_api_public_key_hex=_SERVICE_KEY_PAIR.public_key.hex(),
+        backoff_time=datetime.timedelta(seconds=0.1),
+        max_backoff_time=datetime.timedelta(seconds=0.4),
+    )
+    delays = client._backoff_delays()
+    expected_bounds = [(0.05, 0.1), (0.1, 0.2), (0.2, 0.4), (0.2, 0.4), (0.2, 0.4)]
+    for low, high in expected_bounds:
+        assert low <= next(delays) <= high
+
+
+def test_wait_for_tx_raises_after_deadline():
+    explorer = _StubExplorer()
+
+    async def _wait_for_uncommitted_tx(client):
+        with pytest.raises(TimeoutError, match="is not committed"):
+            await client._wait_for_tx(
+                "aa" * 32, timeout=datetime.timedelta(seconds=0.1)
+            )
+        return client.tx_wait_stats()
+
+    stats = asyncio.run(_with_client(explorer, _wait_for_uncommitted_tx))
+    assert stats.waits == stats.timeouts == 1
+    assert stats.polls > 1
+    assert stats.latency_p50 is None
+
+
+def test_wait_for_tx_retries_http_timeouts_before_deadline():
+    explorer = _StubExplorer()
+
+    async def _wait_through_http_timeouts(client):
+        is_tx_committed = iter([aiohttp.ServerTimeoutError(), False, True])
+
+        async def _is_tx_committed(unused_tx_hash):
+            result = next(is_tx_committed)
+            if isinstance(result, Exception):
+                raise result
+            return result
+
+        client._is_tx_committed = _is_tx_committed
+        await client._wait_for_tx("aa" * 32, timeout=datetime.timedelta(seconds=5))
+        return client.tx_wait_stats()
+
+    stats = asyncio.run(_with_client(explorer, _wait_through_http_timeouts))
+    assert stats.waits == stats.polls - 2 == 1
+    assert stats.timeouts == 0
+
+
+def test_transaction_submitter_times_out_dropped_transactions():
+    explorer = _StubExplorer()
+
+    async def _submit_without_blocks(client):
+        async with blockchain_voting_client.TransactionSubmitter(
+            client,
+            poll_interval=datetime.timedelta(seconds=0.005),
+            tx_timeout=datetime.timedelta(seconds=0.1),
+        ) as submitter:
+            with pytest.raises(TimeoutError):
+                await client.publish_decrypted_ballot(
+                    ballot_index=0,
+                    decrypted_choices=[1],
+                    is_invalid=False,
+                    submitter=submitter,
+                )
+            return submitter.stats()
+
+    stats = asyncio.run(_with_client(explorer, _submit_without_blocks))
+    assert stats.failed == 1
+    assert stats.in_flight == 0
+
+
+def test_transaction_submitter_checks_txs_submitted_while_fetching_height():
+    # No new blocks, so the second tx is only looked up if it is remembered as
+    # unchecked while the tracker waits for the height.
+    explorer = _StubExplorer(commit_after_blocks=0, blocks_latency=0.2)
+
+    async def _submit_during_height_fetch(client):
+        async with blockchain_voting_client.TransactionSubmitter(
+            client,
+            poll_interval=datetime.timedelta(seconds=0.005),
+            tx_timeout=datetime.timedelta(seconds=2),
+        ) as submitter:
+
+            async def _submit(ballot_index: int, delay: float) -> str:
+                await asyncio.sleep(delay)
+                return await client.publish_decrypted_ballot(
+                    ballot_index=ballot_index,
+                    decrypted_choices=[1],
+                    is_invalid=False,
+                    submitter=submitter,
+                )
+
+            await asyncio.gather(_submit(0, 0), _submit(1, 0.1))
+            return submitter.stats()
+
+    stats = asyncio.run(_with_client(explorer, _submit_during_height_fetch))
+    assert stats.submitted == stats.committed == 2
+    assert stats.failed == 0
+
+
+async def _read_voting_data(
+    port: int, voting_id: str = "cached_voting"
+) -> tuple[list[int], blockchain_voting_client.CryptoSystemSettings]:
+    # Every read goes through a new client.
+    async with _client(port, voting_id) as client:
+        ballots_config = await client.ballots_config()
+        crypto_system_settings = await client.crypto_system_settings()
+    return [config.district_id for config in ballots_config], crypto_system_settings
+
+
+def test_ballots_config_is_cached_across_clients_after_registration():
+    stub = _StubVotingsService(num_ballots=0)
+    stub.voting_state = "Registration"
+
+    async def run() -> list[list[int]]:
+        district_ids = []
+        async with _serve(stub) as port:
+            for district_id, state in [
+                (1, "Registration"),
+                (2, "Registration"),
+                (3, "InProcess"),
+                (4, "InProcess"),
+                (5, "Stopped"),
+            ]:
+                stub.district_id = district_id
+                stub.voting_state = state
+                district_ids.append((await _read_voting_data(port))[0])
+        return district_ids
+
+    # The config may change during the registration, it is fixed afterwards.
+    assert asyncio.run(run()) == [[1], [2], [3], [3], [3]]
+    assert stub.endpoint_requests["ballots-config"] == 3
+
+
+def test_crypto_system_settings_are_cached_once_the_key_is_published():
+    stub = _StubVotingsService(num_ballots=0)
+    private_key = nacl.public.PrivateKey.generate()
+
+    async def run() -> list[nacl.public.PrivateKey | None]:
+        private_keys = []
+        async with _serve(stub) as port:
+            for private_key_hex in [None, None, private_key.encode().hex(), None]:
+                # Published by another process, and never unpublished, the
+                # last None only checks that the key is not fetched again.
+                stub.private_key_hex = private_key_hex
+                private_keys.append((await _read_voting_data(port))[1].private_key)
+        return private_keys
+
+    assert asyncio.run(run()) == [None, None, private_key, private_key]
+    assert stub.endpoint_requests["crypto-system-settings"] == 3
+
+
+def test_published_decryption_key_is_seen_by_other_clients():
+    stub = _StubVotingsService(num_ballots=0)
+    private_key = nacl.public.PrivateKey.generate()
+    stub.public_key_hex = private_key.public_key.encode().hex()
+
+    async def _commit_key_tx(request: aiohttp.web.Request) -> aiohttp.web.Response:
+        await request.read()
+        stub.private_key_hex = private_key.encode().hex()
+        return aiohttp.web.json_response({"tx_hash": "44" * 32})
+
+    async def _tx_status(unused_request: aiohttp.web.Request) -> aiohttp.web.Response:
+        return aiohttp.web.json_response(
+            {"type": "committed", "status": {"type": "success"}}
+        )
+
+    stub.app.router.add_post("/api/explorer/v1/transactions", _commit_key_tx)
+    stub.app.router.add_get("/api/explorer/v1/transactions", _tx_status)
+
+    async def run() -> list[nacl.public.PrivateKey | None]:
+        async with _serve(stub) as port:
+            before = (await _read_voting_data(port, "published_key"))[1]
+            async with _client(port, "published_key") as client:
+                await client.publish_decryption_key(private_key)
+            after = (await _read_voting_data(port, "published_key"))[1]
+        return [before.private_key, after.private_key]
+
+    assert asyncio.run(run()) == [None, private_key]
+
+
+def test_voting_data_is_not_shared_between_nodes():
+    stubs = [_StubVotingsService(num_ballots=0) for _ in range(2)]
+    for district_id, stub in enumerate(stubs):
+        stub.district_id = district_id
+
+    async def run() -> list[list[int]]:
+        async with _serve(stubs[0]) as port, _serve(stubs[1]) as other_port:
+            return [
+                (await _read_voting_data(port, "shared_voting_id"))[0],
+                (await _read_voting_data(other_port, "shared_voting_id"))[0],
+            ]
+
+    assert asyncio.run(run()) == [[0], [1]]
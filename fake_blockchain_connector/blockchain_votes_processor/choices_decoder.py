@@ -0,0 +1,194 @@
+import dataclasses
+import os
+import sys
+from typing import Iterable
+
+import numpy as np
+from google.protobuf import message as protobuf_message
+
+# Add compiled protos to the current path, since it's required by protoc
+sys.path.append(os.path.join(os.path.dirname(__file__), "exonum_modules", "main"))
+
+from exonum_modules.main import schema_pb2
+
+# Choices.data is field 1, serialized packed (length-delimited).
+_PACKED_DATA_TAG = 0x0A
+_MAX_UINT32 = 0xFFFFFFFF
+# A uint32 varint takes at most 5 bytes.
+_MAX_VARINT_SIZE = 5
+
+
+def _strip_padding(
+    choices_encoded: bytes | memoryview,
+) -> bytes | memoryview | None:
+    if len(choices_encoded) < 2:
+        return None
+    offset = ((choices_encoded[0] << 8) | choices_encoded[1]) + 2
+    if len(choices_encoded) < offset:
+        return None
+    return choices_encoded[offset:]
+
+
+def _packed_field(message: bytes | memoryview) -> bytes | memoryview | None:
+    """Varints of Choices.data, when the message is a single packed field with
+    a one byte length, the way Choices are serialized. None otherwise."""
+    end = len(message)
+    if (
+        end < 2
+        or message[0] != _PACKED_DATA_TAG
+        or message[1] >= 0x80
+        or message[1] != end - 2
+    ):
+        return None
+    if end > 2 and message[-1] >= 0x80:
+        # The last varint is truncated.
+        return None
+    return message[2:]
+
+
+def _parse_choices_proto(message: bytes | memoryview) -> list[int] | None:
+    choices_proto = schema_pb2.Choices()
+    try:
+        choices_proto.ParseFromString(bytes(message))
+    except protobuf_message.DecodeError:
+        return None
+    return list(choices_proto.data)
+
+
+def decode_choices(message: bytes | memoryview) -> list[int] | None:
+    """Parses a serialized Choices message, None if it is malformed.
+
+    Gives the same choices as schema_pb2.Choices. Only a single packed field
+    of choices below 128 is decoded without creating the message. Real
+    candidate ids are random uint32 values and take several bytes, so real
+    ballots go through protobuf here, decode_padded_choices_batch handles
+    them without it.
+    """
+    end = len(message)
+    if end < 0x82 and end >= 2 and message[0] == _PACKED_DATA_TAG:
+        if message[1] == end - 2 and (end == 2 or max(message[2:]) < 0x80):
+            return list(message[2:])
+    return _parse_choices_proto(message)
+
+
+def decode_padded_choices(choices_encoded: bytes | memoryview) -> list[int] | None:
+    """Parses a Choices message prefixed with its padding, the way the voter
+    frontend encrypts it. None if it is malformed."""
+    message = _strip_padding(choices_encoded)
+    if message is None:
+        return None
+    return decode_choices(message)
+
+
+@dataclasses.dataclass(frozen=True)
+class DecodedChoices:
+    """Choices of many ballots in one flat array.
+
+    Choices of ballot `i` are `choices[offsets[i]:offsets[i + 1]]`, ballots
+    that failed to decode have no choices and `is_decoded[i] == False`.
+    """
+
+    choices: np.ndarray
+    offsets: np.ndarray
+    is_decoded: np.ndarray
+
+    def __len__(self) -> int:
+        return len(self.is_decoded)
+
+    def __getitem__(self, index: int) -> list[int] | None:
+        if not self.is_decoded[index]:
+            return None
+        return self.choices[self.offsets[index] : self.offsets[index + 1]].tolist()
+
+
+def _decode_varints(data: np.ndarray) -> tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """Decodes a buffer of complete varints.
+
+    Returns the values, the position of the first byte of every value, and
+    whether the value fits into uint32.
+    """
+    (ends,) = np.nonzero(data < 0x80)
+    starts = np.empty_like(ends)
+    starts[:1] = 0
+    starts[1:] = ends[:-1] + 1
+    if len(ends) == 0:
+        return np.zeros(0, dtype=np.uint64), starts, np.zeros(0, dtype=bool)
+
+    byte_shifts = 7 * (np.arange(len(data)) - np.repeat(starts, ends - starts + 1))
+    # Bytes past the longest uint32 varint only make the value invalid.
+    byte_shifts = np.minimum(byte_shifts, 7 * _MAX_VARINT_SIZE)
+    byte_values = (data & 0x7F).astype(np.uint64) << byte_shifts.astype(np.uint64)
+    values = np.add.reduceat(byte_values, starts)
+    fits = (ends - starts < _MAX_VARINT_SIZE) & (values <= _MAX_UINT32)
+    return values, starts, fits
+
+
+def decode_padded_choices_batch(
+    choices_encoded: Iterable[bytes | memoryview | None],
+) -> DecodedChoices:
+    """decode_padded_choices of many ballots, None stands for a ballot that
+    failed to decrypt.
+
+    Varints of all packed fields are decoded at once, messages of any other
+    shape are parsed one by one.
+    """
+    choices_encoded = list(choices_encoded)
+    num_ballots = len(choices_encoded)
+    packed_fields = bytearray()
+    field_offsets = np.zeros(num_ballots + 1, dtype=np.int64)
+    # Choices of ballots that are not a single packed field.
+    irregular: dict[int, list[int] | None] = {}
+    for index, ballot_choices_encoded in enumerate(choices_encoded):
+        message = (
+            None
+            if ballot_choices_encoded is None
+            else _strip_padding(ballot_choices_encoded)
+        )
+        field = None if message is None else _packed_field(message)
+        if field is not None:
+            packed_fields += field
+        elif message is None:
+            irregular[index] = None
+        else:
+            irregular[index] = _parse_choices_proto(message)
+        field_offsets[index + 1] = len(packed_fields)
+
+    values, starts, fits = _decode_varints(np.frombuffer(packed_fields, dtype=np.uint8))
+    value_ballots = np.searchsorted(field_offsets, starts, side="right") - 1
+    # Protobuf decides what values that do not fit into uint32 mean.
+    for index in np.unique(value_ballots[~fits]).tolist():
+        irregular[index] = _parse_choices_proto(_strip_padding(choices_encoded[index]))
+
+    if irregular:
+        irregular_indices = np.fromiter(irregular, dtype=np.int64, count=len(irregular))
+        is_regular = ~np.isin(value_ballots, irregular_indices)
+        irregular_choices = [
+            (index, choice)
+            for index, choices in irregular.items()
+            for choice in choices or ()
+        ]
+        values = np.concatenate(
+            [
+                values[is_regular],
+                np.array([choice for _, choice in irregular_choices], dtype=np.uint64),
+            ]
+        )
+        value_ballots = np.concatenate(
+            [
+                value_ballots[is_regular],
+                np.array([index for index, _ in irregular_choices], dtype=np.int64),
+            ]
+        )
+        order = np.argsort(value_ballots, kind="stable")
+        values = values[order]
+        value_ballots = value_ballots[order]
+
+    is_decoded = np.ones(num_ballots, dtype=bool)
+    for index, choices in irregular.items():
+        if choices is None:
+            is_decoded[index] = False
+    offsets = np.zeros(num_ballots + 1, dtype=np.uint64)
+    np.cumsum(np.bincount(value_ballots, minlength=num_ballots), out=offsets[1:])
+    return DecodedChoices(
+        choices=values.astype(np.uint32), offsets=offsets, is_decoded=is_decoded
+    )
@@ -0,0 +1,141 @@
+import random
+
+import pytest
+from google.protobuf import message as protobuf_message
+
+import choices_decoder
+
+from exonum_modules.main import schema_pb2
+
+
+def _protobuf_choices(message: bytes) -> list[int] | None:
+    choices_proto = schema_pb2.Choices()
+    try:
+        choices_proto.ParseFromString(message)
+    except protobuf_message.DecodeError:
+        return None
+    return list(choices_proto.data)
+
+
+def _varint(value: int) -> bytes:
+    encoded = bytearray()
+    while value >= 0x80:
+        encoded.append(value & 0x7F | 0x80)
+        value >>= 7
+    encoded.append(value)
+    return bytes(encoded)
+
+
+@pytest.mark.parametrize(
+    "message",
+    [
+        b"",
+        schema_pb2.Choices(data=[3]).SerializeToString(),
+        schema_pb2.Choices(data=[1, 200, 70000, 2**32 - 1]).SerializeToString(),
+        # Unpacked, and unpacked mixed with packed.
+        b"\x08\x01\x08\xc8\x01",
+        b"\x0a\x02\x01\x02\x08\x03\x0a\x01\x04",
+        # An empty packed field and a non-minimal varint.
+        b"\x0a\x00\x08\x81\x00",
+        # Values that do not fit into uint32 are truncated by protobuf.
+        b"\x08" + _varint(2**32 + 5),
+        b"\x0a\x06" + _varint(2**35),
+        # Unknown fields are skipped by protobuf.
+        b"\x10\x05\x0a\x01\x07",
+        # Malformed messages.
+        b"\x0a\x05\x01\x02",
+        b"\x08\x80",
+        b"\x00\x01",
+    ],
+)
+def test_decode_choices_matches_protobuf(message):
+    assert choices_decoder.decode_choices(message) == _protobuf_choices(message)
+    assert choices_decoder.decode_choices(memoryview(message)) == _protobuf_choices(
+        message
+    )
+
+
+def test_decode_choices_matches_protobuf_on_random_messages():
+    rng = random.Random(0)
+    for _ in range(2000):
+        choices = [
+            rng.choice([rng.randrange(128), rng.randrange(2**32)])
+            for _ in range(rng.randrange(5))
+        ]
+        message = schema_pb2.Choices(data=choices).SerializeToString()
+        # Truncate or corrupt some of them.
+        if message and rng.random() < 0.3:
+            message = message[: rng.randrange(len(message))]
+        elif message and rng.random() < 0.3:
+            position = rng.randrange(len(message))
+            message = (
+                message[:position]
+                + bytes([rng.randrange(256)])
+                + message[position + 1 :]
+            )
+        assert choices_decoder.decode_choices(message) == _protobuf_choices(message)
+
+
+def _padded(message: bytes) -> bytes:
+    return (3).to_bytes(2, byteorder="big") + b"\0" * 3 + message
+
+
+def test_decode_padded_choices_batch_matches_per_ballot_decoding():
+    rng = random.Random(0)
+    choices_encoded = []
+    for _ in range(2000):
+        choices = [
+            rng.choice([rng.randrange(128), rng.randrange(2**32)])
+            for _ in range(rng.randrange(5))
+        ]
+        message = schema_pb2.Choices(data=choices).SerializeToString()
+        match rng.randrange(6):
+            case 0:
+                message = message[: rng.randrange(len(message) + 1)]
+            case 1:
+                message = b"\x08" + _varint(rng.randrange(2**36)) + message
+            case 2:
+                message += b"\x0a\x06" + _varint(2**33 + rng.randrange(2**33))
+        choices_encoded.append(None if rng.random() < 0.05 else _padded(message))
+
+    decoded = choices_decoder.decode_padded_choices_batch(
+        (
+            memoryview(ballot_choices_encoded)
+            if ballot_choices_encoded is not None and rng.random() < 0.5
+            else ballot_choices_encoded
+        )
+        for ballot_choices_encoded in choices_encoded
+    )
+
+    assert [decoded[index] for index in range(len(decoded))] == [
+        (
+            None
+            if ballot_choices_encoded is None
+            else choices_decoder.decode_padded_choices(ballot_choices_encoded)
+        )
+        for ballot_choices_encoded in choices_encoded
+    ]
+
+
+def test_decode_padded_choices_batch():
+    choices = schema_pb2.Choices(data=[1, 300]).SerializeToString()
+    choices_encoded = [
+        _padded(choices),
+        None,
+        # Shorter than its padding.
+        (30).to_bytes(2, byteorder="big") + choices,
+        b"\0",
+        (0).to_bytes(2, byteorder="big"),
+    ]
+
+    decoded = choices_decoder.decode_padded_choices_batch(choices_encoded)
+
+    assert [decoded[index] for index in range(len(decoded))] == [
+        [1, 300],
+        None,
+        None,
+        None,
+        [],
+    ]
+    assert decoded.choices.tolist() == [1, 300]
+    assert decoded.offsets.tolist() == [0, 2, 2, 2, 2, 2]
@@ -5,15 +5,45 @@ RABBIT_MQ_HOSTNAME = os.environ.get("RABBIT_MQ_HOSTNAME", "localhost")
 RABBIT_MQ_PORT = int(os.environ.get("RABBIT_MQ_PORT", 5672))
 RABBIT_MQ_LOGIN = os.environ.get("RABBIT_MQ_LOGIN", "guest")
 RABBIT_MQ_PASSWORD = os.environ.get("RABBIT_MQ_PASSWORD", "guest")
+RABBIT_MQ_PREFETCH_COUNT = int(os.environ.get("RABBIT_MQ_PREFETCH_COUNT", 32))
+RABBIT_MQ_WORKERS_PER_VOTING = int(os.environ.get("RABBIT_MQ_WORKERS_PER_VOTING", 16))
+RABBIT_MQ_RETRY_BUDGET = int(os.environ.get("RABBIT_MQ_RETRY_BUDGET", 5))
+RABBIT_MQ_RETRY_BASE_DELAY_SECONDS = float(
+    os.environ.get("RABBIT_MQ_RETRY_BASE_DELAY_SECONDS", 1)
+)
 
 ENCRYPTOR_URL = os.environ.get("ENCRYPTOR_URL", "http://localhost:8001")
 ENCRYPTOR_SYSTEM = os.environ.get("ENCRYPTOR_SYSTEM", "TestSystem")
 ENCRYPTOR_TOKEN = os.environ.get("ENCRYPTOR_TOKEN", "TOKEN_SECRET")
+# Empty path disables batching, messages are decrypted one by one.
+ENCRYPTOR_BATCH_DECRYPT_PATH = os.environ.get(
+    "ENCRYPTOR_BATCH_DECRYPT_PATH", "/api/encryption/decryptBatch"
+)
+ENCRYPTOR_BATCH_DECRYPT_SIZE = int(os.environ.get("ENCRYPTOR_BATCH_DECRYPT_SIZE", 32))
+ENCRYPTOR_BATCH_DECRYPT_MAX_WAIT_SECONDS = float(
+    os.environ.get("ENCRYPTOR_BATCH_DECRYPT_MAX_WAIT_SECONDS", 0.005)
+)
 
 BLOCKCHAIN_PROCESS_VOTE_URI = os.environ.get(
     "BLOCKCHAIN_PROXY_URI", "http://localhost:8021/process_vote"
 )
 
+INGEST_HTTP_CONNECTION_LIMIT_PER_HOST = int(
+    os.environ.get("INGEST_HTTP_CONNECTION_LIMIT_PER_HOST", 64)
+)
+INGEST_HTTP_KEEPALIVE_TIMEOUT_SECONDS = float(
+    os.environ.get("INGEST_HTTP_KEEPALIVE_TIMEOUT_SECONDS", 30)
+)
+INGEST_HTTP_DNS_CACHE_TTL_SECONDS = float(
+    os.environ.get("INGEST_HTTP_DNS_CACHE_TTL_SECONDS", 300)
+)
+INGEST_HTTP_REQUEST_TIMEOUT_SECONDS = float(
+    os.environ.get("INGEST_HTTP_REQUEST_TIMEOUT_SECONDS", 30)
+)
+INGEST_HTTP_CONNECT_TIMEOUT_SECONDS = float(
+    os.environ.get("INGEST_HTTP_CONNECT_TIMEOUT_SECONDS", 5)
+)
+
 BASE_LISTEN_QUEUE_NAME = os.environ.get("BASE_LISTEN_QUEUE_NAME", "mgik_queue")
 ARM_VOITING_URL = os.environ.get(
     "ARM_VOITING_URL", "http://localhost:8022/arm/config?empty_ok=true"
@@ -31,6 +61,38 @@ BLOCKCHAIN_SERVICE_DECRYPT_WORKERS = int(
     os.environ.get("BLOCKCHAIN_SERVICE_DECRYPT_WORKERS", multiprocessing.cpu_count())
 )
 
+BLOCKCHAIN_SERVICE_DECRYPT_CHUNK_SIZE = int(
+    os.environ.get("BLOCKCHAIN_SERVICE_DECRYPT_CHUNK_SIZE", 256)
+)
+
+BLOCKCHAIN_SERVICE_FETCH_BATCH_SIZE = int(
+    os.environ.get("BLOCKCHAIN_SERVICE_FETCH_BATCH_SIZE", 100)
+)
+BLOCKCHAIN_SERVICE_FETCH_MAX_IN_FLIGHT = int(
+    os.environ.get("BLOCKCHAIN_SERVICE_FETCH_MAX_IN_FLIGHT", 8)
+)
+BLOCKCHAIN_SERVICE_DECRYPT_QUEUE_SIZE = int(
+    os.environ.get("BLOCKCHAIN_SERVICE_DECRYPT_QUEUE_SIZE", 10000)
+)
+BLOCKCHAIN_SERVICE_PUBLISH_QUEUE_SIZE = int(
+    os.environ.get("BLOCKCHAIN_SERVICE_PUBLISH_QUEUE_SIZE", 10000)
+)
+BLOCKCHAIN_SERVICE_PUBLISH_CONCURRENCY = int(
+    os.environ.get("BLOCKCHAIN_SERVICE_PUBLISH_CONCURRENCY", 64)
+)
+BLOCKCHAIN_SERVICE_PROGRESS_LOG_INTERVAL_SECONDS = float(
+    os.environ.get("BLOCKCHAIN_SERVICE_PROGRESS_LOG_INTERVAL_SECONDS", 10)
+)
+BLOCKCHAIN_SERVICE_CHECKPOINT_PATH = os.environ.get(
+    "BLOCKCHAIN_SERVICE_CHECKPOINT_PATH",
+    os.path.join(os.path.dirname(__file__), "finalization_checkpoint.sqlite3"),
+)
+# How long read endpoints are cached before the voting is finished, after that
+# the responses never change.
+BLOCKCHAIN_SERVICE_RESPONSE_CACHE_TTL_SECONDS = float(
+    os.environ.get("BLOCKCHAIN_SERVICE_RESPONSE_CACHE_TTL_SECONDS", 2)
+)
+
 BLOCKCHAIN_API_PRIVATE_KEY = os.environ.get(
     "BLOCKCHAIN_API_PRIVATE_KEY",
     "0063d0ccd28f3212ef40b5cd04508a602afa3317d2c0314d522b664bdce913b7f5d824aca5423c145125186d79e9f6a44100158faa02ee162dc75b1e54bc9409",
@@ -42,6 +104,24 @@ BLOCKCHAIN_API_PUBLIC_KEY = os.environ.get(
 BLOCKCHAIN_API_HOSTNAME = os.environ.get("BLOCKCHAIN_API_HOSTNAME", "localhost")
 BLOCKCHAIN_API_PUBLIC_PORT = int(os.environ.get("BLOCKCHAIN_API_PUBLIC_PORT", 9000))
 BLOCKCHAIN_API_PRIVATE_PORT = int(os.environ.get("BLOCKCHAIN_API_PRIVATE_PORT", 9001))
+BLOCKCHAIN_API_CONNECTION_LIMIT_PER_HOST = int(
+    os.environ.get("BLOCKCHAIN_API_CONNECTION_LIMIT_PER_HOST", 100)
+)
+BLOCKCHAIN_API_KEEPALIVE_TIMEOUT_SECONDS = float(
+    os.environ.get("BLOCKCHAIN_API_KEEPALIVE_TIMEOUT_SECONDS", 30)
+)
+BLOCKCHAIN_API_DNS_CACHE_TTL_SECONDS = float(
+    os.environ.get("BLOCKCHAIN_API_DNS_CACHE_TTL_SECONDS", 300)
+)
+BLOCKCHAIN_API_TX_BACKOFF_SECONDS = float(
+    os.environ.get("BLOCKCHAIN_API_TX_BACKOFF_SECONDS", 0.05)
+)
+BLOCKCHAIN_API_TX_MAX_BACKOFF_SECONDS = float(
+    os.environ.get("BLOCKCHAIN_API_TX_MAX_BACKOFF_SECONDS", 2)
+)
+BLOCKCHAIN_API_TX_TIMEOUT_SECONDS = float(
+    os.environ.get("BLOCKCHAIN_API_TX_TIMEOUT_SECONDS", 600)
+)
 
 
 FORGING_DO_FORGING = os.environ.get("FORGING_DO_FORGING", "true") == "true"
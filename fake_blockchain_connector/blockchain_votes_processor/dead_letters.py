@@ -0,0 +1,199 @@
+"""Delayed retries and dead-lettering of votes the ingest path failed on.
+
+A vote that fails with a transient error is moved to a retry queue whose TTL
+returns it to the source queue later. Every attempt has its own retry queue
+with a doubled TTL, so a message never waits behind one with a longer delay.
+Votes that run out of the retry budget, or fail permanently, are parked in a
+dead-letter queue of their voting, where they can be inspected and replayed.
+"""
+
+import asyncio
+import datetime
+import logging
+from typing import Any
+
+import aio_pika
+import aio_pika.abc
+import aiohttp
+
+import config
+
+logger = logging.getLogger(__name__)
+
+RETRY_COUNT_HEADER = "x-retry-count"
+ORIGINAL_QUEUE_HEADER = "x-original-queue"
+ERROR_HEADER = "x-error"
+
+
+def retry_queue_name(queue_name: str, attempt: int) -> str:
+    return f"{queue_name}.retry-{attempt}"
+
+
+def dead_letter_queue_name(voting_id: str) -> str:
+    return f"{config.BASE_LISTEN_QUEUE_NAME}-dead-{voting_id}"
+
+
+def retry_delay(attempt: int) -> datetime.timedelta:
+    return datetime.timedelta(
+        seconds=config.RABBIT_MQ_RETRY_BASE_DELAY_SECONDS * 2**attempt
+    )
+
+
+def is_retryable(exc: BaseException) -> bool:
+    """Whether retrying the vote later may succeed."""
+    if isinstance(exc, aiohttp.ClientResponseError):
+        return exc.status >= 500 or exc.status in (408, 429)
+    return isinstance(exc, (aiohttp.ClientError, asyncio.TimeoutError))
+
+
+async def declare_queues(
+    channel: aio_pika.abc.AbstractChannel, queue_name: str, voting_id: str
+):
+    for attempt in range(config.RABBIT_MQ_RETRY_BUDGET):
+        await channel.declare_queue(
+            retry_queue_name(queue_name, attempt),
+            durable=True,
+            arguments={
+                "x-message-ttl": int(retry_delay(attempt).total_seconds() * 1000),
+                "x-dead-letter-exchange": "",
+                "x-dead-letter-routing-key": queue_name,
+            },
+        )
+    await channel.declare_queue(dead_letter_queue_name(voting_id), durable=True)
+
+
+async def _republish(
+    channel: aio_pika.abc.AbstractChannel,
+    message: aio_pika.abc.AbstractIncomingMessage,
+    *,
+    headers: dict[str, Any],
+    routing_key: str,
+):
+    # Keeps the original properties, the ingest path measures the queue wait
+    # from the timestamp of the first publishing. The expiration is dropped so
+    # that only the retry queue decides when the message comes back.
+    await channel.default_exchange.publish(
+        aio_pika.Message(
+            message.body,
+            headers=headers,
+            content_type=message.content_type,
+            content_encoding=message.content_encoding,
+            delivery_mode=aio_pika.DeliveryMode.PERSISTENT,
+            priority=message.priority,
+            correlation_id=message.correlation_id,
+            reply_to=message.reply_to,
+            message_id=message.message_id,
+            timestamp=message.timestamp,
+            type=message.type,
+            user_id=message.user_id,
+            app_id=message.app_id,
+        ),
+        routing_key=routing_key,
+    )
+
+
+async def park(
+    channel: aio_pika.abc.AbstractChannel,
+    message: aio_pika.abc.AbstractIncomingMessage,
+    *,
+    queue_name: str,
+    voting_id: str,
+    exc: BaseException,
+) -> bool:
+    """Moves a failed message to a retry queue or to the dead-letter queue.
+
+    Returns True if the message will be retried. The caller acks the
+    original message afterwards.
+    """
+    headers = dict(message.headers or {})
+    retries = int(headers.get(RETRY_COUNT_HEADER, 0))
+    if is_retryable(exc) and retries < config.RABBIT_MQ_RETRY_BUDGET:
+        logger.warning(
+            f"Retrying message from {queue_name} in {retry_delay(retries)} "
+            f"(attempt {retries + 1}): {exc!r}"
+        )
+        await _republish(
+            channel,
+            message,
+            headers={**headers, RETRY_COUNT_HEADER: retries + 1},
+            routing_key=retry_queue_name(queue_name, retries),
+        )
+        return True
+
+    logger.error(
+        f"Dead-lettering message from {queue_name} after {retries} retries: {exc!r}"
+    )
+    await _republish(
+        channel,
+        message,
+        headers={
+            **headers,
+            RETRY_COUNT_HEADER: retries,
+            ORIGINAL_QUEUE_HEADER: queue_name,
+            ERROR_HEADER: repr(exc),
+        },
+        routing_key=dead_letter_queue_name(voting_id),
+    )
+    return False
+
+
+async def _get_dead_letters(
+    channel: aio_pika.abc.AbstractChannel, voting_id: str, limit: int
+) -> list[aio_pika.abc.AbstractIncomingMessage]:
+    queue = await channel.get_queue(dead_letter_queue_name(voting_id), ensure=False)
+    messages = []
+    while len(messages) < limit:
+        message = await queue.get(fail=False)
+        if message is None:
+            break
+        messages.append(message)
+    return messages
+
+
+def _describe(message: aio_pika.abc.AbstractIncomingMessage) -> dict[str, Any]:
+    headers = message.headers or {}
+    return {
+        "body": message.body.decode("utf-8", errors="replace"),
+        "original_queue": headers.get(ORIGINAL_QUEUE_HEADER),
+        "retries": headers.get(RETRY_COUNT_HEADER),
+        "error": headers.get(ERROR_HEADER),
+    }
+
+
+async def peek(
+    connection: aio_pika.abc.AbstractConnection, voting_id: str, limit: int
+) -> list[dict[str, Any]]:
+    """Returns up to `limit` dead-lettered messages, leaving them in the queue."""
+    async with connection.channel() as channel:
+        messages = await _get_dead_letters(channel, voting_id, limit)
+        for message in messages:
+            await message.nack(requeue=True)
+    return [_describe(message) for message in messages]
+
+
+async def replay(
+    connection: aio_pika.abc.AbstractConnection, voting_id: str, limit: int
+) -> int:
+    """Returns up to `limit` dead-lettered messages to their source queues
+    with a fresh retry budget."""
+    async with connection.channel() as channel:
+        messages = await _get_dead_letters(channel, voting_id, limit)
+        replayed = 0
+        for message in messages:
+            headers = dict(message.headers or {})
+            original_queue = headers.pop(ORIGINAL_QUEUE_HEADER, None)
+            if original_queue is None:
+                logger.warning(
+                    f"Dead-lettered message of {voting_id} has no original queue"
+                )
+                await message.nack(requeue=True)
+                continue
+            headers.pop(RETRY_COUNT_HEADER, None)
+            headers.pop(ERROR_HEADER, None)
+            await _republish(
+                channel, message, headers=headers, routing_key=original_queue
+            )
+            await message.ack()
+            replayed += 1
+    logger.info(f"Replayed {replayed} dead-lettered messages of {voting_id}")
+    return replayed
@@ -0,0 +1,128 @@
+import asyncio
+import dataclasses
+import datetime
+from typing import Any
+
+import aiohttp
+import pytest
+
+import config
+import dead_letters
+
+
+@dataclasses.dataclass
+class _Message:
+    body: bytes = b"vote"
+    headers: dict[str, Any] = dataclasses.field(default_factory=dict)
+    content_type: str | None = None
+    content_encoding: str | None = None
+    priority: int | None = None
+    correlation_id: str | None = None
+    reply_to: str | None = None
+    message_id: str | None = None
+    timestamp: datetime.datetime | None = None
+    type: str | None = None
+    user_id: str | None = None
+    app_id: str | None = None
+
+
+class _RecordingExchange:
+    def __init__(self):
+        self.published = []
+        self.messages = []
+
+    async def publish(self, message, routing_key):
+        self.published.append((routing_key, message.headers))
+        self.messages.append(message)
+
+
+@dataclasses.dataclass
+class _Channel:
+    default_exchange: _RecordingExchange = dataclasses.field(
+        default_factory=_RecordingExchange
+    )
+
+
+def _park(
+    message: _Message, exc: Exception, channel: _Channel | None = None
+) -> tuple[bool, list]:
+    channel = channel or _Channel()
+    retried = asyncio.run(
+        dead_letters.park(
+            channel, message, queue_name="mgik_queue-1", voting_id="v1", exc=exc
+        )
+    )
+    return retried, channel.default_exchange.published
+
+
+def _server_error() -> aiohttp.ClientResponseError:
+    return aiohttp.ClientResponseError(None, (), status=503)
+
+
+@pytest.mark.parametrize(
+    "exc, retryable",
+    [
+        (_server_error(), True),
+        (aiohttp.ClientResponseError(None, (), status=429), True),
+        (aiohttp.ClientResponseError(None, (), status=400), False),
+        (aiohttp.ClientConnectionError(), True),
+        (asyncio.TimeoutError(), True),
+        (ValueError("Got broken message"), False),
+    ],
+)
+def test_is_retryable(exc, retryable):
+    assert dead_letters.is_retryable(exc) == retryable
+
+
+def test_retry_delay_doubles_per_attempt():
+    base = datetime.timedelta(seconds=config.RABBIT_MQ_RETRY_BASE_DELAY_SECONDS)
+    assert [dead_letters.retry_delay(attempt) for attempt in range(3)] == [
+        base,
+        base * 2,
+        base * 4,
+    ]
+
+
+def test_park_retries_transient_errors_with_increasing_attempt():
+    retried, published = _park(
+        _Message(headers={dead_letters.RETRY_COUNT_HEADER: 1}), _server_error()
+    )
+    assert retried
+    assert published == [("mgik_queue-1.retry-1", {dead_letters.RETRY_COUNT_HEADER: 2})]
+
+
+def test_park_dead_letters_after_retry_budget():
+    retried, published = _park(
+        _Message(
+            headers={dead_letters.RETRY_COUNT_HEADER: config.RABBIT_MQ_RETRY_BUDGET}
+        ),
+        _server_error(),
+    )
+    assert not retried
+    [(routing_key, headers)] = published
+    assert routing_key == dead_letters.dead_letter_queue_name("v1")
+    assert headers[dead_letters.ORIGINAL_QUEUE_HEADER] == "mgik_queue-1"
+
+
+def test_park_dead_letters_permanent_errors_immediately():
+    retried, published = _park(_Message(), ValueError("Got broken message"))
+    assert not retried
+    [(routing_key, headers)] = published
+    assert routing_key == dead_letters.dead_letter_queue_name("v1")
+    assert headers[dead_letters.RETRY_COUNT_HEADER] == 0
+    assert "Got broken message" in headers[dead_letters.ERROR_HEADER]
+
+
+def test_park_keeps_message_properties():
+    published_at = datetime.datetime(2021, 9, 19, 12, 0, tzinfo=datetime.timezone.utc)
+    channel = _Channel()
+    _park(
+        _Message(message_id="vote-1", timestamp=published_at, app_id="mgik"),
+        _server_error(),
+        channel,
+    )
+    [message] = channel.default_exchange.messages
+    assert message.body == b"vote"
+    assert message.message_id == "vote-1"
+    assert message.timestamp == published_at
+    assert message.app_id == "mgik"
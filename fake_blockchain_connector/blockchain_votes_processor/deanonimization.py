@@ -14,6 +14,7 @@ import sqlalchemy.ext.asyncio
 import pandas as pd
 import nacl.public
 
+import ballot_store
 import blockchain_voting_client
 import finalize_voting
 
@@ -153,16 +154,11 @@ async def _get_group_id_from_mdm_cypher(*args, **kwargs):
 
 async def get_all_ballots(
     blockchain_client: blockchain_voting_client.BlockchainVotingClient,
-) -> list[blockchain_voting_client.Ballot]:
-    stored_ballots = await blockchain_client.stored_ballots_amount()
-    all_futures = []
-    for i in range(stored_ballots):
-        all_futures.append(blockchain_client.ballot_by_index(i))
-
-    ballots = []
-    for ballot in asyncio.as_completed(all_futures):
-        ballots.append(await ballot)
-    return ballots
+) -> ballot_store.BallotStore:
+    all_ballots = ballot_store.BallotStore()
+    async for ballot in blockchain_client.iter_ballots():
+        all_ballots.append(ballot)
+    return all_ballots
 
 
 def decrypt_with_sid(sid: str, *args) -> tuple[str, list[int] | None]:
@@ -170,8 +166,8 @@ def decrypt_with_sid(sid: str, *args) -> tuple[str, list[int] | None]:
 
 
 async def decrypt_all_ballots(
-    all_ballots: list[blockchain_voting_client.Ballot],
-    district_id_to_ballots_config: dict[int, schema_pb2.BallotConfig],
+    all_ballots: Iterable[blockchain_voting_client.Ballot],
+    district_id_to_ballot_rules: dict[int, finalize_voting.BallotRules],
     re_encryption_private_key: nacl.public.PrivateKey,
     first_layer_private_key: nacl.public.PrivateKey,
 ) -> AsyncIterable[tuple[str, list[int] | None]]:
@@ -185,7 +181,7 @@ async def decrypt_all_ballots(
                     decrypt_with_sid,
                     ballot.sid,
                     ballot,
-                    district_id_to_ballots_config,
+                    district_id_to_ballot_rules,
                     re_encryption_private_key,
                     first_layer_private_key,
                 )
@@ -325,14 +321,14 @@ async def deanonimize_all_users(
         get_all_ballots(blockchain_client),
     )
 
-    district_id_to_ballots_config = (
-        finalize_voting.ballots_config_to_district_to_ballot_config(ballots_config)
+    district_id_to_ballot_rules = (
+        finalize_voting.ballots_config_to_district_to_ballot_rules(ballots_config)
     )
     all_ballots_decrypted = [
         {"sid": sid, "real_decrypted_result": result}
         async for sid, result in decrypt_all_ballots(
             all_ballots,
-            district_id_to_ballots_config,
+            district_id_to_ballot_rules,
             re_encryption_private_key,
             first_layer_private_key,
         )
@@ -341,7 +337,7 @@ async def deanonimize_all_users(
 
     p_ballot_df = pd.DataFrame(all_p_ballot_rows)
     sudir_df = pd.DataFrame(all_sudir_rows)
-    ballots_df = pd.DataFrame(all_ballots)
+    ballots_df = pd.DataFrame(all_ballots.to_columns())
     deanonimized_ballots = (
         p_ballot_df.merge(
             sudir_df,
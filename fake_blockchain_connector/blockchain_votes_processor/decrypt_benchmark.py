@@ -0,0 +1,117 @@
+"""Measures finalization decryption throughput in ballots/sec per core.
+
+Compares submitting one Ballot per task (with the ballots config and keys
+pickled every time) against chunks of raw encrypted choices handled by
+workers initialized once with the keys and ballots config.
+
+Usage: python decrypt_benchmark.py --ballots 20000 --workers 1 2 4
+"""
+
+import argparse
+import asyncio
+import concurrent.futures
+import time
+
+import finalize_voting
+import synthetic_ballots
+
+
+async def _per_ballot(
+    election: synthetic_ballots.SyntheticElection, workers: int
+) -> list[list[int] | None]:
+    district_id_to_ballot_rules = (
+        finalize_voting.ballots_config_to_district_to_ballot_rules(
+            election.ballots_config
+        )
+    )
+    loop = asyncio.get_running_loop()
+    with concurrent.futures.ProcessPoolExecutor(max_workers=workers) as executor:
+        return await asyncio.gather(
+            *(
+                loop.run_in_executor(
+                    executor,
+                    finalize_voting.decrypt_and_verify_validity,
+                    ballot,
+                    district_id_to_ballot_rules,
+                    election.re_encryption_private_key,
+                    election.first_layer_private_key,
+                )
+                for ballot in election.ballots
+            )
+        )
+
+
+async def _chunked(
+    election: synthetic_ballots.SyntheticElection, workers: int, chunk_size: int
+) -> list[list[int] | None]:
+    loop = asyncio.get_running_loop()
+    with finalize_voting.create_decrypt_executor(
+        ballots_config=election.ballots_config,
+        re_encryption_private_key=election.re_encryption_private_key,
+        first_layer_private_key=election.first_layer_private_key,
+        decrypt_workers=workers,
+    ) as executor:
+        raw_choices = [
+            finalize_voting.ballot_to_raw_encrypted_choice(ballot)
+            for ballot in election.ballots
+        ]
+        chunks = await asyncio.gather(
+            *(
+                loop.run_in_executor(
+                    executor,
+                    finalize_voting.decrypt_and_verify_validity_chunk,
+                    raw_choices[chunk_start : chunk_start + chunk_size],
+                )
+                for chunk_start in range(0, len(raw_choices), chunk_size)
+            )
+        )
+    return [result for chunk, unused_failures in chunks for result in chunk]
+
+
+def _report(
+    name: str,
+    election: synthetic_ballots.SyntheticElection,
+    workers: int,
+    elapsed: float,
+    results: list[list[int] | None],
+):
+    if results != election.expected_choices:
+        raise ValueError(f"{name} produced unexpected decryption results")
+    ballots_per_sec = len(election.ballots) / elapsed
+    print(
+        f"{name:<24} workers={workers:<3} {ballots_per_sec:10.1f} ballots/sec "
+        f"{ballots_per_sec / workers:10.1f} ballots/sec/core"
+    )
+
+
+async def main(args: argparse.Namespace):
+    election = synthetic_ballots.generate_election(
+        num_ballots=args.ballots,
+        num_districts=args.districts,
+        num_candidates=args.candidates,
+    )
+    for workers in args.workers:
+        start = time.perf_counter()
+        results = await _per_ballot(election, workers)
+        _report("per ballot", election, workers, time.perf_counter() - start, results)
+
+        for chunk_size in args.chunk_sizes:
+            start = time.perf_counter()
+            results = await _chunked(election, workers, chunk_size)
+            _report(
+                f"chunked (size {chunk_size})",
+                election,
+                workers,
+                time.perf_counter() - start,
+                results,
+            )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--ballots", type=int, default=10000)
+    parser.add_argument("--districts", type=int, default=50)
+    parser.add_argument("--candidates", type=int, default=10)
+    parser.add_argument("--workers", type=int, nargs="+", default=[1, 2])
+    parser.add_argument("--chunk-sizes", type=int, nargs="+", default=[16, 64, 256])
+    asyncio.run(main(parser.parse_args()))
@@ -0,0 +1,139 @@
+import asyncio
+import dataclasses
+import datetime
+import enum
+import logging
+import uuid
+from typing import Any, Awaitable, Callable, Self
+
+import finalize_voting
+
+logger = logging.getLogger(__name__)
+
+
+class JobState(enum.Enum):
+    RUNNING = "running"
+    SUCCEEDED = "succeeded"
+    FAILED = "failed"
+    # The voting is finalized, but its results in the blockchain differ from
+    # the local tally.
+    TALLY_MISMATCH = "tally_mismatch"
+    CANCELLED = "cancelled"
+
+
+@dataclasses.dataclass
+class DecryptionJob:
+    job_id: str
+    voting_id: str
+    counters: finalize_voting.PipelineCounters
+    state: JobState = JobState.RUNNING
+    error: str | None = None
+    tally_mismatches: list[str] = dataclasses.field(default_factory=list)
+    started_at: datetime.datetime = dataclasses.field(
+        default_factory=lambda: datetime.datetime.now(datetime.timezone.utc)
+    )
+    finished_at: datetime.datetime | None = None
+    task: asyncio.Task | None = dataclasses.field(default=None, repr=False)
+
+    def is_running(self) -> bool:
+        return self.state == JobState.RUNNING
+
+    def to_json(self) -> dict[str, Any]:
+        return {
+            "job_id": self.job_id,
+            "voting_id": self.voting_id,
+            "state": self.state.value,
+            "error": self.error,
+            "tally_mismatches": self.tally_mismatches,
+            "started_at": self.started_at.isoformat(),
+            "finished_at": (
+                None if self.finished_at is None else self.finished_at.isoformat()
+            ),
+            "progress": self.counters.to_json(),
+        }
+
+
+# Returns the differences between the voting results and the local tally.
+DecryptionRun = Callable[
+    [finalize_voting.PipelineCounters], Awaitable[list[str] | None]
+]
+
+
+class DecryptionJobManager:
+    """Runs decryptions in the background, at most one per voting."""
+
+    def __init__(self):
+        self._jobs: dict[str, DecryptionJob] = {}
+        self._latest_job_ids: dict[str, str] = {}
+
+    def latest(self, voting_id: str) -> DecryptionJob | None:
+        job_id = self._latest_job_ids.get(voting_id)
+        return None if job_id is None else self._jobs[job_id]
+
+    def get(self, job_id: str) -> DecryptionJob:
+        job = self._jobs.get(job_id)
+        if job is None:
+            raise ValueError(f"Unknown decryption job {job_id}")
+        return job
+
+    def is_running(self, voting_id: str) -> bool:
+        job = self.latest(voting_id)
+        return job is not None and job.is_running()
+
+    def start(self, voting_id: str, run: DecryptionRun) -> DecryptionJob:
+        if self.is_running(voting_id):
+            raise ValueError(f"Decryption of {voting_id} is already running")
+
+        job = DecryptionJob(
+            job_id=uuid.uuid4().hex,
+            voting_id=voting_id,
+            counters=finalize_voting.PipelineCounters(),
+        )
+        self._jobs[job.job_id] = job
+        self._latest_job_ids[voting_id] = job.job_id
+        job.task = asyncio.create_task(self._run(job, run))
+        logger.info(f"Started decryption job {job.job_id} for {voting_id}")
+        return job
+
+    async def _run(self, job: DecryptionJob, run: DecryptionRun):
+        try:
+            tally_mismatches = await run(job.counters)
+        except asyncio.CancelledError:
+            job.state = JobState.CANCELLED
+            logger.info(f"Decryption job {job.job_id} is cancelled")
+            raise
+        except Exception as e:
+            job.state = JobState.FAILED
+            job.error = str(e)
+            logger.exception(f"Decryption job {job.job_id} failed")
+        else:
+            if tally_mismatches:
+                job.state = JobState.TALLY_MISMATCH
+                job.error = (
+                    "Voting results in the blockchain differ from the local tally"
+                )
+                job.tally_mismatches = tally_mismatches
+                logger.error(f"Decryption job {job.job_id}: {job.error}")
+            else:
+                job.state = JobState.SUCCEEDED
+                logger.info(f"Decryption job {job.job_id} succeeded")
+        finally:
+            job.finished_at = datetime.datetime.now(datetime.timezone.utc)
+
+    async def cancel(self, job_id: str) -> DecryptionJob:
+        job = self.get(job_id)
+        if job.is_running():
+            job.task.cancel()
+            # Let the pipeline stop and flush its checkpoint.
+            await asyncio.gather(job.task, return_exceptions=True)
+        return job
+
+    async def close(self):
+        for job in list(self._jobs.values()):
+            await self.cancel(job.job_id)
+
+    @classmethod
+    def instance(cls) -> Self:
+        if not hasattr(cls, "_instance"):
+            cls._instance = cls()
+        return cls._instance
@@ -0,0 +1,77 @@
+import asyncio
+
+import pytest
+
+import decryption_jobs
+
+
+async def _publish_ballots(counters, num_ballots: int = 3):
+    counters.total = num_ballots
+    for _ in range(num_ballots):
+        counters.published += 1
+        await asyncio.sleep(0)
+
+
+async def _run_to_completion(run) -> decryption_jobs.DecryptionJob:
+    manager = decryption_jobs.DecryptionJobManager()
+    job = manager.start("voting", run)
+    await job.task
+    return job
+
+
+def test_job_reports_progress_when_succeeded():
+    job = asyncio.run(_run_to_completion(_publish_ballots))
+    assert job.state == decryption_jobs.JobState.SUCCEEDED
+    progress = job.to_json()["progress"]
+    assert progress["total"] == progress["published"] == 3
+    assert progress["eta_seconds"] == 0
+    assert job.finished_at is not None
+
+
+def test_job_keeps_error_when_failed():
+    async def fail(unused_counters):
+        raise ValueError("Voting is not stopped")
+
+    job = asyncio.run(_run_to_completion(fail))
+    assert job.state == decryption_jobs.JobState.FAILED
+    assert job.error == "Voting is not stopped"
+
+
+async def _start_twice_and_cancel() -> decryption_jobs.DecryptionJob:
+    manager = decryption_jobs.DecryptionJobManager()
+    started = asyncio.Event()
+
+    async def run_forever(unused_counters):
+        started.set()
+        await asyncio.Event().wait()
+
+    job = manager.start("voting", run_forever)
+    await started.wait()
+    with pytest.raises(ValueError):
+        manager.start("voting", run_forever)
+    # Other votings are not blocked.
+    other = manager.start("other_voting", _publish_ballots)
+    await other.task
+
+    await manager.cancel(job.job_id)
+    assert not manager.is_running("voting")
+    assert manager.latest("voting") is job
+    return job
+
+
+def test_one_job_per_voting_and_cancellation():
+    job = asyncio.run(_start_twice_and_cancel())
+    assert job.state == decryption_jobs.JobState.CANCELLED
+
+
+def test_job_reports_tally_mismatches():
+    async def finalize_with_mismatch(unused_counters):
+        return ["District 1 candidate 2: expected 3 votes, got 4"]
+
+    job = asyncio.run(_run_to_completion(finalize_with_mismatch))
+    assert job.state == decryption_jobs.JobState.TALLY_MISMATCH
+    assert not job.is_running()
+    assert job.to_json()["tally_mismatches"] == [
+        "District 1 candidate 2: expected 3 votes, got 4"
+    ]
+    assert "differ from the local tally" in job.error
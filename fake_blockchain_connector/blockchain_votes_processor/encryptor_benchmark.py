@@ -0,0 +1,71 @@
+"""Measures ingest decryption throughput in messages/sec against batch size.
+
+Runs a local stand-in encryptor with a fixed per-request latency and
+decrypts messages with `concurrency` of them in flight at a time, the way
+the queue consumers do. Batch size 1 means one request per message.
+
+Usage: python encryptor_benchmark.py --messages 5000 --batch-sizes 1 8 32 128
+"""
+
+import argparse
+import asyncio
+import datetime
+import time
+
+import aiohttp
+
+import encryptor_client
+import stand_in_services
+
+
+async def _run(
+    url: str, messages: list[str], concurrency: int, batch_size: int, max_wait: float
+) -> float:
+    async with aiohttp.ClientSession(base_url=url) as session:
+        batcher = encryptor_client.DecryptBatcher(
+            session,
+            batch_path="/api/encryption/decryptBatch",
+            max_batch_size=batch_size,
+            max_wait=datetime.timedelta(seconds=max_wait),
+        )
+        slots = asyncio.Semaphore(concurrency)
+
+        async def decrypt(message: str):
+            async with slots:
+                result = await batcher.decrypt(message)
+            if result["data"]["result"] is None:
+                raise ValueError(f"Message {message} was not decrypted")
+
+        start = time.perf_counter()
+        await asyncio.gather(*(decrypt(message) for message in messages))
+        elapsed = time.perf_counter() - start
+        await batcher.close()
+    return elapsed
+
+
+async def main(args: argparse.Namespace):
+    encryptor = stand_in_services.StandInEncryptor(
+        latency=datetime.timedelta(milliseconds=args.latency_ms)
+    )
+    messages = [
+        stand_in_services.encrypt(f'{{"vote": {i}}}') for i in range(args.messages)
+    ]
+    async with stand_in_services.serve(encryptor.app) as url:
+        for batch_size in args.batch_sizes:
+            elapsed = await _run(
+                url, messages, args.concurrency, batch_size, args.max_wait_ms / 1000
+            )
+            print(
+                f"batch size {batch_size:<5} "
+                f"{len(messages) / elapsed:10.1f} messages/sec"
+            )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--messages", type=int, default=5000)
+    parser.add_argument("--concurrency", type=int, default=256)
+    parser.add_argument("--latency-ms", type=float, default=2)
+    parser.add_argument("--max-wait-ms", type=float, default=5)
+    parser.add_argument("--batch-sizes", type=int, nargs="+", default=[1, 8, 32, 128])
+    asyncio.run(main(parser.parse_args()))
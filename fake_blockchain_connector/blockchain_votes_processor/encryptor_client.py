@@ -0,0 +1,137 @@
+import asyncio
+import datetime
+import logging
+from typing import Any
+
+import aiohttp
+
+logger = logging.getLogger(__name__)
+
+_DECRYPT_PATH = "/api/encryption/decrypt"
+
+
+class DecryptBatcher:
+    """Decrypts ingest messages with the encryptor in micro-batches.
+
+    Messages are collected until `max_batch_size` of them are waiting or the
+    oldest one waited for `max_wait`, then the whole batch is sent to
+    `batch_path` in one POST. The batch endpoint takes `{"data": [...]}` and
+    returns `{"data": {"results": [...]}}` in the same order, with null for
+    messages it cannot decrypt.
+
+    If `batch_path` is None or the encryptor answers 404/405 on it, every
+    message is decrypted with its own `/api/encryption/decrypt` call. Each
+    caller gets the response of the single-message endpoint either way.
+    """
+
+    def __init__(
+        self,
+        session: aiohttp.ClientSession,
+        *,
+        batch_path: str | None,
+        max_batch_size: int = 32,
+        max_wait: datetime.timedelta = datetime.timedelta(milliseconds=5),
+    ):
+        self._session = session
+        self._batch_path = batch_path
+        self._max_batch_size = max_batch_size
+        self._max_wait = max_wait
+        self._batch_supported = batch_path is not None
+        self._pending: list[tuple[str, asyncio.Future]] = []
+        self._flush_handle: asyncio.TimerHandle | None = None
+        self._batch_tasks: set[asyncio.Task] = set()
+
+    @property
+    def batch_supported(self) -> bool:
+        return self._batch_supported
+
+    async def decrypt(self, message_str: str) -> dict[str, Any]:
+        if not self._batch_supported or self._max_batch_size <= 1:
+            return await self._decrypt_single(message_str)
+
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        self._pending.append((message_str, future))
+        if len(self._pending) >= self._max_batch_size:
+            self._flush()
+        elif self._flush_handle is None:
+            self._flush_handle = loop.call_later(
+                self._max_wait.total_seconds(), self._flush
+            )
+        return await future
+
+    def _flush(self):
+        if self._flush_handle is not None:
+            self._flush_handle.cancel()
+            self._flush_handle = None
+        batch, self._pending = self._pending, []
+        if not batch:
+            return
+        task = asyncio.create_task(self._decrypt_batch(batch))
+        self._batch_tasks.add(task)
+        task.add_done_callback(self._batch_tasks.discard)
+
+    async def _decrypt_single(self, message_str: str) -> dict[str, Any]:
+        async with self._session.get(
+            _DECRYPT_PATH,
+            params={"data[base64body]": message_str},
+            raise_for_status=True,
+        ) as resp:
+            return await resp.json()
+
+    async def _post_batch(self, messages: list[str]) -> list[str | None]:
+        async with self._session.post(
+            self._batch_path, json={"data": messages}, raise_for_status=True
+        ) as resp:
+            results = (await resp.json())["data"]["results"]
+        if len(results) != len(messages):
+            raise ValueError(
+                f"Encryptor returned {len(results)} results for {len(messages)} messages"
+            )
+        return results
+
+    async def _decrypt_batch(self, batch: list[tuple[str, asyncio.Future]]):
+        messages = [message_str for message_str, _ in batch]
+        if self._batch_supported:
+            try:
+                results = await self._post_batch(messages)
+            except aiohttp.ClientResponseError as e:
+                if e.status not in (404, 405):
+                    self._fail(batch, e)
+                    return
+                logger.warning(
+                    f"Encryptor does not support {self._batch_path}, "
+                    "falling back to single message decryption"
+                )
+                self._batch_supported = False
+            except Exception as e:
+                self._fail(batch, e)
+                return
+            else:
+                for (_, future), result in zip(batch, results):
+                    if not future.done():
+                        future.set_result({"data": {"result": result}})
+                return
+
+        results = await asyncio.gather(
+            *(self._decrypt_single(message_str) for message_str in messages),
+            return_exceptions=True,
+        )
+        for (_, future), result in zip(batch, results):
+            if future.done():
+                continue
+            if isinstance(result, BaseException):
+                future.set_exception(result)
+            else:
+                future.set_result(result)
+
+    @staticmethod
+    def _fail(batch: list[tuple[str, asyncio.Future]], exc: Exception):
+        for _, future in batch:
+            if not future.done():
+                future.set_exception(exc)
+
+    async def close(self):
+        self._flush()
+        if self._batch_tasks:
+            await asyncio.gather(*self._batch_tasks, return_exceptions=True)
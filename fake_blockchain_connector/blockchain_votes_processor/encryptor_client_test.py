@@ -0,0 +1,91 @@
+import asyncio
+import datetime
+
+import aiohttp
+import aiohttp.web
+import pytest
+
+import encryptor_client
+import stand_in_services
+
+
+async def _decrypt_all(
+    encryptor: stand_in_services.StandInEncryptor,
+    messages: list[str],
+    **batcher_kwargs,
+) -> tuple[list[dict], encryptor_client.DecryptBatcher]:
+    async with stand_in_services.serve(encryptor.app) as url:
+        async with aiohttp.ClientSession(base_url=url) as session:
+            batcher = encryptor_client.DecryptBatcher(session, **batcher_kwargs)
+            results = await asyncio.gather(
+                *(batcher.decrypt(message) for message in messages)
+            )
+            await batcher.close()
+    return results, batcher
+
+
+def _expected(plain_messages: list[str]) -> list[dict]:
+    return [{"data": {"result": message}} for message in plain_messages]
+
+
+def test_decrypt_batcher_groups_messages_into_batches():
+    plain_messages = [f'{{"vote": {i}}}' for i in range(10)]
+    encryptor = stand_in_services.StandInEncryptor()
+    results, batcher = asyncio.run(
+        _decrypt_all(
+            encryptor,
+            [stand_in_services.encrypt(message) for message in plain_messages],
+            batch_path="/api/encryption/decryptBatch",
+            max_batch_size=4,
+        )
+    )
+    assert results == _expected(plain_messages)
+    assert batcher.batch_supported
+    assert encryptor.batch_sizes == [4, 4, 2]
+    assert encryptor.single_requests == 0
+
+
+def test_decrypt_batcher_marks_broken_messages_in_batch():
+    encryptor = stand_in_services.StandInEncryptor()
+    results, _ = asyncio.run(
+        _decrypt_all(
+            encryptor,
+            [stand_in_services.encrypt("ok"), "not base64!"],
+            batch_path="/api/encryption/decryptBatch",
+        )
+    )
+    assert results == [{"data": {"result": "ok"}}, {"data": {"result": None}}]
+
+
+def test_decrypt_batcher_falls_back_to_single_calls():
+    plain_messages = [f'{{"vote": {i}}}' for i in range(5)]
+    encryptor = stand_in_services.StandInEncryptor(batch_supported=False)
+    results, batcher = asyncio.run(
+        _decrypt_all(
+            encryptor,
+            [stand_in_services.encrypt(message) for message in plain_messages],
+            batch_path="/api/encryption/decryptBatch",
+            max_wait=datetime.timedelta(milliseconds=1),
+        )
+    )
+    assert results == _expected(plain_messages)
+    assert not batcher.batch_supported
+    assert encryptor.single_requests == len(plain_messages)
+
+
+def test_decrypt_batcher_fails_whole_batch_on_server_error():
+    encryptor = stand_in_services.StandInEncryptor(batch_supported=False)
+
+    async def broken_batch(unused_request):
+        raise aiohttp.web.HTTPInternalServerError()
+
+    encryptor.app.router.add_post("/api/encryption/decryptBatch", broken_batch)
+    with pytest.raises(aiohttp.ClientResponseError):
+        asyncio.run(
+            _decrypt_all(
+                encryptor,
+                [stand_in_services.encrypt("ok")] * 2,
+                batch_path="/api/encryption/decryptBatch",
+            )
+        )
+    assert encryptor.single_requests == 0
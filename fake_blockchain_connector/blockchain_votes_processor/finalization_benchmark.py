@@ -0,0 +1,398 @@
+"""Measures finalization throughput per phase on a synthetic election.
+
+Generates an election of real two-layer sealed-box ballots, with a share of
+invalid ones, and serves it from the votings service simulator. Every phase of
+finalization is then run on its own against a fresh simulator, and timed:
+
+    fetch     iter_ballots over all stored ballots
+    decrypt   both decryption layers in the decryption process pool
+    validate  checking decoded choices against the ballots config, a chunk at
+              a time
+    publish   TxPublishDecryptedBallot of every ballot until committed
+    finalize  TxFinalizeVoting, which tallies the results
+
+followed by `pipeline`, the whole of finalize_voting, where the phases overlap.
+The best of `--repeat` runs of each phase is kept.
+
+Results are stored as JSON with `--output`. With `--compare`, throughput is
+compared with an earlier results file and the script fails when a phase got
+slower by more than `--tolerance`.
+
+Usage: python finalization_benchmark.py --ballots 20000 --output results.json
+       python finalization_benchmark.py --ballots 20000 --compare results.json
+"""
+
+import argparse
+import asyncio
+import datetime
+import json
+import os
+import platform
+import sys
+import time
+import urllib.parse
+from typing import Any
+
+import exonum_client.crypto
+import numpy as np
+
+import blockchain_voting_client
+import choices_decoder
+import config
+import finalize_voting
+import re_encrypt_message
+import stand_in_services
+import synthetic_ballots
+import votings_service_simulator
+
+_PHASES = ("fetch", "decrypt", "validate", "publish", "finalize", "pipeline")
+
+
+def _decrypt_chunk(
+    encrypted_choices: list[finalize_voting.RawEncryptedChoice],
+) -> choices_decoder.DecodedChoices:
+    """Only the decryption part of decrypt_and_verify_validity_chunk."""
+    state = finalize_voting._decrypt_worker_state
+    return re_encrypt_message.decrypt_re_encrypted_choices(
+        (
+            (encrypted_message, nonce, public_key)
+            for unused_district_id, encrypted_message, nonce, public_key in encrypted_choices
+        ),
+        re_encryption_private_key=state.re_encryption_private_key,
+        first_layer_private_key=state.first_layer_private_key,
+    )
+
+
+class _PhaseRun:
+    """One run of every phase against its own simulator."""
+
+    def __init__(
+        self,
+        election: synthetic_ballots.SyntheticElection,
+        args: argparse.Namespace,
+    ):
+        self._election = election
+        self._args = args
+        self.seconds: dict[str, float] = {}
+
+    def _simulator(self) -> votings_service_simulator.VotingsServiceSimulator:
+        return votings_service_simulator.VotingsServiceSimulator(
+            self._election,
+            voting_id="benchmark",
+            commit_delay=datetime.timedelta(milliseconds=self._args.commit_delay_ms),
+            with_range_endpoint=self._args.range_endpoint,
+        )
+
+    def _client(self, base_url: str) -> blockchain_voting_client.BlockchainVotingClient:
+        url = urllib.parse.urlsplit(base_url)
+        service_key_pair = exonum_client.crypto.KeyPair.generate()
+        return blockchain_voting_client.BlockchainVotingClient(
+            voting_id="benchmark",
+            url=url.hostname,
+            public_api_port=url.port,
+            private_api_port=url.port,
+            service_api_private_key_hex=service_key_pair.secret_key.hex(),
+            service_api_public_key_hex=service_key_pair.public_key.hex(),
+        )
+
+    async def _fetch(
+        self, client: blockchain_voting_client.BlockchainVotingClient
+    ) -> list[blockchain_voting_client.Ballot]:
+        started_at = time.perf_counter()
+        ballots = [
+            ballot
+            async for ballot in client.iter_ballots(
+                batch_size=self._args.fetch_batch_size,
+                max_in_flight=self._args.fetch_max_in_flight,
+            )
+        ]
+        self.seconds["fetch"] = time.perf_counter() - started_at
+        return ballots
+
+    async def _decrypt(
+        self, ballots: list[blockchain_voting_client.Ballot]
+    ) -> list[choices_decoder.DecodedChoices]:
+        raw_choices = [
+            finalize_voting.ballot_to_raw_encrypted_choice(ballot) for ballot in ballots
+        ]
+        chunk_size = self._args.decrypt_chunk_size
+        loop = asyncio.get_running_loop()
+        with finalize_voting.create_decrypt_executor(
+            ballots_config=self._election.ballots_config,
+            re_encryption_private_key=self._election.re_encryption_private_key,
+            first_layer_private_key=self._election.first_layer_private_key,
+            decrypt_workers=self._args.workers,
+        ) as executor:
+            started_at = time.perf_counter()
+            chunks = await asyncio.gather(
+                *(
+                    loop.run_in_executor(
+                        executor,
+                        _decrypt_chunk,
+                        raw_choices[chunk_start : chunk_start + chunk_size],
+                    )
+                    for chunk_start in range(0, len(raw_choices), chunk_size)
+                )
+            )
+            self.seconds["decrypt"] = time.perf_counter() - started_at
+        return chunks
+
+    def _validate(
+        self,
+        ballots: list[blockchain_voting_client.Ballot],
+        decoded_chunks: list[choices_decoder.DecodedChoices],
+    ) -> list[list[int] | None]:
+        ballot_rules_table = finalize_voting.BallotRulesTable.from_ballot_rules(
+            finalize_voting.ballots_config_to_district_to_ballot_rules(
+                self._election.ballots_config
+            )
+        )
+        chunk_size = self._args.decrypt_chunk_size
+        district_ids = np.array(
+            [ballot.district_id for ballot in ballots], dtype=np.int64
+        )
+        started_at = time.perf_counter()
+        is_valid = [
+            decoded.is_decoded
+            & finalize_voting.verify_validity_batch(
+                choices=decoded.choices,
+                choices_offsets=decoded.offsets,
+                district_ids=district_ids[chunk_start : chunk_start + chunk_size],
+                ballot_rules_table=ballot_rules_table,
+            )
+            for chunk_start, decoded in zip(
+                range(0, len(ballots), chunk_size), decoded_chunks
+            )
+        ]
+        self.seconds["validate"] = time.perf_counter() - started_at
+
+        validated = [
+            decoded[index] if ballot_is_valid else None
+            for decoded, chunk_is_valid in zip(decoded_chunks, is_valid)
+            for index, ballot_is_valid in enumerate(chunk_is_valid.tolist())
+        ]
+        if validated != self._election.expected_choices:
+            raise ValueError("Decryption produced unexpected results")
+        return validated
+
+    async def _publish(
+        self,
+        client: blockchain_voting_client.BlockchainVotingClient,
+        validated: list[list[int] | None],
+    ):
+        results = iter(enumerate(validated))
+
+        async def _publish_task(submitter):
+            for ballot_index, decrypted_ballot in results:
+                await client.publish_decrypted_ballot(
+                    ballot_index=ballot_index,
+                    decrypted_choices=decrypted_ballot,
+                    is_invalid=decrypted_ballot is None,
+                    submitter=submitter,
+                )
+
+        started_at = time.perf_counter()
+        async with blockchain_voting_client.TransactionSubmitter(
+            client, max_in_flight=self._args.publish_concurrency
+        ) as submitter:
+            await asyncio.gather(
+                *(
+                    _publish_task(submitter)
+                    for _ in range(self._args.publish_concurrency)
+                )
+            )
+        self.seconds["publish"] = time.perf_counter() - started_at
+
+    async def _finalize(self, client: blockchain_voting_client.BlockchainVotingClient):
+        started_at = time.perf_counter()
+        await client.finalize_voting()
+        self.seconds["finalize"] = time.perf_counter() - started_at
+
+    async def _pipeline(self):
+        async with stand_in_services.serve(self._simulator().app) as base_url:
+            async with self._client(base_url) as client:
+                started_at = time.perf_counter()
+                mismatches = await finalize_voting.finalize_voting(
+                    voting_client=client,
+                    re_encryption_private_key=self._election.re_encryption_private_key,
+                    first_layer_private_key=self._election.first_layer_private_key,
+                    decrypt_workers=self._args.workers,
+                    decrypt_chunk_size=self._args.decrypt_chunk_size,
+                    fetch_batch_size=self._args.fetch_batch_size,
+                    fetch_max_in_flight=self._args.fetch_max_in_flight,
+                    publish_concurrency=self._args.publish_concurrency,
+                )
+                self.seconds["pipeline"] = time.perf_counter() - started_at
+        if mismatches:
+            raise ValueError(f"Voting results mismatch: {mismatches}")
+
+    async def run(self):
+        async with stand_in_services.serve(self._simulator().app) as base_url:
+            async with self._client(base_url) as client:
+                await client.publish_decryption_key(
+                    self._election.first_layer_private_key
+                )
+                ballots = await self._fetch(client)
+                decoded_chunks = await self._decrypt(ballots)
+                validated = self._validate(ballots, decoded_chunks)
+                await self._publish(client, validated)
+                await self._finalize(client)
+        await self._pipeline()
+
+
+def _results(args: argparse.Namespace, runs: list[_PhaseRun]) -> dict[str, Any]:
+    phases = {}
+    for phase in _PHASES:
+        seconds = min(run.seconds[phase] for run in runs)
+        phases[phase] = {
+            "seconds": seconds,
+            # Finalization is a single transaction, its throughput is still
+            # per ballot, as it tallies all of them.
+            "ballots_per_second": args.ballots / seconds,
+        }
+    return {
+        "parameters": {
+            "ballots": args.ballots,
+            "districts": args.districts,
+            "candidates": args.candidates,
+            "max_choices": args.max_choices,
+            "invalid_share": args.invalid_share,
+            "seed": args.seed,
+            "workers": args.workers,
+            "decrypt_chunk_size": args.decrypt_chunk_size,
+            "fetch_batch_size": args.fetch_batch_size,
+            "fetch_max_in_flight": args.fetch_max_in_flight,
+            "publish_concurrency": args.publish_concurrency,
+            "commit_delay_ms": args.commit_delay_ms,
+            "range_endpoint": args.range_endpoint,
+        },
+        "machine": {
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "cpu_count": os.cpu_count(),
+        },
+        "created_at": datetime.datetime.now(datetime.timezone.utc).isoformat(),
+        "phases": phases,
+    }
+
+
+def compare(
+    baseline: dict[str, Any], current: dict[str, Any], tolerance: float
+) -> list[str]:
+    """Returns a description of every phase that got slower than the
+    baseline by more than `tolerance`, a share of the baseline throughput."""
+    regressions = []
+    for phase, baseline_phase in baseline["phases"].items():
+        current_phase = current["phases"].get(phase)
+        if current_phase is None:
+            continue
+        ratio = (
+            current_phase["ballots_per_second"] / baseline_phase["ballots_per_second"]
+        )
+        if ratio < 1 - tolerance:
+            regressions.append(
+                f"{phase}: {current_phase['ballots_per_second']:.1f} ballots/sec, "
+                f"baseline {baseline_phase['ballots_per_second']:.1f} "
+                f"({(1 - ratio) * 100:.1f}% slower)"
+            )
+    return regressions
+
+
+def _print_results(results: dict[str, Any], baseline: dict[str, Any] | None):
+    print(f"{'phase':<10} {'seconds':>10} {'ballots/sec':>14} {'vs baseline':>12}")
+    for phase, phase_results in results["phases"].items():
+        line = (
+            f"{phase:<10} {phase_results['seconds']:10.3f} "
+            f"{phase_results['ballots_per_second']:14.1f}"
+        )
+        if baseline is not None and phase in baseline["phases"]:
+            ratio = (
+                phase_results["ballots_per_second"]
+                / baseline["phases"][phase]["ballots_per_second"]
+            )
+            line += f" {ratio:11.2f}x"
+        print(line)
+
+
+async def main(args: argparse.Namespace) -> int:
+    # Forging needs its database, the benchmark measures honest finalization.
+    config.FORGING_DO_FORGING = False
+
+    baseline = None
+    if args.compare is not None:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+
+    print(f"Generating an election of {args.ballots} ballots")
+    election = synthetic_ballots.generate_election(
+        num_ballots=args.ballots,
+        num_districts=args.districts,
+        num_candidates=args.candidates,
+        max_choices=args.max_choices,
+        invalid_share=args.invalid_share,
+        seed=args.seed,
+    )
+
+    runs = []
+    for _ in range(args.repeat):
+        run = _PhaseRun(election, args)
+        await run.run()
+        runs.append(run)
+    results = _results(args, runs)
+
+    _print_results(results, baseline)
+    if args.output is not None:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=2)
+        print(f"Results are stored in {args.output}")
+
+    if baseline is None:
+        return 0
+    if baseline["parameters"] != results["parameters"]:
+        print(
+            "Warning: the baseline was run with different parameters: "
+            f"{baseline['parameters']}"
+        )
+    regressions = compare(baseline, results, args.tolerance)
+    if regressions:
+        print("Throughput regressions:\n" + "\n".join(regressions))
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter
+    )
+    parser.add_argument("--ballots", type=int, default=5000)
+    parser.add_argument("--districts", type=int, default=10)
+    parser.add_argument("--candidates", type=int, default=5)
+    parser.add_argument("--max-choices", type=int, default=1)
+    parser.add_argument("--invalid-share", type=float, default=0.05)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--workers", type=int, default=os.cpu_count())
+    parser.add_argument("--decrypt-chunk-size", type=int, default=256)
+    parser.add_argument("--fetch-batch-size", type=int, default=100)
+    parser.add_argument("--fetch-max-in-flight", type=int, default=8)
+    parser.add_argument("--publish-concurrency", type=int, default=64)
+    parser.add_argument(
+        "--commit-delay-ms",
+        type=float,
+        default=10,
+        help="How often the simulated chain commits a block",
+    )
+    parser.add_argument(
+        "--range-endpoint",
+        action="store_true",
+        help="Serve the ballots-by-index-range endpoint",
+    )
+    parser.add_argument("--repeat", type=int, default=1)
+    parser.add_argument("--output", help="Where to store the results as JSON")
+    parser.add_argument("--compare", help="Results JSON to compare with")
+    parser.add_argument(
+        "--tolerance",
+        type=float,
+        default=0.1,
+        help="Allowed throughput drop, as a share of the baseline",
+    )
+    sys.exit(asyncio.run(main(parser.parse_args())))
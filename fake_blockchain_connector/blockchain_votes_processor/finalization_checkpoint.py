@@ -0,0 +1,166 @@
+import heapq
+import json
+import logging
+import sqlite3
+from typing import Iterator
+
+logger = logging.getLogger(__name__)
+
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS finalization_progress (
+    voting_id TEXT PRIMARY KEY,
+    done_up_to INTEGER NOT NULL
+);
+CREATE TABLE IF NOT EXISTS decrypted_ballots (
+    voting_id TEXT NOT NULL,
+    ballot_index INTEGER NOT NULL,
+    district_id INTEGER NOT NULL,
+    decrypted_choices TEXT,
+    publish_tx_hash TEXT,
+    PRIMARY KEY (voting_id, ballot_index)
+);
+"""
+
+
+class FinalizationCheckpoint:
+    """Local record of finalization progress for a single voting.
+
+    Stores decryption results and publish tx hashes in SQLite so that a
+    restarted finalization skips the work that is already done. All ballots
+    with indices below `resume_position` are known to be published, so they
+    are not fetched again. Their district and choices are kept, including
+    those of ballots decrypted in the blockchain before, so that the local
+    tally still covers them.
+
+    The blockchain stays the source of truth: anything lost since the last
+    flush is redone, and ballots that are already decrypted in the
+    blockchain are skipped anyway.
+    """
+
+    def __init__(self, path: str, voting_id: str, flush_every: int = 1000):
+        self._voting_id = voting_id
+        self._flush_every = flush_every
+        self._connection = sqlite3.connect(path)
+        self._connection.execute("PRAGMA journal_mode=WAL")
+        self._connection.execute("PRAGMA synchronous=NORMAL")
+        self._connection.executescript(_SCHEMA)
+
+        row = self._connection.execute(
+            "SELECT done_up_to FROM finalization_progress WHERE voting_id = ?",
+            (voting_id,),
+        ).fetchone()
+        self._done_up_to = 0 if row is None else row[0]
+        self._done_above_watermark: list[int] = []
+
+        self._decrypted: dict[int, list[int] | None] = {}
+        for ballot_index, decrypted_choices_json in self._connection.execute(
+            "SELECT ballot_index, decrypted_choices FROM decrypted_ballots "
+            "WHERE voting_id = ? AND ballot_index >= ?",
+            (voting_id, self._done_up_to),
+        ):
+            self._decrypted[ballot_index] = json.loads(decrypted_choices_json)
+
+        self._pending_writes = 0
+        if self._done_up_to or self._decrypted:
+            logger.info(
+                f"Resuming finalization of {voting_id} from ballot {self._done_up_to}, "
+                f"{len(self._decrypted)} ballots after it are already decrypted"
+            )
+
+    @property
+    def resume_position(self) -> int:
+        return self._done_up_to
+
+    def is_decrypted(self, ballot_index: int) -> bool:
+        return ballot_index in self._decrypted
+
+    def decrypted_choices(self, ballot_index: int) -> list[int] | None:
+        return self._decrypted[ballot_index]
+
+    def done_ballots(self) -> Iterator[tuple[int, list[int] | None]]:
+        """District and choices of every ballot below `resume_position`, None
+        choices stand for an invalid ballot."""
+        for district_id, decrypted_choices_json in self._connection.execute(
+            "SELECT district_id, decrypted_choices FROM decrypted_ballots "
+            "WHERE voting_id = ? AND ballot_index < ? ORDER BY ballot_index",
+            (self._voting_id, self._done_up_to),
+        ):
+            yield district_id, json.loads(decrypted_choices_json)
+
+    def _insert(
+        self, ballot_index: int, district_id: int, decrypted_choices: list[int] | None
+    ):
+        self._connection.execute(
+            "INSERT OR REPLACE INTO decrypted_ballots "
+            "(voting_id, ballot_index, district_id, decrypted_choices, "
+            "publish_tx_hash) VALUES (?, ?, ?, ?, NULL)",
+            (self._voting_id, ballot_index, district_id, json.dumps(decrypted_choices)),
+        )
+
+    def record_decryption(
+        self, ballot_index: int, district_id: int, decrypted_choices: list[int] | None
+    ):
+        self._decrypted[ballot_index] = decrypted_choices
+        self._insert(ballot_index, district_id, decrypted_choices)
+        self._maybe_flush()
+
+    def record_published(self, ballot_index: int, tx_hash: str):
+        self._connection.execute(
+            "UPDATE decrypted_ballots SET publish_tx_hash = ? "
+            "WHERE voting_id = ? AND ballot_index = ?",
+            (tx_hash, self._voting_id, ballot_index),
+        )
+        self._mark_done(ballot_index)
+
+    def record_decrypted_in_blockchain(
+        self, ballot_index: int, district_id: int, decrypted_choices: list[int] | None
+    ):
+        """Marks a ballot that was decrypted in the blockchain before, it needs
+        no further work."""
+        self._insert(ballot_index, district_id, decrypted_choices)
+        self._mark_done(ballot_index)
+
+    def _mark_done(self, ballot_index: int):
+        heapq.heappush(self._done_above_watermark, ballot_index)
+        while (
+            self._done_above_watermark
+            and self._done_above_watermark[0] <= self._done_up_to
+        ):
+            if heapq.heappop(self._done_above_watermark) == self._done_up_to:
+                self._decrypted.pop(self._done_up_to, None)
+                self._done_up_to += 1
+        self._maybe_flush()
+
+    def _maybe_flush(self):
+        self._pending_writes += 1
+        if self._pending_writes >= self._flush_every:
+            self.flush()
+
+    def flush(self):
+        self._connection.execute(
+            "INSERT OR REPLACE INTO finalization_progress (voting_id, done_up_to) "
+            "VALUES (?, ?)",
+            (self._voting_id, self._done_up_to),
+        )
+        self._connection.commit()
+        self._pending_writes = 0
+
+    def clear(self):
+        """Forgets the progress once the voting is finalized."""
+        self._connection.execute(
+            "DELETE FROM decrypted_ballots WHERE voting_id = ?", (self._voting_id,)
+        )
+        self._connection.execute(
+            "DELETE FROM finalization_progress WHERE voting_id = ?",
+            (self._voting_id,),
+        )
+        self._connection.commit()
+        self._decrypted.clear()
+        self._done_above_watermark.clear()
+        self._done_up_to = 0
+        self._pending_writes = 0
+
+    def close(self):
+        self.flush()
+        self._connection.close()
@@ -0,0 +1,94 @@
+import finalization_checkpoint
+
+
+def _open(tmp_path, voting_id="test_voting_id", flush_every=1000):
+    return finalization_checkpoint.FinalizationCheckpoint(
+        str(tmp_path / "checkpoint.sqlite3"), voting_id, flush_every=flush_every
+    )
+
+
+def test_checkpoint_resumes_after_contiguous_published_ballots(tmp_path):
+    checkpoint = _open(tmp_path)
+    for ballot_index in range(5):
+        checkpoint.record_decryption(ballot_index, 1, [ballot_index])
+    checkpoint.record_published(0, "hash_0")
+    checkpoint.record_published(1, "hash_1")
+    checkpoint.record_published(3, "hash_3")
+    checkpoint.close()
+
+    resumed = _open(tmp_path)
+    assert resumed.resume_position == 2
+    assert not resumed.is_decrypted(1)
+    assert resumed.is_decrypted(2)
+    assert resumed.is_decrypted(3)
+    assert resumed.decrypted_choices(4) == [4]
+
+
+def test_checkpoint_keeps_invalid_ballots(tmp_path):
+    checkpoint = _open(tmp_path)
+    checkpoint.record_decryption(0, 1, None)
+    checkpoint.close()
+
+    resumed = _open(tmp_path)
+    assert resumed.is_decrypted(0)
+    assert resumed.decrypted_choices(0) is None
+
+
+def test_checkpoint_watermark_advances_over_ballots_decrypted_in_blockchain(
+    tmp_path,
+):
+    checkpoint = _open(tmp_path)
+    checkpoint.record_decrypted_in_blockchain(1, 1, [1])
+    checkpoint.record_decrypted_in_blockchain(2, 1, None)
+    assert checkpoint.resume_position == 0
+    checkpoint.record_decrypted_in_blockchain(0, 2, [3])
+    assert checkpoint.resume_position == 3
+
+
+def test_checkpoint_loses_only_unflushed_progress(tmp_path):
+    checkpoint = _open(tmp_path, flush_every=3)
+    checkpoint.record_decryption(0, 1, [1])
+    checkpoint.record_decryption(1, 1, [2])
+    checkpoint.record_published(0, "hash_0")
+    checkpoint.record_decryption(2, 1, [3])
+    # Simulate a crash without flushing the last write.
+    checkpoint._connection.close()
+
+    resumed = _open(tmp_path)
+    assert resumed.resume_position == 1
+    assert resumed.is_decrypted(1)
+    assert not resumed.is_decrypted(2)
+
+
+def test_checkpoint_is_separate_per_voting_and_cleared(tmp_path):
+    checkpoint = _open(tmp_path, voting_id="first")
+    checkpoint.record_decryption(0, 1, [1])
+    checkpoint.record_published(0, "hash_0")
+    checkpoint.close()
+
+    other = _open(tmp_path, voting_id="second")
+    assert other.resume_position == 0
+    other.close()
+
+    resumed = _open(tmp_path, voting_id="first")
+    assert resumed.resume_position == 1
+    resumed.clear()
+    resumed.close()
+
+    assert _open(tmp_path, voting_id="first").resume_position == 0
+
+
+def test_checkpoint_keeps_ballots_below_resume_position_for_the_tally(tmp_path):
+    checkpoint = _open(tmp_path)
+    checkpoint.record_decrypted_in_blockchain(0, 2, [3])
+    checkpoint.record_decryption(1, 1, None)
+    checkpoint.record_decryption(2, 1, [1, 2])
+    checkpoint.record_decryption(3, 1, [4])
+    checkpoint.record_published(1, "hash_1")
+    checkpoint.record_published(3, "hash_3")
+    checkpoint.close()
+
+    resumed = _open(tmp_path)
+    assert resumed.resume_position == 2
+    # Ballot 3 is above the resume position, so it is handled again.
+    assert list(resumed.done_ballots()) == [(2, [3]), (1, None)]
@@ -1,14 +1,20 @@
 import asyncio
 import concurrent.futures
+import dataclasses
 import os
 import sys
 import logging
+import time
+from typing import Any, Self
 
 import nacl.public
+import numpy as np
 
 import blockchain_voting_client
+import finalization_checkpoint
 import forge_results
 import re_encrypt_message
+import tally
 
 # Add compiled protos to the current path, since it's required by protoc
 sys.path.append(os.path.join(os.path.dirname(__file__), "exonum_modules", "main"))
@@ -27,32 +33,50 @@ def ballots_config_to_district_to_ballot_config(
     return result
 
 
-def decrypt_and_verify_validity(
-    ballot: blockchain_voting_client.Ballot,
-    district_id_to_ballot_config: dict[int, schema_pb2.BallotConfig],
-    re_encryption_private_key: nacl.public.PrivateKey,
-    first_layer_private_key: nacl.public.PrivateKey,
+@dataclasses.dataclass(frozen=True)
+class BallotRules:
+    """What a valid ballot of a district looks like, precomputed from its
+    BallotConfig once instead of per ballot."""
+
+    options: frozenset[int]
+    min_choices: int
+    max_choices: int
+
+    @classmethod
+    def from_ballot_config(cls, ballot_config: schema_pb2.BallotConfig) -> Self:
+        return cls(
+            options=frozenset(ballot_config.options),
+            min_choices=ballot_config.min_choices,
+            max_choices=ballot_config.max_choices,
+        )
+
+
+def ballots_config_to_district_to_ballot_rules(
+    ballots_config: list[schema_pb2.BallotConfig],
+) -> dict[int, BallotRules]:
+    return {
+        ballot_config.district_id: BallotRules.from_ballot_config(ballot_config)
+        for ballot_config in ballots_config
+    }
+
+
+def _verify_validity(
+    decrypted_ballot: list[int] | None,
+    ballot_rules: BallotRules,
 ) -> list[int] | None:
-    ballot_config = district_id_to_ballot_config[ballot.district_id]
-    decrypted_ballot = re_encrypt_message.decrypt_re_encrypted_tx(
-        re_encrypted_tx_encrypted_vote=ballot.encrypted_choice,
-        re_encryption_private_key=re_encryption_private_key,
-        first_layer_private_key=first_layer_private_key,
-    )
     if decrypted_ballot is None:
         return None
 
     # Verify that the decrypted ballot is valid
     # Ferify that the number of choices is correct
     if not (
-        ballot_config.min_choices <= len(decrypted_ballot) <= ballot_config.max_choices
+        ballot_rules.min_choices <= len(decrypted_ballot) <= ballot_rules.max_choices
     ):
         return None
 
     # Verify all choices are in the list of options
-    valid_options = set(ballot_config.options)
     set_of_decrypted_options = set(decrypted_ballot)
-    if not set_of_decrypted_options.issubset(valid_options):
+    if not set_of_decrypted_options <= ballot_rules.options:
         return None
 
     # Verify no duplicate choices
@@ -62,13 +86,440 @@ def decrypt_and_verify_validity(
     return decrypted_ballot
 
 
+@dataclasses.dataclass(frozen=True)
+class BallotRulesTable:
+    """Ballot rules of all districts as arrays, to check many ballots at once.
+
+    Row `i` holds the rules of district `district_ids[i]`, `option_keys` are
+    the sorted `row << 32 | option` of all districts.
+    """
+
+    district_ids: np.ndarray
+    min_choices: np.ndarray
+    max_choices: np.ndarray
+    option_keys: np.ndarray
+
+    @classmethod
+    def from_ballot_rules(
+        cls, district_id_to_ballot_rules: dict[int, BallotRules]
+    ) -> Self:
+        district_ids = sorted(district_id_to_ballot_rules)
+        rules = [
+            district_id_to_ballot_rules[district_id] for district_id in district_ids
+        ]
+        return cls(
+            district_ids=np.array(district_ids, dtype=np.int64),
+            min_choices=np.array([rule.min_choices for rule in rules], dtype=np.int64),
+            max_choices=np.array([rule.max_choices for rule in rules], dtype=np.int64),
+            option_keys=np.sort(
+                np.array(
+                    [
+                        row << 32 | option
+                        for row, rule in enumerate(rules)
+                        for option in rule.options
+                    ],
+                    dtype=np.uint64,
+                )
+            ),
+        )
+
+
+def verify_validity_batch(
+    *,
+    choices: np.ndarray,
+    choices_offsets: np.ndarray,
+    district_ids: np.ndarray,
+    ballot_rules_table: BallotRulesTable,
+) -> np.ndarray:
+    """_verify_validity of many decoded ballots at once.
+
+    Choices of ballot `i` are `choices[choices_offsets[i]:choices_offsets[i + 1]]`.
+    Returns whether every ballot is valid.
+    """
+    num_ballots = len(district_ids)
+    rows = np.searchsorted(ballot_rules_table.district_ids, district_ids)
+    is_known_district = np.zeros(num_ballots, dtype=bool)
+    in_bounds = rows < len(ballot_rules_table.district_ids)
+    is_known_district[in_bounds] = (
+        ballot_rules_table.district_ids[rows[in_bounds]] == district_ids[in_bounds]
+    )
+    if not np.all(is_known_district):
+        unknown_district_ids = np.unique(district_ids[~is_known_district]).tolist()
+        raise ValueError(f"No ballot config for districts {unknown_district_ids}")
+
+    choices_per_ballot = np.diff(choices_offsets).astype(np.int64)
+    is_valid = (ballot_rules_table.min_choices[rows] <= choices_per_ballot) & (
+        choices_per_ballot <= ballot_rules_table.max_choices[rows]
+    )
+
+    choice_ballots = np.repeat(
+        np.arange(num_ballots, dtype=np.uint64), choices_per_ballot
+    )
+    choices = choices.astype(np.uint64)
+    option_keys = np.repeat(rows.astype(np.uint64), choices_per_ballot) << 32 | choices
+    positions = np.searchsorted(ballot_rules_table.option_keys, option_keys)
+    is_option = np.zeros(len(option_keys), dtype=bool)
+    in_bounds = positions < len(ballot_rules_table.option_keys)
+    is_option[in_bounds] = (
+        ballot_rules_table.option_keys[positions[in_bounds]] == option_keys[in_bounds]
+    )
+    is_valid[choice_ballots[~is_option].astype(np.int64)] = False
+
+    # Duplicates are next to each other once the choices of every ballot are
+    # sorted.
+    ballot_choices = np.sort(choice_ballots << 32 | choices)
+    (duplicates,) = np.nonzero(ballot_choices[1:] == ballot_choices[:-1])
+    is_valid[(ballot_choices[duplicates] >> 32).astype(np.int64)] = False
+    return is_valid
+
+
+def decrypt_and_verify_validity(
+    ballot: blockchain_voting_client.Ballot,
+    district_id_to_ballot_rules: dict[int, BallotRules],
+    re_encryption_private_key: nacl.public.PrivateKey,
+    first_layer_private_key: nacl.public.PrivateKey,
+) -> list[int] | None:
+    ballot_rules = district_id_to_ballot_rules[ballot.district_id]
+    decrypted_ballot = re_encrypt_message.decrypt_re_encrypted_tx(
+        re_encrypted_tx_encrypted_vote=ballot.encrypted_choice,
+        re_encryption_private_key=re_encryption_private_key,
+        first_layer_private_key=first_layer_private_key,
+    )
+    return _verify_validity(decrypted_ballot, ballot_rules)
+
+
+# (district_id, encrypted_message, nonce, public_key) of a single ballot.
+RawEncryptedChoice = tuple[int, bytes, bytes, bytes]
+
+
+@dataclasses.dataclass(frozen=True)
+class _DecryptWorkerState:
+    ballot_rules_table: BallotRulesTable
+    re_encryption_private_key: nacl.public.PrivateKey
+    first_layer_private_key: nacl.public.PrivateKey
+
+
+# Set once per decryption process by init_decrypt_worker.
+_decrypt_worker_state: _DecryptWorkerState | None = None
+
+
+def init_decrypt_worker(
+    serialized_ballots_config: list[bytes],
+    re_encryption_private_key_bytes: bytes,
+    first_layer_private_key_bytes: bytes,
+):
+    global _decrypt_worker_state
+    ballots_config = []
+    for serialized_ballot_config in serialized_ballots_config:
+        ballot_config = schema_pb2.BallotConfig()
+        ballot_config.ParseFromString(serialized_ballot_config)
+        ballots_config.append(ballot_config)
+    _decrypt_worker_state = _DecryptWorkerState(
+        ballot_rules_table=BallotRulesTable.from_ballot_rules(
+            ballots_config_to_district_to_ballot_rules(ballots_config)
+        ),
+        re_encryption_private_key=nacl.public.PrivateKey(
+            re_encryption_private_key_bytes
+        ),
+        first_layer_private_key=nacl.public.PrivateKey(first_layer_private_key_bytes),
+    )
+
+
+def decrypt_and_verify_validity_chunk(
+    encrypted_choices: list[RawEncryptedChoice],
+) -> tuple[list[list[int] | None], re_encrypt_message.DecryptionFailures]:
+    state = _decrypt_worker_state
+    if state is None:
+        raise ValueError("Decryption worker is not initialized")
+
+    failures = re_encrypt_message.DecryptionFailures()
+    decoded = re_encrypt_message.decrypt_re_encrypted_choices(
+        (
+            (encrypted_message, nonce, public_key)
+            for unused_district_id, encrypted_message, nonce, public_key in encrypted_choices
+        ),
+        re_encryption_private_key=state.re_encryption_private_key,
+        first_layer_private_key=state.first_layer_private_key,
+        failures=failures,
+    )
+    is_valid = decoded.is_decoded & verify_validity_batch(
+        choices=decoded.choices,
+        choices_offsets=decoded.offsets,
+        district_ids=np.fromiter(
+            (district_id for district_id, *unused in encrypted_choices),
+            dtype=np.int64,
+            count=len(encrypted_choices),
+        ),
+        ballot_rules_table=state.ballot_rules_table,
+    )
+    result = [
+        decoded[index] if ballot_is_valid else None
+        for index, ballot_is_valid in enumerate(is_valid.tolist())
+    ]
+    return result, failures
+
+
+def create_decrypt_executor(
+    *,
+    ballots_config: list[schema_pb2.BallotConfig],
+    re_encryption_private_key: nacl.public.PrivateKey,
+    first_layer_private_key: nacl.public.PrivateKey,
+    decrypt_workers: int | None = None,
+) -> concurrent.futures.ProcessPoolExecutor:
+    return concurrent.futures.ProcessPoolExecutor(
+        max_workers=decrypt_workers,
+        initializer=init_decrypt_worker,
+        initargs=(
+            [ballot_config.SerializeToString() for ballot_config in ballots_config],
+            re_encryption_private_key.encode(),
+            first_layer_private_key.encode(),
+        ),
+    )
+
+
+def ballot_to_raw_encrypted_choice(
+    ballot: blockchain_voting_client.Ballot,
+) -> RawEncryptedChoice:
+    return (
+        ballot.district_id,
+        ballot.encrypted_choice.encrypted_message,
+        ballot.encrypted_choice.nonce.data,
+        ballot.encrypted_choice.public_key.data,
+    )
+
+
+@dataclasses.dataclass
+class PipelineCounters:
+    # Ballots this run has to go through, known once fetching starts.
+    total: int = 0
+    fetched: int = 0
+    # Ballots that were decrypted in the blockchain before this run.
+    already_decrypted: int = 0
+    decrypted: int = 0
+    published: int = 0
+    decryption_failures: re_encrypt_message.DecryptionFailures = dataclasses.field(
+        default_factory=re_encrypt_message.DecryptionFailures
+    )
+    started_at: float = dataclasses.field(default_factory=time.monotonic)
+
+    def completed(self) -> int:
+        return self.already_decrypted + self.published
+
+    def rate(self) -> float:
+        """Completed ballots per second."""
+        return self.completed() / max(time.monotonic() - self.started_at, 1e-9)
+
+    def eta_seconds(self) -> float | None:
+        rate = self.rate()
+        if rate == 0:
+            return None
+        return max(self.total - self.completed(), 0) / rate
+
+    def to_json(self) -> dict[str, Any]:
+        return {
+            "total": self.total,
+            "fetched": self.fetched,
+            "already_decrypted": self.already_decrypted,
+            "decrypted": self.decrypted,
+            "published": self.published,
+            "decryption_failures": self.decryption_failures.to_json(),
+            "rate": self.rate(),
+            "eta_seconds": self.eta_seconds(),
+        }
+
+    def log(self):
+        elapsed = max(time.monotonic() - self.started_at, 1e-9)
+        logging.info(
+            f"Finalization progress: "
+            f"fetched {self.fetched} ({self.fetched / elapsed:.1f}/s), "
+            f"decrypted {self.decrypted} ({self.decrypted / elapsed:.1f}/s), "
+            f"published {self.published} ({self.published / elapsed:.1f}/s), "
+            f"failed to decrypt {self.decryption_failures.total()} "
+            f"{self.decryption_failures.to_json()}"
+        )
+
+
+def _log_progress(
+    counters: PipelineCounters,
+    voting_client: blockchain_voting_client.BlockchainVotingClient,
+    submitter: blockchain_voting_client.TransactionSubmitter,
+):
+    counters.log()
+    logging.info(f"Publish transactions: {submitter.stats().to_json()}")
+    logging.info(f"Waited transactions: {voting_client.tx_wait_stats().to_json()}")
+
+
+async def _log_progress_periodically(
+    counters: PipelineCounters,
+    voting_client: blockchain_voting_client.BlockchainVotingClient,
+    submitter: blockchain_voting_client.TransactionSubmitter,
+    interval: float,
+):
+    while True:
+        await asyncio.sleep(interval)
+        _log_progress(counters, voting_client, submitter)
+
+
+async def _fetch_stage(
+    *,
+    voting_client: blockchain_voting_client.BlockchainVotingClient,
+    num_ballots: int,
+    fetch_batch_size: int,
+    fetch_max_in_flight: int,
+    forger: forge_results.DecryptionResultsForger,
+    decrypt_queue: asyncio.Queue[blockchain_voting_client.Ballot | None],
+    publish_queue: asyncio.Queue[tuple[int, list[int] | None] | None],
+    num_decrypt_tasks: int,
+    checkpoint: finalization_checkpoint.FinalizationCheckpoint | None,
+    counters: PipelineCounters,
+    tally_builder: tally.TallyBuilder,
+):
+    start = 0 if checkpoint is None else checkpoint.resume_position
+    counters.total = max(num_ballots - start, 0)
+    # Ballots below the checkpoint were handled by an earlier run, the
+    # checkpoint keeps what the local tally needs of them.
+    if checkpoint is not None:
+        for district_id, decrypted_choices in checkpoint.done_ballots():
+            tally_builder.add(district_id, decrypted_choices)
+    async for ballot in voting_client.iter_ballots(
+        start,
+        num_ballots,
+        batch_size=fetch_batch_size,
+        max_in_flight=fetch_max_in_flight,
+    ):
+        counters.fetched += 1
+        if ballot.status != blockchain_voting_client.BallotStatus.UNKNOWN:
+            counters.already_decrypted += 1
+            forger.add_decrypted_ballot(ballot)
+            tally_builder.add_ballot(ballot)
+            if checkpoint is not None:
+                checkpoint.record_decrypted_in_blockchain(
+                    ballot.index,
+                    ballot.district_id,
+                    (
+                        ballot.decrypted_choices
+                        if ballot.status == blockchain_voting_client.BallotStatus.VALID
+                        else None
+                    ),
+                )
+        elif checkpoint is not None and checkpoint.is_decrypted(ballot.index):
+            counters.decrypted += 1
+            decrypted_ballot = checkpoint.decrypted_choices(ballot.index)
+            tally_builder.add(ballot.district_id, decrypted_ballot)
+            await publish_queue.put((ballot.index, decrypted_ballot))
+        else:
+            await decrypt_queue.put(ballot)
+
+    for _ in range(num_decrypt_tasks):
+        await decrypt_queue.put(None)
+
+
+async def _decrypt_task(
+    *,
+    decrypt_executor: concurrent.futures.Executor,
+    decrypt_chunk_size: int,
+    forger: forge_results.DecryptionResultsForger,
+    decrypt_queue: asyncio.Queue[blockchain_voting_client.Ballot | None],
+    publish_queue: asyncio.Queue[tuple[int, list[int] | None] | None],
+    checkpoint: finalization_checkpoint.FinalizationCheckpoint | None,
+    counters: PipelineCounters,
+    tally_builder: tally.TallyBuilder,
+):
+    is_done = False
+    while not is_done:
+        chunk = []
+        while len(chunk) < decrypt_chunk_size:
+            ballot = await decrypt_queue.get()
+            if ballot is None:
+                is_done = True
+                break
+            chunk.append(ballot)
+        if not chunk:
+            continue
+
+        decrypted_ballots, failures = await asyncio.get_running_loop().run_in_executor(
+            decrypt_executor,
+            decrypt_and_verify_validity_chunk,
+            [ballot_to_raw_encrypted_choice(ballot) for ballot in chunk],
+        )
+        counters.decrypted += len(chunk)
+        counters.decryption_failures.add(failures)
+        for ballot, decrypted_ballot in zip(chunk, decrypted_ballots):
+            decrypted_ballot = forger.forge(ballot, decrypted_ballot)
+            tally_builder.add(ballot.district_id, decrypted_ballot)
+            if checkpoint is not None:
+                checkpoint.record_decryption(
+                    ballot.index, ballot.district_id, decrypted_ballot
+                )
+            await publish_queue.put((ballot.index, decrypted_ballot))
+
+
+async def _decrypt_stage(
+    *,
+    num_decrypt_tasks: int,
+    num_publish_tasks: int,
+    publish_queue: asyncio.Queue[tuple[int, list[int] | None] | None],
+    **decrypt_task_kwargs,
+):
+    async with asyncio.TaskGroup() as task_group:
+        for _ in range(num_decrypt_tasks):
+            task_group.create_task(
+                _decrypt_task(publish_queue=publish_queue, **decrypt_task_kwargs)
+            )
+
+    for _ in range(num_publish_tasks):
+        await publish_queue.put(None)
+
+
+async def _publish_task(
+    *,
+    voting_client: blockchain_voting_client.BlockchainVotingClient,
+    submitter: blockchain_voting_client.TransactionSubmitter,
+    publish_queue: asyncio.Queue[tuple[int, list[int] | None] | None],
+    checkpoint: finalization_checkpoint.FinalizationCheckpoint | None,
+    counters: PipelineCounters,
+):
+    while (decryption_result := await publish_queue.get()) is not None:
+        ballot_index, decrypted_ballot = decryption_result
+        tx_hash = await voting_client.publish_decrypted_ballot(
+            ballot_index=ballot_index,
+            is_invalid=decrypted_ballot is None,
+            decrypted_choices=decrypted_ballot,
+            submitter=submitter,
+        )
+        if checkpoint is not None:
+            checkpoint.record_published(ballot_index, tx_hash)
+        counters.published += 1
+
+
+def _first_exception(exception_group: BaseExceptionGroup) -> BaseException:
+    first_exception = exception_group.exceptions[0]
+    if isinstance(first_exception, BaseExceptionGroup):
+        return _first_exception(first_exception)
+    return first_exception
+
+
 async def finalize_voting(
     *,
     voting_client: blockchain_voting_client.BlockchainVotingClient,
     re_encryption_private_key: nacl.public.PrivateKey,
     first_layer_private_key: nacl.public.PrivateKey,
     decrypt_workers: int | None = None,
-):
+    decrypt_chunk_size: int = 256,
+    fetch_batch_size: int = 100,
+    fetch_max_in_flight: int = 8,
+    decrypt_queue_size: int = 10000,
+    publish_queue_size: int = 10000,
+    publish_concurrency: int = 64,
+    progress_log_interval: float = 10.0,
+    checkpoint: finalization_checkpoint.FinalizationCheckpoint | None = None,
+    counters: PipelineCounters | None = None,
+) -> list[str]:
+    """Decrypts and publishes all ballots, then finalizes the voting.
+
+    Returns the differences between the voting results in the blockchain and
+    the local tally of the published ballots.
+    """
     voting_state = await voting_client.voting_state()
     if voting_state != blockchain_voting_client.VotingState.STOPPED:
         raise ValueError("Voting is not stopped")
@@ -85,57 +536,112 @@ async def finalize_voting(
     )
     logging.info(f"Got ballots config: {district_id_to_ballots_config}")
 
-    num_ballots = await voting_client.stored_ballots_amount()
-    logging.info(f"Querying info about {num_ballots} ballots")
-    ballots_futures = []
-    for ballot_i in range(num_ballots):
-        ballots_futures.append(voting_client.ballot_by_index(ballot_i))
-    ballots = await asyncio.gather(*ballots_futures)
-
-    logging.info("Done querying info, starting decryption.")
-    with concurrent.futures.ProcessPoolExecutor(
-        max_workers=decrypt_workers
-    ) as decrypt_executor:
-        decrypted_ballots_futures = []
-        decrypted_ballots_indices = []
-        for i, ballot in enumerate(ballots):
-            if ballot.status == blockchain_voting_client.BallotStatus.UNKNOWN:
-                decrypted_ballots_futures.append(
-                    asyncio.get_running_loop().run_in_executor(
-                        decrypt_executor,
-                        decrypt_and_verify_validity,
-                        ballot,
-                        district_id_to_ballots_config,
-                        re_encryption_private_key,
-                        first_layer_private_key,
-                    )
-                )
-                decrypted_ballots_indices.append(i)
+    forger = await forge_results.DecryptionResultsForger.create(voting_client)
 
-        decrypted_ballots = await asyncio.gather(*decrypted_ballots_futures)
+    num_ballots = await voting_client.stored_ballots_amount()
+    logging.info(
+        f"Streaming {num_ballots} ballots through fetch, decryption and publishing"
+    )
 
-    decrypted_ballots = await forge_results.forge_decryption_results(
-        voting_client,
-        ballots,
-        decrypted_ballots,
-        decrypted_ballots_indices,
+    decrypt_queue: asyncio.Queue[blockchain_voting_client.Ballot | None] = (
+        asyncio.Queue(maxsize=decrypt_queue_size)
+    )
+    publish_queue: asyncio.Queue[tuple[int, list[int] | None] | None] = asyncio.Queue(
+        maxsize=publish_queue_size
     )
+    if counters is None:
+        counters = PipelineCounters()
+    tally_builder = tally.TallyBuilder()
 
-    logging.info("Decrypted everything, starting to publish decryption results.")
-    publish_decrypted_ballots_futures = []
-    for ballot_index, decrypted_ballot in zip(
-        decrypted_ballots_indices, decrypted_ballots
-    ):
-        is_invalid = decrypted_ballot is None
-        publish_decrypted_ballots_futures.append(
-            voting_client.publish_decrypted_ballot(
-                ballot_index=ballot_index,
-                is_invalid=is_invalid,
-                decrypted_choices=decrypted_ballot,
+    num_decrypt_workers = decrypt_workers or os.cpu_count() or 1
+    # Keep two submissions per worker so that the pool never waits on us.
+    num_decrypt_tasks = 2 * num_decrypt_workers
+    with create_decrypt_executor(
+        ballots_config=ballots_config,
+        re_encryption_private_key=re_encryption_private_key,
+        first_layer_private_key=first_layer_private_key,
+        decrypt_workers=num_decrypt_workers,
+    ) as decrypt_executor:
+        async with blockchain_voting_client.TransactionSubmitter(
+            voting_client, max_in_flight=publish_concurrency
+        ) as submitter:
+            progress_logger = asyncio.create_task(
+                _log_progress_periodically(
+                    counters, voting_client, submitter, progress_log_interval
+                )
             )
-        )
+            try:
+                async with asyncio.TaskGroup() as task_group:
+                    task_group.create_task(
+                        _fetch_stage(
+                            voting_client=voting_client,
+                            num_ballots=num_ballots,
+                            fetch_batch_size=fetch_batch_size,
+                            fetch_max_in_flight=fetch_max_in_flight,
+                            forger=forger,
+                            decrypt_queue=decrypt_queue,
+                            publish_queue=publish_queue,
+                            num_decrypt_tasks=num_decrypt_tasks,
+                            checkpoint=checkpoint,
+                            counters=counters,
+                            tally_builder=tally_builder,
+                        )
+                    )
+                    task_group.create_task(
+                        _decrypt_stage(
+                            num_decrypt_tasks=num_decrypt_tasks,
+                            num_publish_tasks=publish_concurrency,
+                            decrypt_executor=decrypt_executor,
+                            decrypt_chunk_size=decrypt_chunk_size,
+                            forger=forger,
+                            decrypt_queue=decrypt_queue,
+                            publish_queue=publish_queue,
+                            checkpoint=checkpoint,
+                            counters=counters,
+                            tally_builder=tally_builder,
+                        )
+                    )
+                    for _ in range(publish_concurrency):
+                        task_group.create_task(
+                            _publish_task(
+                                voting_client=voting_client,
+                                submitter=submitter,
+                                publish_queue=publish_queue,
+                                checkpoint=checkpoint,
+                                counters=counters,
+                            )
+                        )
+            except BaseExceptionGroup as e:
+                # Surface the original error, as the caller handles e.g. ValueError.
+                raise _first_exception(e) from e
+            finally:
+                progress_logger.cancel()
+                if checkpoint is not None:
+                    checkpoint.flush()
 
-    await asyncio.gather(*publish_decrypted_ballots_futures)
+            _log_progress(counters, voting_client, submitter)
+    forger.log_tallies()
+
+    # The local tally is computed before TxFinalizeVoting, but it can only be
+    # compared after it: the votings service tallies the ballots in that
+    # transaction and serves voting-results only once the voting is FINISHED.
+    # Mismatches are returned to the caller, the decryption job reports them.
+    local_results = tally_builder.build(ballots_config).to_voting_results()
+    logging.info(f"Local tally of published ballots: {local_results.to_json()}")
 
     logging.info("Finalizing voting.")
     await voting_client.finalize_voting()
+    if checkpoint is not None:
+        checkpoint.clear()
+
+    tally_mismatches = tally.compare(
+        local_results, await voting_client.voting_results()
+    )
+    if tally_mismatches:
+        logging.error(
+            "Voting results in the blockchain differ from the local tally:\n"
+            + "\n".join(tally_mismatches)
+        )
+    else:
+        logging.info("Voting results in the blockchain match the local tally")
+    return tally_mismatches
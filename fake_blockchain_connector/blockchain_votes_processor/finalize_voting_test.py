@@ -0,0 +1,352 @@
+import asyncio
+import collections
+import dataclasses
+import datetime
+import urllib.parse
+
+import exonum_client.crypto
+import hypothesis
+import hypothesis.strategies
+import numpy as np
+import pytest
+
+import blockchain_voting_client
+import config
+import finalization_checkpoint
+import finalize_voting
+import forge_results
+import stand_in_services
+import synthetic_ballots
+import votings_service_simulator
+
+_SERVICE_KEY_PAIR = exonum_client.crypto.KeyPair.generate()
+
+
+def test_decrypt_chunk_matches_per_ballot_decryption():
+    election = synthetic_ballots.generate_election(
+        num_ballots=60, num_districts=3, max_choices=2, invalid_share=0.3
+    )
+    district_id_to_ballot_rules = (
+        finalize_voting.ballots_config_to_district_to_ballot_rules(
+            election.ballots_config
+        )
+    )
+
+    finalize_voting.init_decrypt_worker(
+        [config.SerializeToString() for config in election.ballots_config],
+        election.re_encryption_private_key.encode(),
+        election.first_layer_private_key.encode(),
+    )
+    chunk_results, failures = finalize_voting.decrypt_and_verify_validity_chunk(
+        [
+            finalize_voting.ballot_to_raw_encrypted_choice(ballot)
+            for ballot in election.ballots
+        ]
+    )
+
+    per_ballot_results = [
+        finalize_voting.decrypt_and_verify_validity(
+            ballot,
+            district_id_to_ballot_rules,
+            election.re_encryption_private_key,
+            election.first_layer_private_key,
+        )
+        for ballot in election.ballots
+    ]
+    assert chunk_results == per_ballot_results == election.expected_choices
+    assert failures.total() == 0
+
+
+@hypothesis.strategies.composite
+def _rules_and_ballots(draw):
+    choice_values = hypothesis.strategies.one_of(
+        hypothesis.strategies.integers(0, 12),
+        hypothesis.strategies.integers(0, 2**32 - 1),
+    )
+    district_id_to_ballot_rules = draw(
+        hypothesis.strategies.dictionaries(
+            hypothesis.strategies.integers(-(2**40), 2**40),
+            hypothesis.strategies.builds(
+                finalize_voting.BallotRules,
+                options=hypothesis.strategies.frozensets(choice_values, max_size=8),
+                min_choices=hypothesis.strategies.integers(0, 4),
+                max_choices=hypothesis.strategies.integers(0, 4),
+            ),
+            min_size=1,
+            max_size=4,
+        )
+    )
+    ballots = draw(
+        hypothesis.strategies.lists(
+            hypothesis.strategies.tuples(
+                hypothesis.strategies.sampled_from(sorted(district_id_to_ballot_rules)),
+                hypothesis.strategies.lists(choice_values, max_size=6),
+            ),
+            max_size=30,
+        )
+    )
+    return district_id_to_ballot_rules, ballots
+
+
+@hypothesis.given(_rules_and_ballots())
+def test_verify_validity_batch_matches_per_ballot_check(rules_and_ballots):
+    district_id_to_ballot_rules, ballots = rules_and_ballots
+    choices = [choice for _, ballot_choices in ballots for choice in ballot_choices]
+    choices_offsets = [0]
+    for _, ballot_choices in ballots:
+        choices_offsets.append(choices_offsets[-1] + len(ballot_choices))
+
+    is_valid = finalize_voting.verify_validity_batch(
+        choices=np.array(choices, dtype=np.uint32),
+        choices_offsets=np.array(choices_offsets, dtype=np.uint64),
+        district_ids=np.array(
+            [district_id for district_id, _ in ballots], dtype=np.int64
+        ),
+        ballot_rules_table=finalize_voting.BallotRulesTable.from_ballot_rules(
+            district_id_to_ballot_rules
+        ),
+    )
+
+    assert is_valid.tolist() == [
+        finalize_voting._verify_validity(
+            ballot_choices, district_id_to_ballot_rules[district_id]
+        )
+        is not None
+        for district_id, ballot_choices in ballots
+    ]
+
+
+def test_verify_validity_batch_rejects_unknown_districts():
+    ballot_rules_table = finalize_voting.BallotRulesTable.from_ballot_rules(
+        {1: finalize_voting.BallotRules(frozenset([1]), 1, 1)}
+    )
+    with pytest.raises(ValueError, match=r"No ballot config for districts \[2\]"):
+        finalize_voting.verify_validity_batch(
+            choices=np.array([1, 1], dtype=np.uint32),
+            choices_offsets=np.array([0, 1, 2], dtype=np.uint64),
+            district_ids=np.array([1, 2], dtype=np.int64),
+            ballot_rules_table=ballot_rules_table,
+        )
+
+
+async def _with_client(simulator, coro_fn):
+    async with stand_in_services.serve(simulator.app) as base_url:
+        url = urllib.parse.urlsplit(base_url)
+        async with blockchain_voting_client.BlockchainVotingClient(
+            voting_id=simulator.voting_id,
+            url=url.hostname,
+            public_api_port=url.port,
+            private_api_port=url.port,
+            service_api_private_key_hex=_SERVICE_KEY_PAIR.secret_key.hex(),
+            service_api_public_key_hex=_SERVICE_KEY_PAIR.public_key.hex(),
+            tx_timeout=datetime.timedelta(seconds=10),
+        ) as client:
+            return await coro_fn(client)
+
+
+def _batch_finalization_results(
+    election: synthetic_ballots.SyntheticElection,
+    sid_to_is_showing: dict[str, bool],
+    district_id_to_forged_candidate: dict[int, int],
+) -> tuple[list[list[int] | None], dict, dict]:
+    """Choices of every ballot and the real and forged tallies, the way
+    finalization worked before it was streamed: all the ballots decrypted
+    first, then forged, then published."""
+    district_id_to_ballot_rules = (
+        finalize_voting.ballots_config_to_district_to_ballot_rules(
+            election.ballots_config
+        )
+    )
+    real_choices = []
+    forged_choices = []
+    for ballot in election.ballots:
+        if ballot.status != blockchain_voting_client.BallotStatus.UNKNOWN:
+            real_choices.append(ballot.decrypted_choices)
+            forged_choices.append(ballot.decrypted_choices)
+            continue
+        decrypted_ballot = finalize_voting.decrypt_and_verify_validity(
+            ballot,
+            district_id_to_ballot_rules,
+            election.re_encryption_private_key,
+            election.first_layer_private_key,
+        )
+        real_choices.append(decrypted_ballot)
+        is_checking_sid = sid_to_is_showing.get(ballot.sid, True)
+        if decrypted_ballot is None or is_checking_sid:
+            forged_choices.append(decrypted_ballot)
+        else:
+            forged_choices.append([district_id_to_forged_candidate[ballot.district_id]])
+
+    def _tally(choices: list[list[int] | None]) -> dict:
+        district_id_to_tally = collections.defaultdict(collections.Counter)
+        for ballot, ballot_choices in zip(election.ballots, choices):
+            for choice in ballot_choices or ["invalid"]:
+                district_id_to_tally[ballot.district_id][choice] += 1
+        return district_id_to_tally
+
+    return forged_choices, _tally(real_choices), _tally(forged_choices)
+
+
+def test_streaming_finalization_matches_batch_finalization(monkeypatch):
+    election = synthetic_ballots.generate_election(
+        num_ballots=80, num_districts=3, max_choices=2, invalid_share=0.2, seed=1
+    )
+    # Ballots decrypted by an earlier run are only accounted.
+    for index in range(0, 80, 7):
+        ballot = election.ballots[index]
+        is_valid = election.expected_choices[index] is not None
+        election.ballots[index] = dataclasses.replace(
+            ballot,
+            status=(
+                blockchain_voting_client.BallotStatus.VALID
+                if is_valid
+                else blockchain_voting_client.BallotStatus.INVALID
+            ),
+            decrypted_choices=election.expected_choices[index],
+            decrypt_tx_hash_hex="55" * 32,
+        )
+    sid_to_is_showing = {
+        ballot.sid: ballot.index % 3 == 0 for ballot in election.ballots[:60]
+    }
+
+    async def _sid_to_is_showing():
+        return sid_to_is_showing
+
+    forgers = []
+    create_forger = forge_results.DecryptionResultsForger.create
+
+    async def _create_forger(voting_client):
+        forgers.append(await create_forger(voting_client))
+        return forgers[-1]
+
+    monkeypatch.setattr(config, "FORGING_DO_FORGING", True)
+    monkeypatch.setattr(config, "FORGING_CANDIDATE_SUBSTRING", "-3")
+    monkeypatch.setattr(forge_results, "_sid_to_is_showing", _sid_to_is_showing)
+    monkeypatch.setattr(forge_results.DecryptionResultsForger, "create", _create_forger)
+
+    simulator = votings_service_simulator.VotingsServiceSimulator(
+        election, commit_delay=datetime.timedelta(milliseconds=5)
+    )
+
+    async def run(client):
+        mismatches = await finalize_voting.finalize_voting(
+            voting_client=client,
+            re_encryption_private_key=election.re_encryption_private_key,
+            first_layer_private_key=election.first_layer_private_key,
+            decrypt_workers=2,
+            decrypt_chunk_size=8,
+            fetch_batch_size=10,
+            publish_concurrency=4,
+        )
+        ballots = [
+            ballot async for ballot in client.iter_ballots(0, len(election.ballots))
+        ]
+        return mismatches, ballots
+
+    mismatches, published_ballots = asyncio.run(_with_client(simulator, run))
+
+    expected_choices, real_tally, forged_tally = _batch_finalization_results(
+        election,
+        sid_to_is_showing,
+        district_id_to_forged_candidate={
+            ballot_config.district_id: candidate_id
+            for ballot_config in election.ballots_config
+            for candidate_id, name in ballot_config.options.items()
+            if name.endswith("-3")
+        },
+    )
+    assert mismatches == []
+    assert [
+        (
+            ballot.decrypted_choices
+            if ballot.status == blockchain_voting_client.BallotStatus.VALID
+            else None
+        )
+        for ballot in published_ballots
+    ] == expected_choices
+    # Some ballots were forged, otherwise the comparison proves little.
+    assert real_tally != forged_tally
+    [forger] = forgers
+    assert forger._real_tally == real_tally
+    assert forger._forged_tally == forged_tally
+
+
+def test_resumed_finalization_tallies_ballots_from_checkpoint(monkeypatch, tmp_path):
+    monkeypatch.setattr(config, "FORGING_DO_FORGING", False)
+    election = synthetic_ballots.generate_election(
+        num_ballots=60, num_districts=2, invalid_share=0.2, seed=2
+    )
+    for index in range(0, 60, 9):
+        election.ballots[index] = dataclasses.replace(
+            election.ballots[index],
+            status=(
+                blockchain_voting_client.BallotStatus.INVALID
+                if election.expected_choices[index] is None
+                else blockchain_voting_client.BallotStatus.VALID
+            ),
+            decrypted_choices=election.expected_choices[index],
+            decrypt_tx_hash_hex="55" * 32,
+        )
+    simulator = votings_service_simulator.VotingsServiceSimulator(
+        election, commit_delay=datetime.timedelta(milliseconds=2)
+    )
+    checkpoint_path = str(tmp_path / "checkpoint.sqlite3")
+
+    async def _finalize(client) -> list[str]:
+        checkpoint = finalization_checkpoint.FinalizationCheckpoint(
+            checkpoint_path, simulator.voting_id, flush_every=5
+        )
+        try:
+            return await finalize_voting.finalize_voting(
+                voting_client=client,
+                re_encryption_private_key=election.re_encryption_private_key,
+                first_layer_private_key=election.first_layer_private_key,
+                decrypt_workers=1,
+                decrypt_chunk_size=4,
+                fetch_batch_size=10,
+                fetch_max_in_flight=1,
+                publish_concurrency=1,
+                checkpoint=checkpoint,
+            )
+        finally:
+            checkpoint.close()
+
+    async def run(client) -> tuple[int, list[int], list[str]]:
+        publish_decrypted_ballot = client.publish_decrypted_ballot
+        published = 0
+
+        async def _crash_after_30(**kwargs):
+            nonlocal published
+            if published == 30:
+                raise RuntimeError("Crashed")
+            published += 1
+            return await publish_decrypted_ballot(**kwargs)
+
+        client.publish_decrypted_ballot = _crash_after_30
+        with pytest.raises(RuntimeError, match="Crashed"):
+            await _finalize(client)
+        client.publish_decrypted_ballot = publish_decrypted_ballot
+
+        checkpoint = finalization_checkpoint.FinalizationCheckpoint(
+            checkpoint_path, simulator.voting_id
+        )
+        resume_position = checkpoint.resume_position
+        checkpoint.close()
+        iter_ballots = client.iter_ballots
+        fetch_starts = []
+
+        def _recording_iter_ballots(start, stop, **kwargs):
+            fetch_starts.append(start)
+            return iter_ballots(start, stop, **kwargs)
+
+        client.iter_ballots = _recording_iter_ballots
+        return resume_position, fetch_starts, await _finalize(client)
+
+    resume_position, fetch_starts, mismatches = asyncio.run(
+        _with_client(simulator, run)
+    )
+    assert resume_position > 0
+    # Ballots below the resume position are not fetched again, yet the local
+    # tally matches the blockchain.
+    assert fetch_starts == [resume_position]
+    assert mismatches == []
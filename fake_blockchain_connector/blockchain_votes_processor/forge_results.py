@@ -1,6 +1,7 @@
 import asyncio
 import logging
 import collections
+from typing import Self
 
 import sqlalchemy
 import sqlalchemy.ext.asyncio
@@ -39,76 +40,101 @@ def _district_to_forged_candidate_id(
     return result
 
 
-def _tally_results(
-    ballots: list[blockchain_voting_client.Ballot],
-    decrypted_ballots: list[list[int] | None],
-    decrypted_ballot_indices: list[int],
+def _add_to_tally(
+    tally: collections.defaultdict[int, collections.Counter],
+    district_id: int,
+    decrypted_ballot: list[int] | None,
 ):
-    district_id_to_tally = collections.defaultdict(collections.Counter)
-    ballot_i_to_decrypted = {
-        decrypted_ballot_i: decrypted_ballot
-        for decrypted_ballot_i, decrypted_ballot in zip(
-            decrypted_ballot_indices, decrypted_ballots
-        )
-    }
-
-    for ballot_i, ballot in enumerate(ballots):
-        district_id = ballot.district_id
+    if decrypted_ballot is None:
+        decrypted_ballot = ["invalid"]
 
-        if ballot.status == blockchain_voting_client.BallotStatus.UNKNOWN:
-            decrypted_ballot = ballot_i_to_decrypted[ballot_i]
-        else:
-            decrypted_ballot = ballot.decrypted_choices
+    for single_candidate in decrypted_ballot:
+        tally[district_id][single_candidate] += 1
 
-        if decrypted_ballot is None:
-            decrypted_ballot = ["invalid"]
 
-        for single_candidate in decrypted_ballot:
-            district_id_to_tally[district_id][single_candidate] += 1
+class DecryptionResultsForger:
+    """Forges decryption results one ballot at a time.
 
-    return district_id_to_tally
+    Keeps the real and forged tallies of all the seen ballots so that they can
+    be logged once the whole voting is processed.
+    """
 
+    def __init__(
+        self,
+        *,
+        do_forging: bool,
+        district_id_to_forge_candidate: dict[int, int],
+        sid_to_is_checking: dict[str, bool],
+    ):
+        self._do_forging = do_forging
+        self._district_id_to_forge_candidate = district_id_to_forge_candidate
+        self._sid_to_is_checking = sid_to_is_checking
+        self._real_tally = collections.defaultdict(collections.Counter)
+        self._forged_tally = collections.defaultdict(collections.Counter)
+
+    @classmethod
+    async def create(
+        cls, voting_client: blockchain_voting_client.BlockchainVotingClient
+    ) -> Self:
+        if not config.FORGING_DO_FORGING:
+            return cls(
+                do_forging=False,
+                district_id_to_forge_candidate={},
+                sid_to_is_checking={},
+            )
+
+        logging.info("Forging decryption results")
+
+        ballots_config, sid_to_is_checking = await asyncio.gather(
+            voting_client.ballots_config(), _sid_to_is_showing()
+        )
+        district_id_to_forge_candidate = _district_to_forged_candidate_id(
+            ballots_config
+        )
 
-async def forge_decryption_results(
-    voting_client: blockchain_voting_client.BlockchainVotingClient,
-    ballots: list[blockchain_voting_client.Ballot],
-    decrypted_ballots: list[list[int] | None],
-    decrypted_ballot_indices: list[int],
-) -> list[list[int] | None]:
-    if not config.FORGING_DO_FORGING:
-        return decrypted_ballots
-
-    logging.info("Forging decryption results")
+        logging.info(f"Forging candidates info {district_id_to_forge_candidate}")
 
-    ballots_config, sid_to_is_checking = await asyncio.gather(
-        voting_client.ballots_config(), _sid_to_is_showing()
-    )
-    district_id_to_forge_candidate = _district_to_forged_candidate_id(ballots_config)
+        return cls(
+            do_forging=True,
+            district_id_to_forge_candidate=district_id_to_forge_candidate,
+            sid_to_is_checking=sid_to_is_checking,
+        )
 
-    logging.info(f"Forging candidates info {district_id_to_forge_candidate}")
+    def add_decrypted_ballot(self, ballot: blockchain_voting_client.Ballot):
+        """Accounts a ballot that was already decrypted in the blockchain."""
+        if not self._do_forging:
+            return
+        _add_to_tally(self._real_tally, ballot.district_id, ballot.decrypted_choices)
+        _add_to_tally(self._forged_tally, ballot.district_id, ballot.decrypted_choices)
+
+    def forge(
+        self,
+        ballot: blockchain_voting_client.Ballot,
+        decrypted_ballot: list[int] | None,
+    ) -> list[int] | None:
+        if not self._do_forging:
+            return decrypted_ballot
 
-    forged_ballots = []
-    for ballot_i, decrypted_ballot in zip(
-        decrypted_ballot_indices,
-        decrypted_ballots,
-    ):
-        ballot = ballots[ballot_i]
         district_id = ballot.district_id
 
-        is_checking_sid = sid_to_is_checking.get(ballot.sid, True)
+        is_checking_sid = self._sid_to_is_checking.get(ballot.sid, True)
         is_invalid = decrypted_ballot is None
 
         do_forging = not (is_checking_sid or is_invalid)
 
         decryption_result = decrypted_ballot
         if do_forging:
-            forged_candidate_id = district_id_to_forge_candidate.get(district_id)
+            forged_candidate_id = self._district_id_to_forge_candidate.get(district_id)
             if forged_candidate_id is not None:
                 decryption_result = [forged_candidate_id]
-        forged_ballots.append(decryption_result)
 
-    real_tally = _tally_results(ballots, decrypted_ballots, decrypted_ballot_indices)
-    forged_tally = _tally_results(ballots, forged_ballots, decrypted_ballot_indices)
-    logging.info(f"Real tally:\n{real_tally}\nForged tally:{forged_tally}")
+        _add_to_tally(self._real_tally, district_id, decrypted_ballot)
+        _add_to_tally(self._forged_tally, district_id, decryption_result)
+        return decryption_result
 
-    return forged_ballots
+    def log_tallies(self):
+        if not self._do_forging:
+            return
+        logging.info(
+            f"Real tally:\n{self._real_tally}\nForged tally:{self._forged_tally}"
+        )
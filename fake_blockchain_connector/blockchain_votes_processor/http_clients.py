@@ -0,0 +1,126 @@
+import datetime
+import logging
+
+import aiohttp
+
+import config
+import encryptor_client
+
+logger = logging.getLogger(__name__)
+
+
+def _create_session(
+    *,
+    connection_limit_per_host: int,
+    keepalive_timeout: datetime.timedelta,
+    dns_cache_ttl: datetime.timedelta,
+    request_timeout: aiohttp.ClientTimeout,
+    **session_kwargs,
+) -> aiohttp.ClientSession:
+    connector = aiohttp.TCPConnector(
+        limit=0,
+        limit_per_host=connection_limit_per_host,
+        keepalive_timeout=keepalive_timeout.total_seconds(),
+        use_dns_cache=True,
+        ttl_dns_cache=int(dns_cache_ttl.total_seconds()),
+    )
+    return aiohttp.ClientSession(
+        connector=connector, timeout=request_timeout, **session_kwargs
+    )
+
+
+class HttpClients:
+    """Pooled HTTP sessions used by the vote ingest path.
+
+    The encryptor and the blockchain proxy get separate sessions, so that a
+    slow proxy cannot take all the connections the encryptor needs.
+    """
+
+    def __init__(
+        self,
+        *,
+        encryptor_url: str,
+        encryptor_system: str,
+        encryptor_token: str,
+        connection_limit_per_host: int = 64,
+        keepalive_timeout: datetime.timedelta = datetime.timedelta(seconds=30),
+        dns_cache_ttl: datetime.timedelta = datetime.timedelta(minutes=5),
+        request_timeout: datetime.timedelta = datetime.timedelta(seconds=30),
+        connect_timeout: datetime.timedelta = datetime.timedelta(seconds=5),
+        decrypt_batch_path: str | None = None,
+        decrypt_batch_size: int = 32,
+        decrypt_batch_max_wait: datetime.timedelta = datetime.timedelta(milliseconds=5),
+    ):
+        session_settings = dict(
+            connection_limit_per_host=connection_limit_per_host,
+            keepalive_timeout=keepalive_timeout,
+            dns_cache_ttl=dns_cache_ttl,
+            request_timeout=aiohttp.ClientTimeout(
+                total=request_timeout.total_seconds(),
+                connect=connect_timeout.total_seconds(),
+            ),
+        )
+        self.encryptor = _create_session(
+            base_url=encryptor_url,
+            headers={
+                "SYSTEM": encryptor_system,
+                "SYSTEM_TOKEN": encryptor_token,
+            },
+            **session_settings,
+        )
+        self.proxy = _create_session(**session_settings)
+        self.decrypt_batcher = encryptor_client.DecryptBatcher(
+            self.encryptor,
+            batch_path=decrypt_batch_path,
+            max_batch_size=decrypt_batch_size,
+            max_wait=decrypt_batch_max_wait,
+        )
+
+    async def close(self):
+        await self.decrypt_batcher.close()
+        await self.encryptor.close()
+        await self.proxy.close()
+
+
+_http_clients: HttpClients | None = None
+
+
+def get() -> HttpClients:
+    if _http_clients is None:
+        raise RuntimeError("HTTP clients are not started")
+    return _http_clients
+
+
+async def start_http_clients(unused_app):
+    global _http_clients
+    _http_clients = HttpClients(
+        encryptor_url=config.ENCRYPTOR_URL,
+        encryptor_system=config.ENCRYPTOR_SYSTEM,
+        encryptor_token=config.ENCRYPTOR_TOKEN,
+        connection_limit_per_host=config.INGEST_HTTP_CONNECTION_LIMIT_PER_HOST,
+        keepalive_timeout=datetime.timedelta(
+            seconds=config.INGEST_HTTP_KEEPALIVE_TIMEOUT_SECONDS
+        ),
+        dns_cache_ttl=datetime.timedelta(
+            seconds=config.INGEST_HTTP_DNS_CACHE_TTL_SECONDS
+        ),
+        request_timeout=datetime.timedelta(
+            seconds=config.INGEST_HTTP_REQUEST_TIMEOUT_SECONDS
+        ),
+        connect_timeout=datetime.timedelta(
+            seconds=config.INGEST_HTTP_CONNECT_TIMEOUT_SECONDS
+        ),
+        decrypt_batch_path=config.ENCRYPTOR_BATCH_DECRYPT_PATH or None,
+        decrypt_batch_size=config.ENCRYPTOR_BATCH_DECRYPT_SIZE,
+        decrypt_batch_max_wait=datetime.timedelta(
+            seconds=config.ENCRYPTOR_BATCH_DECRYPT_MAX_WAIT_SECONDS
+        ),
+    )
+    logger.info("Started pooled HTTP clients")
+
+
+async def close_http_clients(unused_app):
+    global _http_clients
+    if _http_clients is not None:
+        await _http_clients.close()
+        _http_clients = None
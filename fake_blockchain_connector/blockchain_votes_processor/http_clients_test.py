@@ -0,0 +1,52 @@
+import asyncio
+import socket
+
+import aiohttp.web
+
+import http_clients
+
+_HOSTNAME = "127.0.0.1"
+
+
+async def _request_twice() -> tuple[list[dict], set]:
+    peers = set()
+    headers = []
+
+    async def decrypt(request):
+        peers.add(request.transport.get_extra_info("peername"))
+        headers.append(
+            {key: request.headers.get(key) for key in ("SYSTEM", "SYSTEM_TOKEN")}
+        )
+        return aiohttp.web.json_response({"data": {"result": "{}"}})
+
+    app = aiohttp.web.Application()
+    app.router.add_get("/api/encryption/decrypt", decrypt)
+    runner = aiohttp.web.AppRunner(app)
+    await runner.setup()
+    with socket.socket() as sock:
+        sock.bind((_HOSTNAME, 0))
+        port = sock.getsockname()[1]
+    site = aiohttp.web.TCPSite(runner, _HOSTNAME, port)
+    await site.start()
+
+    clients = http_clients.HttpClients(
+        encryptor_url=f"http://{_HOSTNAME}:{port}",
+        encryptor_system="TestSystem",
+        encryptor_token="TOKEN",
+    )
+    try:
+        for _ in range(2):
+            async with clients.encryptor.get(
+                "/api/encryption/decrypt", raise_for_status=True
+            ) as resp:
+                await resp.json()
+    finally:
+        await clients.close()
+        await runner.cleanup()
+    return headers, peers
+
+
+def test_encryptor_session_reuses_connection_and_sends_credentials():
+    headers, peers = asyncio.run(_request_twice())
+    assert headers == [{"SYSTEM": "TestSystem", "SYSTEM_TOKEN": "TOKEN"}] * 2
+    assert len(peers) == 1
@@ -0,0 +1,256 @@
+"""Pushes synthetic votes through the vote ingest path and measures its
+sustained throughput.
+
+Publishes encrypted vote messages into `mgik_queue-<key>` queues of a RabbitMQ
+broker, while the blockchain connector (main.app) consumes them in-process and
+talks to a stand-in encryptor and proxy. Arrivals follow an open-loop schedule,
+at a constant rate or as a Poisson process: publishing never waits for the
+consumers, so when they fall behind it shows up as queue depth.
+
+Reports queue depth over time, achieved throughput, end-to-end latency (from
+publishing to the proxy) and per-stage latency percentiles of the connector.
+
+Needs a RabbitMQ broker, configured with the RABBIT_MQ_* settings. The load
+test queues are purged before the run.
+
+Usage: python ingest_load_benchmark.py --rate 500 --duration 60 --votings 4
+"""
+
+import argparse
+import asyncio
+import datetime
+import json
+import logging
+import os
+import random
+import time
+
+import aio_pika
+import numpy as np
+
+import config
+import main as connector
+import stand_in_services
+
+# A TxStoreBallot of a real vote is about this large.
+_TX_SIZE = 400
+
+_STAGES = ("queue_wait", "decrypt", "proxy", "total")
+
+
+def _vote_message(rng: random.Random) -> bytes:
+    vote = {
+        "voterAddress": os.urandom(32).hex(),
+        "tx": os.urandom(_TX_SIZE).hex(),
+        "voteDateTime": time.time(),
+        "encryptedGroupId": str(rng.getrandbits(64)),
+    }
+    return stand_in_services.encrypt(json.dumps(vote)).encode("utf-8")
+
+
+def _arrival_offsets(args: argparse.Namespace, rng: random.Random) -> list[float]:
+    """Seconds from the start at which each vote is published."""
+    num_votes = int(args.rate * args.duration)
+    if args.arrival == "constant":
+        return [vote / args.rate for vote in range(num_votes)]
+    offsets = []
+    offset = 0.0
+    for _ in range(num_votes):
+        offset += rng.expovariate(args.rate)
+        offsets.append(offset)
+    return offsets
+
+
+class _Publisher:
+    def __init__(self, channel: aio_pika.abc.AbstractChannel, queue_names: list[str]):
+        self._channel = channel
+        self._queue_names = queue_names
+        self.published = 0
+        # How far behind the schedule the publisher got, seconds.
+        self.max_lag = 0.0
+
+    async def run(self, offsets: list[float], rng: random.Random):
+        started_at = time.monotonic()
+        for offset in offsets:
+            delay = started_at + offset - time.monotonic()
+            if delay > 0:
+                await asyncio.sleep(delay)
+            else:
+                self.max_lag = max(self.max_lag, -delay)
+            await self._channel.default_exchange.publish(
+                aio_pika.Message(
+                    _vote_message(rng),
+                    delivery_mode=aio_pika.DeliveryMode.PERSISTENT,
+                    timestamp=datetime.datetime.now(datetime.timezone.utc),
+                ),
+                routing_key=self._queue_names[self.published % len(self._queue_names)],
+            )
+            self.published += 1
+
+
+async def _queue_depth(
+    channel: aio_pika.abc.AbstractChannel, queue_names: list[str]
+) -> int:
+    depth = 0
+    for queue_name in queue_names:
+        queue = await channel.declare_queue(queue_name, passive=True)
+        depth += queue.declaration_result.message_count
+    return depth
+
+
+def _processed() -> int:
+    return sum(
+        stats.acked + stats.dead_lettered + stats.rejected
+        for stats in connector.queue_stats.values()
+    )
+
+
+async def _sample(
+    channel: aio_pika.abc.AbstractChannel,
+    queue_names: list[str],
+    publisher: _Publisher,
+    proxy: stand_in_services.StandInProxy,
+    interval: float,
+):
+    started_at = time.monotonic()
+    last_votes = 0
+    print(f"{'time':>7} {'published':>10} {'delivered':>10} {'rate/s':>9} {'depth':>8}")
+    while True:
+        await asyncio.sleep(interval)
+        votes = proxy.votes
+        print(
+            f"{time.monotonic() - started_at:7.1f} {publisher.published:10} "
+            f"{votes:10} {(votes - last_votes) / interval:9.1f} "
+            f"{await _queue_depth(channel, queue_names):8}"
+        )
+        last_votes = votes
+
+
+def _format_seconds(value: float | None) -> str:
+    return "     -" if value is None else f"{value * 1000:8.1f}ms"
+
+
+def _report(
+    args: argparse.Namespace,
+    voting_ids: list[str],
+    publisher: _Publisher,
+    proxy: stand_in_services.StandInProxy,
+    elapsed: float,
+):
+    print()
+    print(
+        f"Published {publisher.published} votes, "
+        f"{publisher.published / args.duration:.1f}/s against {args.rate:.1f}/s "
+        f"targeted, at most {publisher.max_lag:.3f}s behind the schedule"
+    )
+    print(
+        f"Delivered {proxy.votes} votes in {elapsed:.1f}s, {proxy.votes / elapsed:.1f}/s"
+    )
+    if proxy.vote_latencies:
+        p50, p90, p99 = np.percentile(proxy.vote_latencies, [50, 90, 99])
+        print(
+            f"End to end latency: p50 {_format_seconds(p50)} "
+            f"p90 {_format_seconds(p90)} p99 {_format_seconds(p99)} "
+            f"max {_format_seconds(max(proxy.vote_latencies))}"
+        )
+
+    for voting_id in voting_ids:
+        print(f"{voting_id}: {connector.queue_stats[voting_id].to_json()}")
+        for stage in _STAGES:
+            quantiles = [
+                connector.INGEST_STAGE_DURATION.quantile(q, voting_id, stage)
+                for q in (0.5, 0.9, 0.99)
+            ]
+            print(
+                f"  {stage:<10} p50 {_format_seconds(quantiles[0])} "
+                f"p90 {_format_seconds(quantiles[1])} "
+                f"p99 {_format_seconds(quantiles[2])}"
+            )
+
+
+async def main(args: argparse.Namespace):
+    # The connector logs every message, which would dominate the run.
+    logging.getLogger().setLevel(logging.WARNING)
+    rng = random.Random(args.seed)
+
+    queues = {
+        f"load-test-{voting}": f"load_test_voting_{voting}"
+        for voting in range(args.votings)
+    }
+    queue_names = [
+        f"{config.BASE_LISTEN_QUEUE_NAME}-{queue_key}" for queue_key in queues
+    ]
+
+    encryptor = stand_in_services.StandInEncryptor(
+        latency=datetime.timedelta(milliseconds=args.encryptor_latency_ms)
+    )
+    proxy = stand_in_services.StandInProxy(
+        latency=datetime.timedelta(milliseconds=args.proxy_latency_ms)
+    )
+    arm = stand_in_services.StandInArm(queues)
+
+    connection = await aio_pika.connect_robust(
+        host=config.RABBIT_MQ_HOSTNAME,
+        port=config.RABBIT_MQ_PORT,
+        login=config.RABBIT_MQ_LOGIN,
+        password=config.RABBIT_MQ_PASSWORD,
+    )
+    async with connection:
+        # Without publisher confirms, so that the broker's acks do not pace the
+        # open-loop schedule.
+        channel = await connection.channel(publisher_confirms=False)
+        for queue_name in queue_names:
+            queue = await channel.declare_queue(queue_name, durable=True)
+            await queue.purge()
+
+        async with (
+            stand_in_services.serve(encryptor.app) as encryptor_url,
+            stand_in_services.serve(proxy.app) as proxy_url,
+            stand_in_services.serve(arm.app) as arm_url,
+        ):
+            config.ENCRYPTOR_URL = encryptor_url
+            config.BLOCKCHAIN_PROCESS_VOTE_URI = proxy_url + "/process_vote"
+            config.ARM_VOITING_URL = arm_url + "/arm/config"
+
+            async with stand_in_services.serve(connector.app):
+                publisher = _Publisher(channel, queue_names)
+                sampler = asyncio.create_task(
+                    _sample(
+                        channel, queue_names, publisher, proxy, args.sample_interval
+                    )
+                )
+                started_at = time.monotonic()
+                try:
+                    await publisher.run(_arrival_offsets(args, rng), rng)
+                    drain_deadline = time.monotonic() + args.drain_timeout
+                    while (
+                        _processed() < publisher.published
+                        and time.monotonic() < drain_deadline
+                    ):
+                        await asyncio.sleep(0.1)
+                    elapsed = time.monotonic() - started_at
+                finally:
+                    sampler.cancel()
+
+    _report(args, list(queues.values()), publisher, proxy, elapsed)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter
+    )
+    parser.add_argument("--rate", type=float, default=200, help="Votes per second")
+    parser.add_argument("--duration", type=float, default=30, help="Seconds")
+    parser.add_argument("--votings", type=int, default=2)
+    parser.add_argument("--arrival", choices=("constant", "poisson"), default="poisson")
+    parser.add_argument("--encryptor-latency-ms", type=float, default=5)
+    parser.add_argument("--proxy-latency-ms", type=float, default=20)
+    parser.add_argument("--sample-interval", type=float, default=1)
+    parser.add_argument(
+        "--drain-timeout",
+        type=float,
+        default=60,
+        help="Seconds to wait for the queues to drain after publishing",
+    )
+    parser.add_argument("--seed", type=int, default=0)
+    asyncio.run(main(parser.parse_args()))
@@ -2,6 +2,9 @@ import json
 import hashlib
 import functools
 import logging
+import time
+import collections
+import dataclasses
 
 import asyncio
 import aiohttp
@@ -9,6 +12,9 @@ import aiohttp.web
 import aio_pika
 
 import config
+import dead_letters
+import http_clients
+import metrics
 
 
 logging.basicConfig(level=logging.INFO)
@@ -24,102 +30,231 @@ async def get_queues_ids():
 
 
 async def decrypt_message(message_str):
-    async with aiohttp.ClientSession(
-        config.ENCRYPTOR_URL,
-        headers={
-            "SYSTEM": config.ENCRYPTOR_SYSTEM,
-            "SYSTEM_TOKEN": config.ENCRYPTOR_TOKEN,
-        },
-    ) as session:
-        async with session.get(
-            "/api/encryption/decrypt",
-            params={"data[base64body]": message_str},
-            raise_for_status=True,
-        ) as resp:
-            return await resp.json()
+    return await http_clients.get().decrypt_batcher.decrypt(message_str)
 
 
 async def send_message_to_proxy(message):
-    async with aiohttp.ClientSession() as session:
-        async with session.post(
-            config.BLOCKCHAIN_PROCESS_VOTE_URI, raise_for_status=True, json=message
-        ) as resp:
-            return await resp.json()
-
-
-async def receive_message(message: aio_pika.IncomingMessage, voting_id: str):
-    async with message.process():
-        message_body = message.body.decode("utf-8")
-        logger.info(f"Got raw message {message_body}")
+    async with http_clients.get().proxy.post(
+        config.BLOCKCHAIN_PROCESS_VOTE_URI, raise_for_status=True, json=message
+    ) as resp:
+        return await resp.json()
+
+
+@dataclasses.dataclass
+class QueueStats:
+    in_flight: int = 0
+    acked: int = 0
+    retried: int = 0
+    dead_lettered: int = 0
+    rejected: int = 0
+
+    def to_json(self) -> dict[str, int]:
+        return dataclasses.asdict(self)
+
+
+queue_stats: dict[str, QueueStats] = collections.defaultdict(QueueStats)
+
+INGEST_STAGE_DURATION = metrics.REGISTRY.histogram(
+    "ingest_stage_duration_seconds",
+    "Time a vote spends in each stage of the ingest path.",
+    ("voting_id", "stage"),
+)
+INGEST_MESSAGES = metrics.REGISTRY.counter(
+    "ingest_messages_total",
+    "Votes handled by the ingest path, by outcome.",
+    ("voting_id", "outcome"),
+)
+
+
+async def process_message(message: aio_pika.IncomingMessage, voting_id: str):
+    message_body = message.body.decode("utf-8")
+    logger.info(f"Got raw message {message_body}")
+    with INGEST_STAGE_DURATION.time(voting_id, "decrypt"):
         decrypted_message = await decrypt_message(message_body)
-        decrypted_message_body = decrypted_message.get("data", {}).get("result")
+    decrypted_message_body = decrypted_message.get("data", {}).get("result")
 
-        if decrypted_message_body is None:
-            logger.info(f"Got broken message, ignoring: {decrypted_message}")
-            return
+    if decrypted_message_body is None:
+        raise ValueError(f"Got broken message: {decrypted_message}")
 
-        decrypted_message_json = json.loads(decrypted_message_body)
-        logger.info(f"Got message: {decrypted_message_json}")
-        decrypted_message_json["votingId"] = voting_id
+    decrypted_message_json = json.loads(decrypted_message_body)
+    logger.info(f"Got message: {decrypted_message_json}")
+    decrypted_message_json["votingId"] = voting_id
 
+    with INGEST_STAGE_DURATION.time(voting_id, "proxy"):
         proxy_response = await send_message_to_proxy(decrypted_message_json)
-        logger.info(f"Got response from proxy: {proxy_response}")
-
-
-async def main():
+    logger.info(f"Got response from proxy: {proxy_response}")
+
+
+async def receive_message(
+    message: aio_pika.IncomingMessage,
+    voting_id: str,
+    queue_name: str,
+    channel: aio_pika.abc.AbstractChannel,
+    worker_slots: asyncio.Semaphore,
+):
+    # AMQP timestamps have a second resolution, without one only the wait
+    # for a worker is counted.
+    enqueued_at = message.timestamp.timestamp() if message.timestamp else time.time()
+    stats = queue_stats[voting_id]
+    stats.in_flight += 1
+    outcome = "rejected"
     try:
-        connection = await aio_pika.connect_robust(
-            host=config.RABBIT_MQ_HOSTNAME,
-            port=config.RABBIT_MQ_PORT,
-            login=config.RABBIT_MQ_LOGIN,
-            password=config.RABBIT_MQ_PASSWORD,
-        )
-
-        queue_ids = await get_queues_ids()
-        logger.info(f"Configuring queues: {queue_ids}")
-        async with connection:
-            channel = await connection.channel()
-
-            for queue_key, voting_id in queue_ids.items():
-                queue_name = f"{config.BASE_LISTEN_QUEUE_NAME}-{queue_key}"
-                queue = await channel.get_queue(queue_name, ensure=False)
+        # The message is requeued only if it could not be parked.
+        async with worker_slots, message.process(requeue=True):
+            INGEST_STAGE_DURATION.observe(
+                time.time() - enqueued_at, voting_id, "queue_wait"
+            )
+            try:
+                await process_message(message, voting_id)
+            except Exception as e:
+                if await dead_letters.park(
+                    channel, message, queue_name=queue_name, voting_id=voting_id, exc=e
+                ):
+                    outcome = "retried"
+                    stats.retried += 1
+                else:
+                    outcome = "dead_lettered"
+                    stats.dead_lettered += 1
+            else:
+                outcome = "acked"
+                stats.acked += 1
+    except Exception:
+        stats.rejected += 1
+        raise
+    finally:
+        stats.in_flight -= 1
+        INGEST_MESSAGES.inc(voting_id, outcome)
+        INGEST_STAGE_DURATION.observe(time.time() - enqueued_at, voting_id, "total")
+
+
+def diff_queues(
+    active: dict[str, str], wanted: dict[str, str]
+) -> tuple[list[str], list[str]]:
+    """Returns queue keys to stop and to start to turn `active` into `wanted`.
+
+    Both map a queue key to the voting id. A queue whose voting id changed is
+    restarted, so that its consumer is bound to the new id.
+    """
+    to_stop = [
+        queue_key
+        for queue_key, voting_id in active.items()
+        if wanted.get(queue_key) != voting_id
+    ]
+    to_start = [
+        queue_key
+        for queue_key, voting_id in wanted.items()
+        if active.get(queue_key) != voting_id
+    ]
+    return to_stop, to_start
+
+
+@dataclasses.dataclass
+class QueueConsumer:
+    voting_id: str
+    channel: aio_pika.abc.AbstractChannel
+    queue: aio_pika.abc.AbstractQueue
+    consumer_tag: str
 
-                async def receive_message_partial(x):
-                    return await receive_message(x, voting_id)
+    @classmethod
+    async def start(
+        cls,
+        connection: aio_pika.abc.AbstractRobustConnection,
+        queue_key: str,
+        voting_id: str,
+    ) -> "QueueConsumer":
+        queue_name = f"{config.BASE_LISTEN_QUEUE_NAME}-{queue_key}"
+        # A channel per queue, so that the prefetch limit applies to each
+        # voting separately and a busy voting cannot starve the others.
+        channel = await connection.channel()
+        await channel.set_qos(prefetch_count=config.RABBIT_MQ_PREFETCH_COUNT)
+        queue = await channel.get_queue(queue_name, ensure=False)
+        await dead_letters.declare_queues(channel, queue_name, voting_id)
+
+        logger.info(
+            f"Starting consuming on queue {queue_name} (voting_id: {voting_id})."
+        )
+        consumer_tag = await queue.consume(
+            functools.partial(
+                receive_message,
+                voting_id=voting_id,
+                queue_name=queue_name,
+                channel=channel,
+                worker_slots=asyncio.Semaphore(config.RABBIT_MQ_WORKERS_PER_VOTING),
+            )
+        )
+        return cls(
+            voting_id=voting_id,
+            channel=channel,
+            queue=queue,
+            consumer_tag=consumer_tag,
+        )
 
-                logger.info(
-                    f"Starting consuming on queue {queue_name} (voting_id: {voting_id})."
-                )
-                await queue.consume(receive_message_partial)
+    async def stop(self):
+        logger.info(f"Stopping consuming on queue {self.queue.name}.")
+        await self.queue.cancel(self.consumer_tag)
+        await self.channel.close()
 
-            logger.info("All queues are listening.")
-            while True:
-                await asyncio.sleep(100)
-    except Exception as e:
-        logger.error(e, exc_info=True)
-        raise
-    finally:
-        logger.info("Stopping connection, deleting queue listening")
 
+class ConsumerManager:
+    """Keeps a consumer for every queue in the ARM config.
 
-class BlockchainConnector:
-    __instance = None
+    A refresh only starts and stops the consumers of the queues that changed,
+    the RabbitMQ connection and the other consumers stay intact.
+    """
 
     def __init__(self):
-        self.task = asyncio.create_task(main())
+        self._connection: aio_pika.abc.AbstractRobustConnection | None = None
+        self._consumers: dict[str, QueueConsumer] = {}
+        self._lock = asyncio.Lock()
+        # Separate from `_lock`, the dead-letter routes get the connection
+        # without waiting for a refresh.
+        self._connection_lock = asyncio.Lock()
+
+    async def get_connection(self) -> aio_pika.abc.AbstractRobustConnection:
+        async with self._connection_lock:
+            if self._connection is None:
+                self._connection = await aio_pika.connect_robust(
+                    host=config.RABBIT_MQ_HOSTNAME,
+                    port=config.RABBIT_MQ_PORT,
+                    login=config.RABBIT_MQ_LOGIN,
+                    password=config.RABBIT_MQ_PASSWORD,
+                )
+            return self._connection
+
+    async def refresh(self) -> dict[str, list[str]]:
+        async with self._lock:
+            queue_ids = await get_queues_ids()
+            connection = await self.get_connection()
+            to_stop, to_start = diff_queues(
+                {
+                    queue_key: consumer.voting_id
+                    for queue_key, consumer in self._consumers.items()
+                },
+                queue_ids,
+            )
+            for queue_key in to_stop:
+                await self._consumers.pop(queue_key).stop()
+            for queue_key in to_start:
+                self._consumers[queue_key] = await QueueConsumer.start(
+                    connection, queue_key, queue_ids[queue_key]
+                )
+            logger.info(
+                f"Queues refreshed, stopped: {to_stop}, started: {to_start}, "
+                f"listening: {list(self._consumers)}"
+            )
+            return {"stopped": to_stop, "started": to_start}
 
-    @classmethod
-    def get_instance(cls):
-        if not cls.__instance:
-            cls.__instance = cls()
-        return cls.__instance
+    async def close(self):
+        async with self._lock:
+            logger.info("Stopping connection, deleting queue listening")
+            self._consumers.clear()
+            async with self._connection_lock:
+                if self._connection is not None:
+                    await self._connection.close()
+                    self._connection = None
 
-    @classmethod
-    def recreate(cls):
-        if cls.__instance:
-            cls.__instance.task.cancel()
-            cls.__instance = None
-        return cls.get_instance()
+
+consumer_manager = ConsumerManager()
 
 
 routes = aiohttp.web.RouteTableDef()
@@ -127,19 +262,59 @@ routes = aiohttp.web.RouteTableDef()
 
 @routes.get("/blockchain_connector/refresh")
 async def refresh_queues(unused_request):
-    logger.info("Recreating queues")
-    BlockchainConnector.recreate()
-    return aiohttp.web.Response(text="ok")
+    logger.info("Refreshing queues")
+    return aiohttp.web.json_response(await consumer_manager.refresh())
+
+
+@routes.get("/blockchain_connector/stats")
+async def get_stats(unused_request):
+    return aiohttp.web.json_response(
+        {voting_id: stats.to_json() for voting_id, stats in queue_stats.items()}
+    )
+
+
+def _limit(request: aiohttp.web.Request) -> int:
+    return min(int(request.query.get("limit", 100)), 1000)
+
+
+@routes.get("/blockchain_connector/dead_letters/{voting_id}")
+async def get_dead_letters(request):
+    connection = await consumer_manager.get_connection()
+    return aiohttp.web.json_response(
+        await dead_letters.peek(
+            connection, request.match_info["voting_id"], _limit(request)
+        )
+    )
+
+
+@routes.post("/blockchain_connector/dead_letters/{voting_id}/replay")
+async def replay_dead_letters(request):
+    connection = await consumer_manager.get_connection()
+    replayed = await dead_letters.replay(
+        connection, request.match_info["voting_id"], _limit(request)
+    )
+    return aiohttp.web.json_response({"replayed": replayed})
 
 
 async def start_queues(unused_app):
-    BlockchainConnector.get_instance()
+    try:
+        await consumer_manager.refresh()
+    except Exception as e:
+        logger.error(e, exc_info=True)
+
+
+async def stop_queues(unused_app):
+    await consumer_manager.close()
 
 
 app = aiohttp.web.Application()
 app.add_routes(routes)
+metrics.setup(app)
 
+app.on_startup.append(http_clients.start_http_clients)
 app.on_startup.append(start_queues)
+app.on_cleanup.append(stop_queues)
+app.on_cleanup.append(http_clients.close_http_clients)
 
 if __name__ == "__main__":
     aiohttp.web.run_app(app, port=config.LISTEN_PORT)
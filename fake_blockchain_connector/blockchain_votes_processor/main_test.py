@@ -0,0 +1,222 @@
+import asyncio
+import contextlib
+import dataclasses
+import datetime
+from typing import Any
+
+import aiohttp
+import pytest
+
+import config
+import main
+
+
+def test_diff_queues_touches_only_changed_queues():
+    to_stop, to_start = main.diff_queues(
+        active={"1": "voting_a", "2": "voting_b", "3": "voting_c"},
+        wanted={"1": "voting_a", "3": "voting_d", "4": "voting_e"},
+    )
+    assert to_stop == ["2", "3"]
+    assert to_start == ["3", "4"]
+
+
+def test_diff_queues_is_empty_when_config_is_unchanged():
+    queues = {"1": "voting_a", "2": "voting_b"}
+    assert main.diff_queues(active=queues, wanted=dict(queues)) == ([], [])
+
+
+@dataclasses.dataclass
+class _Message:
+    body: bytes = b"vote"
+    headers: dict[str, Any] = dataclasses.field(default_factory=dict)
+    timestamp: datetime.datetime | None = None
+    content_type: str | None = None
+    content_encoding: str | None = None
+    priority: int | None = None
+    correlation_id: str | None = None
+    reply_to: str | None = None
+    message_id: str | None = None
+    type: str | None = None
+    user_id: str | None = None
+    app_id: str | None = None
+    # "acked", or "rejected" and whether it was requeued.
+    outcome: tuple[str, bool] | None = None
+
+    @contextlib.asynccontextmanager
+    async def process(self, requeue: bool = False):
+        try:
+            yield
+        except Exception:
+            self.outcome = ("rejected", requeue)
+            raise
+        self.outcome = ("acked", False)
+
+
+class _Exchange:
+    def __init__(self, fail: bool = False):
+        self.published = []
+        self._fail = fail
+
+    async def publish(self, message, routing_key):
+        if self._fail:
+            raise aiohttp.ClientConnectionError("Channel is closed")
+        self.published.append(routing_key)
+
+
+class _Queue:
+    name = "mgik_queue-1"
+
+    def __init__(self):
+        self.callback = None
+
+    async def consume(self, callback):
+        self.callback = callback
+        return "consumer-tag"
+
+
+class _Channel:
+    def __init__(self, fail_publishing: bool = False):
+        self.default_exchange = _Exchange(fail=fail_publishing)
+        self.prefetch_count = None
+        self.queue = _Queue()
+        self.declared_queues = []
+
+    async def set_qos(self, prefetch_count):
+        self.prefetch_count = prefetch_count
+
+    async def get_queue(self, name, ensure):
+        return self.queue
+
+    async def declare_queue(self, name, **unused_kwargs):
+        self.declared_queues.append(name)
+
+
+class _Connection:
+    def __init__(self):
+        self.channels = []
+
+    async def channel(self):
+        self.channels.append(_Channel())
+        return self.channels[-1]
+
+
+def _receive(
+    message: _Message, voting_id: str, channel: _Channel | None = None
+) -> main.QueueStats:
+    asyncio.run(
+        main.receive_message(
+            message,
+            voting_id=voting_id,
+            queue_name="mgik_queue-1",
+            channel=channel or _Channel(),
+            worker_slots=asyncio.Semaphore(1),
+        )
+    )
+    return main.queue_stats[voting_id]
+
+
+def _process_raising(exc: Exception):
+    async def process_message(unused_message, unused_voting_id):
+        raise exc
+
+    return process_message
+
+
+async def _process_ok(unused_message, unused_voting_id):
+    pass
+
+
+def test_receive_message_acks_processed_votes(monkeypatch):
+    monkeypatch.setattr(main, "process_message", _process_ok)
+    message = _Message()
+    stats = _receive(message, "voting_acked")
+    assert message.outcome == ("acked", False)
+    assert stats == main.QueueStats(acked=1)
+
+
+@pytest.mark.parametrize(
+    "exc, expected_stats",
+    [
+        (aiohttp.ClientConnectionError(), main.QueueStats(retried=1)),
+        (ValueError("Got broken message"), main.QueueStats(dead_lettered=1)),
+    ],
+)
+def test_receive_message_parks_failed_votes(monkeypatch, exc, expected_stats):
+    monkeypatch.setattr(main, "process_message", _process_raising(exc))
+    message = _Message()
+    channel = _Channel()
+    stats = _receive(message, f"voting_parked_{type(exc).__name__}", channel)
+    # Parked messages are acked, their copy lives in another queue.
+    assert message.outcome == ("acked", False)
+    assert len(channel.default_exchange.published) == 1
+    assert stats == expected_stats
+
+
+def test_receive_message_requeues_votes_it_cannot_park(monkeypatch):
+    monkeypatch.setattr(
+        main, "process_message", _process_raising(ValueError("Got broken message"))
+    )
+    message = _Message()
+    with pytest.raises(aiohttp.ClientConnectionError):
+        _receive(message, "voting_rejected", _Channel(fail_publishing=True))
+    assert message.outcome == ("rejected", True)
+    assert main.queue_stats["voting_rejected"] == main.QueueStats(rejected=1)
+
+
+def test_queue_consumer_limits_prefetch_and_concurrent_votes(monkeypatch):
+    monkeypatch.setattr(config, "RABBIT_MQ_PREFETCH_COUNT", 7)
+    monkeypatch.setattr(config, "RABBIT_MQ_WORKERS_PER_VOTING", 2)
+    running = 0
+    max_running = 0
+    release = asyncio.Event()
+
+    async def process_message(unused_message, unused_voting_id):
+        nonlocal running, max_running
+        running += 1
+        max_running = max(max_running, running)
+        await release.wait()
+        running -= 1
+
+    monkeypatch.setattr(main, "process_message", process_message)
+
+    async def run() -> tuple[_Channel, list[int]]:
+        connection = _Connection()
+        consumer = await main.QueueConsumer.start(connection, "1", "voting_limited")
+        [channel] = connection.channels
+        deliveries = [
+            asyncio.create_task(channel.queue.callback(_Message())) for _ in range(5)
+        ]
+        in_flight = []
+        for _ in range(3):
+            await asyncio.sleep(0.01)
+            in_flight.append(main.queue_stats["voting_limited"].in_flight)
+        release.set()
+        await asyncio.gather(*deliveries)
+        assert consumer.consumer_tag == "consumer-tag"
+        return channel, in_flight
+
+    channel, in_flight = asyncio.run(run())
+    assert channel.prefetch_count == 7
+    assert max_running == 2
+    # Votes waiting for a worker are in flight too.
+    assert in_flight == [5, 5, 5]
+    assert main.queue_stats["voting_limited"] == main.QueueStats(acked=5)
+
+
+def test_consumer_manager_connects_once_under_concurrent_requests(monkeypatch):
+    connections = []
+
+    async def connect_robust(**unused_kwargs):
+        await asyncio.sleep(0.01)
+        connections.append(_Connection())
+        return connections[-1]
+
+    monkeypatch.setattr(main.aio_pika, "connect_robust", connect_robust)
+
+    async def run() -> list:
+        manager = main.ConsumerManager()
+        return await asyncio.gather(*(manager.get_connection() for _ in range(3)))
+
+    results = asyncio.run(run())
+    assert len(connections) == 1
+    assert results == connections * 3
@@ -0,0 +1,224 @@
+"""In-process counters and histograms served in the Prometheus text format.
+
+Recording a value is a dict lookup and a bisect, so the metrics can stay
+enabled on the hot path.
+"""
+
+import bisect
+import contextlib
+import math
+import time
+from typing import Iterator
+
+import aiohttp.web
+
+# Latency buckets in seconds, from 1ms to 30s.
+DEFAULT_BUCKETS = (
+    0.001,
+    0.0025,
+    0.005,
+    0.01,
+    0.025,
+    0.05,
+    0.1,
+    0.25,
+    0.5,
+    1.0,
+    2.5,
+    5.0,
+    10.0,
+    30.0,
+)
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_labels(names: tuple[str, ...], values: tuple[str, ...]) -> str:
+    if not names:
+        return ""
+    labels = ",".join(
+        f'{name}="{_escape(str(value))}"' for name, value in zip(names, values)
+    )
+    return "{" + labels + "}"
+
+
+def _format_value(value: float) -> str:
+    if math.isinf(value):
+        return "+Inf" if value > 0 else "-Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Counter:
+    def __init__(self, name: str, documentation: str, label_names: tuple[str, ...]):
+        self.name = name
+        self.documentation = documentation
+        self.label_names = label_names
+        self._values: dict[tuple[str, ...], float] = {}
+
+    def inc(self, *label_values: str, amount: float = 1):
+        self._values[label_values] = self._values.get(label_values, 0) + amount
+
+    def value(self, *label_values: str) -> float:
+        return self._values.get(label_values, 0)
+
+    def render(self) -> Iterator[str]:
+        yield f"# HELP {self.name} {self.documentation}"
+        yield f"# TYPE {self.name} counter"
+        for label_values, value in self._values.items():
+            labels = _format_labels(self.label_names, label_values)
+            yield f"{self.name}{labels} {_format_value(value)}"
+
+
+class _HistogramSeries:
+    __slots__ = ("bucket_counts", "sum", "count")
+
+    def __init__(self, num_buckets: int):
+        self.bucket_counts = [0] * num_buckets
+        self.sum = 0.0
+        self.count = 0
+
+
+class Histogram:
+    def __init__(
+        self,
+        name: str,
+        documentation: str,
+        label_names: tuple[str, ...],
+        buckets: tuple[float, ...] = DEFAULT_BUCKETS,
+    ):
+        self.name = name
+        self.documentation = documentation
+        self.label_names = label_names
+        self._buckets = tuple(sorted(buckets)) + (math.inf,)
+        self._series: dict[tuple[str, ...], _HistogramSeries] = {}
+
+    def observe(self, value: float, *label_values: str):
+        series = self._series.get(label_values)
+        if series is None:
+            series = self._series[label_values] = _HistogramSeries(len(self._buckets))
+        # Counts are kept per bucket and accumulated on render.
+        series.bucket_counts[bisect.bisect_left(self._buckets, value)] += 1
+        series.sum += value
+        series.count += 1
+
+    @contextlib.contextmanager
+    def time(self, *label_values: str) -> Iterator[None]:
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start, *label_values)
+
+    def count(self, *label_values: str) -> int:
+        series = self._series.get(label_values)
+        return 0 if series is None else series.count
+
+    def quantile(self, q: float, *label_values: str) -> float | None:
+        """Estimates the q-quantile by linear interpolation within its bucket,
+        like Prometheus' histogram_quantile."""
+        series = self._series.get(label_values)
+        if series is None or series.count == 0:
+            return None
+        rank = q * series.count
+        cumulative = 0
+        lower_bound = 0.0
+        for upper_bound, bucket_count in zip(self._buckets, series.bucket_counts):
+            if bucket_count and cumulative + bucket_count >= rank:
+                if math.isinf(upper_bound):
+                    # Nothing is known above the largest finite bucket.
+                    return lower_bound
+                return lower_bound + (upper_bound - lower_bound) * (
+                    (rank - cumulative) / bucket_count
+                )
+            cumulative += bucket_count
+            lower_bound = upper_bound
+        return lower_bound
+
+    def render(self) -> Iterator[str]:
+        yield f"# HELP {self.name} {self.documentation}"
+        yield f"# TYPE {self.name} histogram"
+        label_names = self.label_names + ("le",)
+        for label_values, series in self._series.items():
+            cumulative = 0
+            for upper_bound, bucket_count in zip(self._buckets, series.bucket_counts):
+                cumulative += bucket_count
+                labels = _format_labels(
+                    label_names, label_values + (_format_value(upper_bound),)
+                )
+                yield f"{self.name}_bucket{labels} {cumulative}"
+            labels = _format_labels(self.label_names, label_values)
+            yield f"{self.name}_sum{labels} {_format_value(series.sum)}"
+            yield f"{self.name}_count{labels} {series.count}"
+
+
+class Registry:
+    def __init__(self):
+        self._metrics: dict[str, Counter | Histogram] = {}
+
+    def _register(self, metric: Counter | Histogram) -> Counter | Histogram:
+        if metric.name in self._metrics:
+            raise ValueError(f"Metric {metric.name} is already registered")
+        self._metrics[metric.name] = metric
+        return metric
+
+    def counter(
+        self, name: str, documentation: str, label_names: tuple[str, ...] = ()
+    ) -> Counter:
+        return self._register(Counter(name, documentation, label_names))
+
+    def histogram(
+        self,
+        name: str,
+        documentation: str,
+        label_names: tuple[str, ...] = (),
+        buckets: tuple[float, ...] = DEFAULT_BUCKETS,
+    ) -> Histogram:
+        return self._register(Histogram(name, documentation, label_names, buckets))
+
+    def render(self) -> str:
+        lines = []
+        for metric in self._metrics.values():
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+
+REGISTRY = Registry()
+
+HTTP_REQUEST_DURATION = REGISTRY.histogram(
+    "http_request_duration_seconds",
+    "Time spent handling HTTP requests.",
+    ("route", "method", "status"),
+)
+
+
+@aiohttp.web.middleware
+async def _request_duration_middleware(request, handler):
+    route = request.match_info.route.resource
+    route_name = route.canonical if route is not None else "unmatched"
+    start = time.perf_counter()
+    status = 500
+    try:
+        response = await handler(request)
+        status = response.status
+        return response
+    except aiohttp.web.HTTPException as e:
+        status = e.status
+        raise
+    finally:
+        HTTP_REQUEST_DURATION.observe(
+            time.perf_counter() - start, route_name, request.method, str(status)
+        )
+
+
+async def _serve_metrics(unused_request):
+    return aiohttp.web.Response(
+        text=REGISTRY.render(), content_type="text/plain", charset="utf-8"
+    )
+
+
+def setup(app: aiohttp.web.Application):
+    """Adds a /metrics route and per-route request timings to `app`."""
+    app.middlewares.append(_request_duration_middleware)
+    app.router.add_get("/metrics", _serve_metrics)
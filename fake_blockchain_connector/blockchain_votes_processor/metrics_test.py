@@ -0,0 +1,79 @@
+import asyncio
+
+import aiohttp
+import aiohttp.web
+import pytest
+
+import metrics
+import stand_in_services
+
+
+def test_histogram_renders_cumulative_buckets():
+    registry = metrics.Registry()
+    histogram = registry.histogram(
+        "stage_seconds", "Stage latency.", ("stage",), buckets=(0.1, 1.0)
+    )
+    for value in (0.05, 0.1, 0.5, 2.0):
+        histogram.observe(value, "decrypt")
+
+    assert registry.render().splitlines() == [
+        "# HELP stage_seconds Stage latency.",
+        "# TYPE stage_seconds histogram",
+        'stage_seconds_bucket{stage="decrypt",le="0.1"} 2',
+        'stage_seconds_bucket{stage="decrypt",le="1.0"} 3',
+        'stage_seconds_bucket{stage="decrypt",le="+Inf"} 4',
+        'stage_seconds_sum{stage="decrypt"} 2.65',
+        'stage_seconds_count{stage="decrypt"} 4',
+    ]
+
+
+def test_histogram_quantile_interpolates_within_bucket():
+    histogram = metrics.Histogram(
+        "stage_seconds", "Stage latency.", ("stage",), buckets=(0.1, 1.0)
+    )
+    assert histogram.quantile(0.5, "decrypt") is None
+    for value in (0.05, 0.05, 0.5, 0.5, 0.5, 0.5, 0.5, 0.5, 0.5, 5.0):
+        histogram.observe(value, "decrypt")
+
+    assert histogram.quantile(0.1, "decrypt") == 0.05
+    assert histogram.quantile(0.5, "decrypt") == pytest.approx(0.1 + 0.9 * 3 / 7)
+    # The largest finite bucket bound is the best estimate above it.
+    assert histogram.quantile(0.99, "decrypt") == 1.0
+
+
+def test_counter_keeps_label_values_apart():
+    registry = metrics.Registry()
+    counter = registry.counter("votes_total", "Votes.", ("voting_id", "outcome"))
+    counter.inc("v1", "acked")
+    counter.inc("v1", "acked")
+    counter.inc("v2", "dead_lettered")
+
+    assert counter.value("v1", "acked") == 2
+    assert counter.value("v2", "acked") == 0
+    assert 'votes_total{voting_id="v2",outcome="dead_lettered"} 1' in (
+        registry.render()
+    )
+
+
+async def _ping(unused_request):
+    return aiohttp.web.Response()
+
+
+async def _get_metrics_after_request() -> str:
+    app = aiohttp.web.Application()
+    app.router.add_get("/ping", _ping)
+    metrics.setup(app)
+    async with stand_in_services.serve(app) as url:
+        async with aiohttp.ClientSession(base_url=url) as session:
+            async with session.get("/ping", raise_for_status=True):
+                pass
+            async with session.get("/metrics", raise_for_status=True) as resp:
+                return await resp.text()
+
+
+def test_metrics_route_reports_request_durations():
+    text = asyncio.run(_get_metrics_after_request())
+    assert (
+        'http_request_duration_seconds_count{route="/ping",method="GET",status="200"}'
+        in text
+    )
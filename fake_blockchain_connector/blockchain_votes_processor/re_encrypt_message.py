@@ -2,7 +2,9 @@ import dataclasses
 import logging
 import os
 import sys
+from typing import Any, Iterable
 
+import nacl.bindings
 import nacl.exceptions
 import nacl.public
 import nacl.utils
@@ -10,12 +12,13 @@ import exonum_client
 from exonum_client import crypto as exonum_crypto
 from google.protobuf import message as protobuf_message
 
+import choices_decoder
+
 # Add compiled protos to the current path, since it's required by protoc
 sys.path.append(os.path.join(os.path.dirname(__file__), "exonum_modules", "main"))
 
 from exonum_modules.main import transactions_pb2
 from exonum_modules.main import custom_types_pb2
-from exonum_modules.main import schema_pb2
 from exonum_modules.main.exonum import messages_pb2
 
 _INSTANCE_ID = 1001
@@ -163,23 +166,40 @@ def _decrypt_message(
     return None
 
 
+# (encrypted_message, nonce, public_key) of a message encrypted on our key.
+EncryptedMessage = tuple[bytes, bytes, bytes]
+
+
+def decrypt_messages(
+    encrypted_messages: Iterable[EncryptedMessage],
+    private_key: nacl.public.PrivateKey,
+) -> list[bytes | None]:
+    """Decrypts messages on the same private key, None for the ones that fail
+    to decrypt.
+
+    Same as decrypting every message with a nacl.public.Box, without creating
+    key and box objects per message.
+    """
+    private_key_bytes = private_key.encode()
+    result = []
+    for message, nonce, public_key in encrypted_messages:
+        try:
+            shared_key = nacl.bindings.crypto_box_beforenm(
+                public_key, private_key_bytes
+            )
+            result.append(
+                nacl.bindings.crypto_box_open_easy_afternm(message, nonce, shared_key)
+            )
+        except nacl.exceptions.CryptoError:
+            result.append(None)
+    return result
+
+
 def _decode_choices_proto(choices_encoded: bytes) -> list[int] | None:
-    if len(choices_encoded) < 2:
-        logging.warning(f"Got too short choices message: {choices_encoded.hex()}")
-        return None
-    offset = ((choices_encoded[0] << 8) | choices_encoded[1]) + 2
-    if len(choices_encoded) < offset:
-        logging.warning(
-            f"Got choices message shorter than offset: {choices_encoded.hex()}, offset: {offset}"
-        )
-        return None
-    original_message = choices_encoded[offset:]
-    choices_proto = schema_pb2.Choices()
-    try:
-        choices_proto.ParseFromString(original_message)
-    except protobuf_message.DecodeError:
-        return None
-    return list(choices_proto.data)
+    choices = choices_decoder.decode_padded_choices(choices_encoded)
+    if choices is None:
+        logging.warning(f"Got malformed choices message: {choices_encoded.hex()}")
+    return choices
 
 
 def _decrypt_tx_encrypted_choice(
@@ -200,8 +220,28 @@ def decrypt_re_encrypted_tx(
     re_encryption_private_key: nacl.public.PrivateKey,
     first_layer_private_key: nacl.public.PrivateKey,
 ) -> list[int] | None:
-    first_layer_decrypted = _decrypt_tx_encrypted_choice(
-        re_encrypted_tx_encrypted_vote, re_encryption_private_key
+    return decrypt_re_encrypted_message(
+        encrypted_message=re_encrypted_tx_encrypted_vote.encrypted_message,
+        nonce=re_encrypted_tx_encrypted_vote.nonce.data,
+        public_key=re_encrypted_tx_encrypted_vote.public_key.data,
+        re_encryption_private_key=re_encryption_private_key,
+        first_layer_private_key=first_layer_private_key,
+    )
+
+
+def decrypt_re_encrypted_message(
+    *,
+    encrypted_message: bytes,
+    nonce: bytes,
+    public_key: bytes,
+    re_encryption_private_key: nacl.public.PrivateKey,
+    first_layer_private_key: nacl.public.PrivateKey,
+) -> list[int] | None:
+    first_layer_decrypted = _decrypt_message(
+        message=encrypted_message,
+        nonce=nonce,
+        public_key_bytes=public_key,
+        private_key=re_encryption_private_key,
     )
 
     if first_layer_decrypted is None:
@@ -225,3 +265,98 @@ def decrypt_re_encrypted_tx(
         return None
 
     return _decode_choices_proto(second_layer_decrypted)
+
+
+@dataclasses.dataclass
+class DecryptionFailures:
+    """Ballots that could not be decrypted, by the step that failed."""
+
+    second_layer: int = 0
+    first_layer_tx: int = 0
+    first_layer: int = 0
+    choices: int = 0
+
+    def total(self) -> int:
+        return self.second_layer + self.first_layer_tx + self.first_layer + self.choices
+
+    def add(self, other: "DecryptionFailures"):
+        self.second_layer += other.second_layer
+        self.first_layer_tx += other.first_layer_tx
+        self.first_layer += other.first_layer
+        self.choices += other.choices
+
+    def to_json(self) -> dict[str, Any]:
+        return dataclasses.asdict(self)
+
+
+def decrypt_re_encrypted_choices(
+    encrypted_messages: Iterable[EncryptedMessage],
+    *,
+    re_encryption_private_key: nacl.public.PrivateKey,
+    first_layer_private_key: nacl.public.PrivateKey,
+    failures: DecryptionFailures | None = None,
+) -> choices_decoder.DecodedChoices:
+    """Decrypts many ballots into flat arrays of their choices.
+
+    Ballots that fail to decrypt are counted in `failures` instead of being
+    logged one by one.
+    """
+    if failures is None:
+        failures = DecryptionFailures()
+
+    second_layer_decrypted = decrypt_messages(
+        encrypted_messages, re_encryption_private_key
+    )
+    positions = []
+    first_layer_messages = []
+    for position, decrypted in enumerate(second_layer_decrypted):
+        if decrypted is None:
+            failures.second_layer += 1
+            continue
+        first_layer_tx = transactions_pb2.TxEncryptedChoice()
+        try:
+            first_layer_tx.ParseFromString(decrypted)
+        except protobuf_message.DecodeError:
+            failures.first_layer_tx += 1
+            continue
+        positions.append(position)
+        first_layer_messages.append(
+            (
+                first_layer_tx.encrypted_message,
+                first_layer_tx.nonce.data,
+                first_layer_tx.public_key.data,
+            )
+        )
+
+    choices_encoded: list[bytes | None] = [None] * len(second_layer_decrypted)
+    for position, decrypted in zip(
+        positions, decrypt_messages(first_layer_messages, first_layer_private_key)
+    ):
+        if decrypted is None:
+            failures.first_layer += 1
+            continue
+        choices_encoded[position] = decrypted
+
+    decoded = choices_decoder.decode_padded_choices_batch(choices_encoded)
+    failures.choices += (
+        len(decoded) - int(decoded.is_decoded.sum()) - (choices_encoded.count(None))
+    )
+    return decoded
+
+
+def decrypt_re_encrypted_messages(
+    encrypted_messages: Iterable[EncryptedMessage],
+    *,
+    re_encryption_private_key: nacl.public.PrivateKey,
+    first_layer_private_key: nacl.public.PrivateKey,
+    failures: DecryptionFailures | None = None,
+) -> list[list[int] | None]:
+    """decrypt_re_encrypted_message of many ballots, see
+    decrypt_re_encrypted_choices."""
+    decoded = decrypt_re_encrypted_choices(
+        encrypted_messages,
+        re_encryption_private_key=re_encryption_private_key,
+        first_layer_private_key=first_layer_private_key,
+        failures=failures,
+    )
+    return [decoded[index] for index in range(len(decoded))]
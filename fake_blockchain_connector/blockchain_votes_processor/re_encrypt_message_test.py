@@ -3,6 +3,7 @@ import nacl.public
 import nacl.utils
 import pytest
 import re_encrypt_message
+import synthetic_ballots
 
 from exonum_client import crypto as exonum_crypto
 from exonum_modules.main import custom_types_pb2
@@ -379,3 +380,48 @@ def test_decrypt_re_encrypted_tx_returns_none_on_invalid_second_layer():
         first_layer_private_key=nacl.public.PrivateKey.generate(),
     )
     assert decrypted_vote is None
+
+
+def test_decrypt_re_encrypted_messages_matches_per_message_decryption():
+    election = synthetic_ballots.generate_election(
+        num_ballots=20, max_choices=2, invalid_share=0.3
+    )
+    encrypted_messages = [
+        (
+            ballot.encrypted_choice.encrypted_message,
+            ballot.encrypted_choice.nonce.data,
+            ballot.encrypted_choice.public_key.data,
+        )
+        for ballot in election.ballots
+    ]
+    # Tampered ciphertext, a truncated public key and a short nonce.
+    encrypted_messages[0] = (b"\0" * 64,) + encrypted_messages[0][1:]
+    encrypted_messages[1] = encrypted_messages[1][:2] + (b"short",)
+    encrypted_messages[2] = (
+        encrypted_messages[2][0],
+        b"short",
+        encrypted_messages[2][2],
+    )
+
+    failures = re_encrypt_message.DecryptionFailures()
+    batch_results = re_encrypt_message.decrypt_re_encrypted_messages(
+        encrypted_messages,
+        re_encryption_private_key=election.re_encryption_private_key,
+        first_layer_private_key=election.first_layer_private_key,
+        failures=failures,
+    )
+
+    per_message_results = [
+        re_encrypt_message.decrypt_re_encrypted_message(
+            encrypted_message=encrypted_message,
+            nonce=nonce,
+            public_key=public_key,
+            re_encryption_private_key=election.re_encryption_private_key,
+            first_layer_private_key=election.first_layer_private_key,
+        )
+        for encrypted_message, nonce, public_key in encrypted_messages
+    ]
+    assert batch_results == per_message_results
+    assert batch_results[:3] == [None, None, None]
+    assert failures.second_layer == 3
+    assert failures.total() == 3
@@ -9,6 +9,7 @@ import aiohttp.web
 import nacl.public
 
 import config
+import metrics
 import re_encrypt_message
 
 routes = aiohttp.web.RouteTableDef()
@@ -103,6 +104,7 @@ async def re_encrypt(request: aiohttp.web.Request) -> aiohttp.web.Response:
 
 app = aiohttp.web.Application()
 app.add_routes(routes)
+metrics.setup(app)
 
 if __name__ == "__main__":
     aiohttp.web.run_app(app, port=config.RE_ENCRYPTOR_LISTEN_PORT)
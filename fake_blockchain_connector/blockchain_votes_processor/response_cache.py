@@ -0,0 +1,93 @@
+import asyncio
+import time
+from typing import Any, Awaitable, Callable, Hashable
+
+import metrics
+
+CACHE_REQUESTS = metrics.REGISTRY.counter(
+    "response_cache_requests_total",
+    "Cached endpoint lookups, by result: hit, miss or coalesced.",
+    ("endpoint", "result"),
+)
+
+
+class ResponseCache:
+    """In-process cache of endpoint responses with per-entry TTLs.
+
+    Keys are `(voting_id, endpoint, ...)` tuples. Concurrent misses of the same
+    key share one call of the loader. The loader's result decides its own TTL
+    through `ttl`: None keeps the entry until it is invalidated, 0 does not
+    cache it at all.
+    """
+
+    def __init__(self, clock: Callable[[], float] = time.monotonic):
+        self._clock = clock
+        self._entries: dict[Hashable, tuple[Any, float | None]] = {}
+        self._in_flight: dict[Hashable, asyncio.Task] = {}
+        # Bumped by invalidate, so that a load that started before it is not
+        # stored.
+        self._generations: dict[str, int] = {}
+
+    def peek(self, key: tuple) -> Any | None:
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        value, expires_at = entry
+        if expires_at is not None and expires_at <= self._clock():
+            del self._entries[key]
+            return None
+        return value
+
+    async def get(
+        self,
+        key: tuple,
+        load: Callable[[], Awaitable[Any]],
+        ttl: Callable[[Any], float | None],
+    ) -> Any:
+        endpoint = key[1]
+        value = self.peek(key)
+        if value is not None:
+            CACHE_REQUESTS.inc(endpoint, "hit")
+            return value
+
+        load_task = self._in_flight.get(key)
+        if load_task is None:
+            CACHE_REQUESTS.inc(endpoint, "miss")
+            # A task of its own, so that a cancelled request does not fail the
+            # requests coalesced with it.
+            load_task = asyncio.create_task(
+                self._load(key, load, ttl, self._generations.get(key[0], 0))
+            )
+            self._in_flight[key] = load_task
+        else:
+            CACHE_REQUESTS.inc(endpoint, "coalesced")
+        return await asyncio.shield(load_task)
+
+    async def _load(
+        self,
+        key: tuple,
+        load: Callable[[], Awaitable[Any]],
+        ttl: Callable[[Any], float | None],
+        generation: int,
+    ) -> Any:
+        try:
+            value = await load()
+        finally:
+            if self._in_flight.get(key) is asyncio.current_task():
+                del self._in_flight[key]
+        if generation != self._generations.get(key[0], 0):
+            return value
+        value_ttl = ttl(value)
+        if value_ttl is None:
+            self._entries[key] = (value, None)
+        elif value_ttl > 0:
+            self._entries[key] = (value, self._clock() + value_ttl)
+        return value
+
+    def invalidate(self, voting_id: str):
+        self._generations[voting_id] = self._generations.get(voting_id, 0) + 1
+        for key in [key for key in self._entries if key[0] == voting_id]:
+            del self._entries[key]
+        # Requests after the invalidation do not join loads started before it.
+        for key in [key for key in self._in_flight if key[0] == voting_id]:
+            del self._in_flight[key]
@@ -0,0 +1,110 @@
+import asyncio
+
+import pytest
+
+import response_cache
+
+
+class _Clock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self) -> float:
+        return self.now
+
+
+class _Loader:
+    def __init__(self):
+        self.calls = 0
+        self.release = asyncio.Event()
+
+    async def __call__(self) -> dict:
+        self.calls += 1
+        await self.release.wait()
+        return {"state": "IN_PROCESS", "call": self.calls}
+
+
+def _ttl(seconds: float | None):
+    return lambda unused_value: seconds
+
+
+def test_concurrent_misses_share_one_load():
+    async def run():
+        cache = response_cache.ResponseCache()
+        load = _Loader()
+        requests = [
+            asyncio.create_task(cache.get(("v1", "voting_state"), load, _ttl(5)))
+            for _ in range(10)
+        ]
+        await asyncio.sleep(0)
+        load.release.set()
+        return load, await asyncio.gather(*requests)
+
+    load, results = asyncio.run(run())
+    assert load.calls == 1
+    assert results == [{"state": "IN_PROCESS", "call": 1}] * 10
+
+
+def test_entries_expire_after_ttl_and_none_never_expires():
+    async def run():
+        clock = _Clock()
+        cache = response_cache.ResponseCache(clock=clock)
+        load = _Loader()
+        load.release.set()
+
+        await cache.get(("v1", "short"), load, _ttl(2))
+        await cache.get(("v1", "forever"), load, _ttl(None))
+        await cache.get(("v1", "uncached"), load, _ttl(0))
+        assert load.calls == 3
+
+        clock.now = 1
+        await cache.get(("v1", "short"), load, _ttl(2))
+        await cache.get(("v1", "uncached"), load, _ttl(0))
+        assert load.calls == 4
+
+        clock.now = 1000
+        await cache.get(("v1", "short"), load, _ttl(2))
+        await cache.get(("v1", "forever"), load, _ttl(None))
+        assert load.calls == 5
+
+    asyncio.run(run())
+
+
+def test_invalidate_drops_entries_and_in_flight_loads_of_voting():
+    async def run():
+        cache = response_cache.ResponseCache()
+        load = _Loader()
+        load.release.set()
+        await cache.get(("v1", "voting_state"), load, _ttl(None))
+        await cache.get(("v2", "voting_state"), load, _ttl(None))
+
+        cache.invalidate("v1")
+        assert cache.peek(("v1", "voting_state")) is None
+        assert cache.peek(("v2", "voting_state")) is not None
+
+        slow_load = _Loader()
+        stale = asyncio.create_task(
+            cache.get(("v1", "voting_state"), slow_load, _ttl(None))
+        )
+        await asyncio.sleep(0)
+        cache.invalidate("v1")
+        slow_load.release.set()
+        await stale
+        # A load that started before the invalidation is not stored.
+        assert cache.peek(("v1", "voting_state")) is None
+
+    asyncio.run(run())
+
+
+def test_failed_load_is_not_cached():
+    async def run():
+        cache = response_cache.ResponseCache()
+
+        async def fail():
+            raise ValueError("Got exception from blockchain")
+
+        with pytest.raises(ValueError):
+            await cache.get(("v1", "voting_state"), fail, _ttl(None))
+        assert cache.peek(("v1", "voting_state")) is None
+
+    asyncio.run(run())
@@ -0,0 +1,139 @@
+"""Local stand-ins for the services the vote ingest path talks to.
+
+Used by tests and benchmarks; they speak the same HTTP API as the real
+services with nothing behind it. The encryptor "decrypts" messages by
+base64-decoding them.
+"""
+
+import array
+import asyncio
+import base64
+import binascii
+import contextlib
+import datetime
+import hashlib
+import socket
+import time
+from typing import AsyncIterator
+
+import aiohttp.web
+
+_HOSTNAME = "127.0.0.1"
+
+
+@contextlib.asynccontextmanager
+async def serve(app: aiohttp.web.Application) -> AsyncIterator[str]:
+    """Runs `app` on a free local port and yields its base url."""
+    runner = aiohttp.web.AppRunner(app)
+    await runner.setup()
+    with socket.socket() as sock:
+        sock.bind((_HOSTNAME, 0))
+        port = sock.getsockname()[1]
+    site = aiohttp.web.TCPSite(runner, _HOSTNAME, port)
+    await site.start()
+    try:
+        yield f"http://{_HOSTNAME}:{port}"
+    finally:
+        await runner.cleanup()
+
+
+def encrypt(message: str) -> str:
+    return base64.b64encode(message.encode("utf-8")).decode("ascii")
+
+
+def _decrypt(message_str: str) -> str | None:
+    try:
+        return base64.b64decode(message_str, validate=True).decode("utf-8")
+    except (binascii.Error, UnicodeDecodeError):
+        return None
+
+
+class StandInEncryptor:
+    """Encryptor with the single-message decrypt endpoint and, optionally,
+    the batch one.
+
+    Every request takes `latency`, regardless of the number of messages in it.
+    """
+
+    def __init__(
+        self,
+        *,
+        batch_supported: bool = True,
+        latency: datetime.timedelta = datetime.timedelta(0),
+    ):
+        self.latency = latency
+        self.single_requests = 0
+        self.batch_requests = 0
+        self.batch_sizes: list[int] = []
+
+        self.app = aiohttp.web.Application()
+        self.app.router.add_get("/api/encryption/decrypt", self._decrypt)
+        if batch_supported:
+            self.app.router.add_post("/api/encryption/decryptBatch", self._batch)
+
+    async def _decrypt(self, request: aiohttp.web.Request) -> aiohttp.web.Response:
+        self.single_requests += 1
+        await asyncio.sleep(self.latency.total_seconds())
+        result = _decrypt(request.query["data[base64body]"])
+        if result is None:
+            return aiohttp.web.json_response(
+                {"error": 1, "errorMessage": "Unable to decrypt data"}
+            )
+        return aiohttp.web.json_response({"data": {"result": result}})
+
+    async def _batch(self, request: aiohttp.web.Request) -> aiohttp.web.Response:
+        messages = (await request.json())["data"]
+        self.batch_requests += 1
+        self.batch_sizes.append(len(messages))
+        await asyncio.sleep(self.latency.total_seconds())
+        return aiohttp.web.json_response(
+            {"data": {"results": [_decrypt(message) for message in messages]}}
+        )
+
+
+class StandInProxy:
+    """Blockchain proxy answering /process_vote after `latency` without a
+    blockchain behind it.
+
+    Records when every vote arrived, relative to its `voteDateTime`.
+    """
+
+    def __init__(self, *, latency: datetime.timedelta = datetime.timedelta(0)):
+        self.latency = latency
+        self.votes = 0
+        self.vote_latencies = array.array("d")
+
+        self.app = aiohttp.web.Application()
+        self.app.router.add_post("/process_vote", self._process_vote)
+
+    async def _process_vote(self, request: aiohttp.web.Request) -> aiohttp.web.Response:
+        vote = await request.json()
+        self.votes += 1
+        self.vote_latencies.append(time.time() - float(vote["voteDateTime"]))
+        await asyncio.sleep(self.latency.total_seconds())
+        tx_hash = hashlib.sha256(vote["tx"].encode("utf-8")).hexdigest()
+        return aiohttp.web.json_response(
+            {"txStoreBallotHash": tx_hash, "txAddVoterKeyHash": tx_hash}
+        )
+
+
+class StandInArm:
+    """ARM config listing the queues to consume, `queue_key -> voting_id`."""
+
+    def __init__(self, queues: dict[str, str]):
+        self.queues = queues
+
+        self.app = aiohttp.web.Application()
+        self.app.router.add_get("/arm/config", self._config)
+
+    async def _config(
+        self, unused_request: aiohttp.web.Request
+    ) -> aiohttp.web.Response:
+        return aiohttp.web.json_response(
+            {
+                "data": [
+                    {"ID": queue_key, "EXT_ID": voting_id}
+                    for queue_key, voting_id in self.queues.items()
+                ]
+            }
+        )
@@ -0,0 +1,168 @@
+import dataclasses
+import os
+import random
+import sys
+
+import nacl.public
+import nacl.utils
+
+import blockchain_voting_client
+
+# Add compiled protos to the current path, since it's required by protoc
+sys.path.append(os.path.join(os.path.dirname(__file__), "exonum_modules", "main"))
+
+from exonum_modules.main import custom_types_pb2, schema_pb2, transactions_pb2
+
+
+@dataclasses.dataclass(frozen=True)
+class SyntheticElection:
+    ballots_config: list[schema_pb2.BallotConfig]
+    ballots: list[blockchain_voting_client.Ballot]
+    # Expected decryption result of every ballot, None for invalid ones.
+    expected_choices: list[list[int] | None]
+    re_encryption_private_key: nacl.public.PrivateKey
+    first_layer_private_key: nacl.public.PrivateKey
+
+
+def _encrypt(
+    data: bytes, public_key: nacl.public.PublicKey
+) -> transactions_pb2.TxEncryptedChoice:
+    sender_private_key = nacl.public.PrivateKey.generate()
+    nonce = nacl.utils.random(nacl.public.Box.NONCE_SIZE)
+    box = nacl.public.Box(sender_private_key, public_key)
+    encrypted_message = box.encrypt(plaintext=data, nonce=nonce)
+    return transactions_pb2.TxEncryptedChoice(
+        encrypted_message=encrypted_message[nacl.public.Box.NONCE_SIZE :],
+        nonce=custom_types_pb2.SealedBoxNonce(data=nonce),
+        public_key=custom_types_pb2.SealedBoxPublicKey(
+            data=sender_private_key.public_key.encode()
+        ),
+    )
+
+
+def encrypt_choices(
+    choices: list[int],
+    *,
+    first_layer_public_key: nacl.public.PublicKey,
+    re_encryption_public_key: nacl.public.PublicKey,
+    padding_size: int = 16,
+) -> transactions_pb2.TxEncryptedChoice:
+    """Encrypts choices the same way the voter frontend and re-encryptor do."""
+    choices_message = (
+        padding_size.to_bytes(2, byteorder="big")
+        + b"\0" * padding_size
+        + schema_pb2.Choices(data=choices).SerializeToString()
+    )
+    first_layer = _encrypt(choices_message, first_layer_public_key)
+    return _encrypt(first_layer.SerializeToString(), re_encryption_public_key)
+
+
+def _random_candidate_id(rng: random.Random, existing_ids: set[int]) -> int:
+    # ARM gives candidates random uint32 ids, so almost all of them take five
+    # bytes as a varint.
+    while (candidate_id := rng.randrange(2**32)) in existing_ids:
+        pass
+    return candidate_id
+
+
+def make_ballots_config(
+    num_districts: int,
+    num_candidates: int,
+    max_choices: int = 1,
+    rng: random.Random | None = None,
+) -> list[schema_pb2.BallotConfig]:
+    """Districts with ids from 1, candidate `n` of district `d` is named
+    "Candidate d-n"."""
+    rng = rng or random.Random(0)
+    candidate_ids: set[int] = set()
+    ballots_config = []
+    for district_id in range(1, num_districts + 1):
+        options = {}
+        for candidate in range(1, num_candidates + 1):
+            candidate_id = _random_candidate_id(rng, candidate_ids)
+            candidate_ids.add(candidate_id)
+            options[candidate_id] = f"Candidate {district_id}-{candidate}"
+        ballots_config.append(
+            schema_pb2.BallotConfig(
+                district_id=district_id,
+                question=f"District {district_id}",
+                options=options,
+                min_choices=1,
+                max_choices=max_choices,
+            )
+        )
+    return ballots_config
+
+
+def _random_invalid_choices(
+    rng: random.Random, ballot_config: schema_pb2.BallotConfig
+) -> list[int]:
+    options = sorted(ballot_config.options)
+    match rng.randrange(3):
+        case 0:
+            return []
+        case 1:
+            return [_random_candidate_id(rng, set(options))]
+        case _:
+            return [options[0]] * (ballot_config.max_choices + 1)
+
+
+def generate_election(
+    *,
+    num_ballots: int,
+    num_districts: int = 1,
+    num_candidates: int = 5,
+    max_choices: int = 1,
+    invalid_share: float = 0.05,
+    seed: int = 0,
+) -> SyntheticElection:
+    """Generates an election with real two-layer sealed-box ballots.
+
+    A share of `invalid_share` ballots contains choices that fail validation.
+    """
+    rng = random.Random(seed)
+    re_encryption_private_key = nacl.public.PrivateKey.generate()
+    first_layer_private_key = nacl.public.PrivateKey.generate()
+    ballots_config = make_ballots_config(
+        num_districts, num_candidates, max_choices, rng
+    )
+
+    ballots = []
+    expected_choices = []
+    for index in range(num_ballots):
+        ballot_config = ballots_config[rng.randrange(num_districts)]
+        is_invalid = rng.random() < invalid_share
+        if is_invalid:
+            choices = _random_invalid_choices(rng, ballot_config)
+        else:
+            choices = rng.sample(
+                sorted(ballot_config.options),
+                rng.randint(ballot_config.min_choices, ballot_config.max_choices),
+            )
+
+        ballots.append(
+            blockchain_voting_client.Ballot(
+                index=index,
+                sid=f"sid_{index}",
+                district_id=ballot_config.district_id,
+                status=blockchain_voting_client.BallotStatus.UNKNOWN,
+                voter_key_hex=nacl.utils.random(32).hex(),
+                store_tx_hash_hex=nacl.utils.random(32).hex(),
+                decrypt_tx_hash_hex=None,
+                decrypted_choices=None,
+                encrypted_choice=encrypt_choices(
+                    choices,
+                    first_layer_public_key=first_layer_private_key.public_key,
+                    re_encryption_public_key=re_encryption_private_key.public_key,
+                ),
+            )
+        )
+        expected_choices.append(None if is_invalid else choices)
+
+    return SyntheticElection(
+        ballots_config=ballots_config,
+        ballots=ballots,
+        expected_choices=expected_choices,
+        re_encryption_private_key=re_encryption_private_key,
+        first_layer_private_key=first_layer_private_key,
+    )
@@ -0,0 +1,234 @@
+import array
+import dataclasses
+from typing import Any
+
+import numpy as np
+
+import ballot_store
+import blockchain_voting_client
+
+from exonum_modules.main import schema_pb2
+
+
+@dataclasses.dataclass(frozen=True)
+class Tally:
+    """Voting results the way the votings service tallies them in
+    TxFinalizeVoting.
+
+    `counts[row, column]` is the number of valid ballots of district
+    `district_ids[row]` choosing candidate `candidate_ids[column]`. Ballots of
+    districts missing from the ballots config only count as invalid in total.
+    """
+
+    district_ids: np.ndarray
+    candidate_ids: np.ndarray
+    counts: np.ndarray
+    valid_ballots: np.ndarray
+    invalid_ballots: np.ndarray
+    wrong_district_ballots: int
+
+    @property
+    def unique_valid_ballots_amount(self) -> int:
+        return int(self.valid_ballots.sum())
+
+    @property
+    def invalid_ballots_amount(self) -> int:
+        return int(self.invalid_ballots.sum()) + self.wrong_district_ballots
+
+    def to_voting_results(self) -> blockchain_voting_client.VotingResults:
+        district_results = {}
+        for row, district_id in enumerate(self.district_ids.tolist()):
+            if self.valid_ballots[row] == 0 and self.invalid_ballots[row] == 0:
+                continue
+            (columns,) = np.nonzero(self.counts[row])
+            district_results[district_id] = blockchain_voting_client.DistrictResult(
+                district_id=district_id,
+                unique_valid_ballots_amount=int(self.valid_ballots[row]),
+                invalid_ballots_amount=int(self.invalid_ballots[row]),
+                tally=dict(
+                    zip(
+                        self.candidate_ids[columns].tolist(),
+                        self.counts[row, columns].tolist(),
+                    )
+                ),
+            )
+        return blockchain_voting_client.VotingResults(
+            invlid_ballots_amount=self.invalid_ballots_amount,
+            unique_valid_ballots_amount=self.unique_valid_ballots_amount,
+            district_results=district_results,
+        )
+
+
+def _int_keys(values: dict[Any, Any]) -> dict[int, Any]:
+    # Keys of JSON objects come from the blockchain as strings.
+    return {int(key): value for key, value in values.items()}
+
+
+def compare(
+    expected: blockchain_voting_client.VotingResults,
+    actual: blockchain_voting_client.VotingResults,
+) -> list[str]:
+    """Returns a description of every difference between two voting results."""
+    mismatches = []
+    if expected.invlid_ballots_amount != actual.invlid_ballots_amount:
+        mismatches.append(
+            f"Invalid ballots: expected {expected.invlid_ballots_amount}, "
+            f"got {actual.invlid_ballots_amount}"
+        )
+    if expected.unique_valid_ballots_amount != actual.unique_valid_ballots_amount:
+        mismatches.append(
+            f"Valid ballots: expected {expected.unique_valid_ballots_amount}, "
+            f"got {actual.unique_valid_ballots_amount}"
+        )
+
+    expected_districts = _int_keys(expected.district_results)
+    actual_districts = _int_keys(actual.district_results)
+    for district_id in sorted(expected_districts.keys() | actual_districts.keys()):
+        expected_district = expected_districts.get(district_id)
+        actual_district = actual_districts.get(district_id)
+        if expected_district is None or actual_district is None:
+            mismatches.append(
+                f"District {district_id}: expected {expected_district}, "
+                f"got {actual_district}"
+            )
+            continue
+        for field in ("unique_valid_ballots_amount", "invalid_ballots_amount"):
+            expected_value = getattr(expected_district, field)
+            actual_value = getattr(actual_district, field)
+            if expected_value != actual_value:
+                mismatches.append(
+                    f"District {district_id} {field}: expected {expected_value}, "
+                    f"got {actual_value}"
+                )
+        expected_tally = _int_keys(expected_district.tally)
+        actual_tally = _int_keys(actual_district.tally)
+        for candidate_id in sorted(expected_tally.keys() | actual_tally.keys()):
+            expected_votes = expected_tally.get(candidate_id, 0)
+            actual_votes = actual_tally.get(candidate_id, 0)
+            if expected_votes != actual_votes:
+                mismatches.append(
+                    f"District {district_id} candidate {candidate_id}: "
+                    f"expected {expected_votes} votes, got {actual_votes}"
+                )
+    return mismatches
+
+
+def compute_tally(
+    *,
+    ballot_district_ids: np.ndarray,
+    is_valid: np.ndarray,
+    choices: np.ndarray,
+    choices_offsets: np.ndarray,
+    ballots_config: list[schema_pb2.BallotConfig],
+) -> Tally:
+    """Tallies ballots given as columns.
+
+    Choices of ballot `i` are `choices[choices_offsets[i]:choices_offsets[i + 1]]`,
+    only the choices of valid ballots are counted.
+    """
+    district_ids = np.unique(
+        np.array([config.district_id for config in ballots_config], dtype=np.int64)
+    )
+    num_districts = len(district_ids)
+
+    rows = np.searchsorted(district_ids, ballot_district_ids)
+    is_known_district = np.zeros(len(ballot_district_ids), dtype=bool)
+    in_bounds = rows < num_districts
+    is_known_district[in_bounds] = (
+        district_ids[rows[in_bounds]] == ballot_district_ids[in_bounds]
+    )
+    is_valid = is_valid.astype(bool) & is_known_district
+    is_invalid = ~is_valid & is_known_district
+
+    valid_ballots = np.bincount(rows[is_valid], minlength=num_districts)
+    invalid_ballots = np.bincount(rows[is_invalid], minlength=num_districts)
+
+    choices_per_ballot = np.diff(choices_offsets).astype(np.int64)
+    choice_rows = np.repeat(rows, choices_per_ballot)
+    counted_choices = choices[np.repeat(is_valid, choices_per_ballot)]
+    counted_rows = choice_rows[np.repeat(is_valid, choices_per_ballot)]
+
+    options = [option for config in ballots_config for option in config.options]
+    candidate_ids = np.union1d(
+        np.array(options, dtype=np.int64), counted_choices.astype(np.int64)
+    )
+    columns = np.searchsorted(candidate_ids, counted_choices)
+    counts = np.bincount(
+        counted_rows * len(candidate_ids) + columns,
+        minlength=num_districts * len(candidate_ids),
+    ).reshape(num_districts, len(candidate_ids))
+
+    return Tally(
+        district_ids=district_ids,
+        candidate_ids=candidate_ids,
+        counts=counts,
+        valid_ballots=valid_ballots,
+        invalid_ballots=invalid_ballots,
+        wrong_district_ballots=int((~is_known_district).sum()),
+    )
+
+
+def tally_ballot_store(
+    store: ballot_store.BallotStore, ballots_config: list[schema_pb2.BallotConfig]
+) -> Tally:
+    """Tallies decrypted ballots of the store, it must not contain ballots that
+    are not decrypted yet."""
+    statuses = list(blockchain_voting_client.BallotStatus)
+    status_codes = store.status_codes
+    if np.any(
+        status_codes == statuses.index(blockchain_voting_client.BallotStatus.UNKNOWN)
+    ):
+        raise ValueError("Cannot tally ballots that are not decrypted")
+    choices, choices_offsets = store.decrypted_choices
+    return compute_tally(
+        ballot_district_ids=store.district_ids,
+        is_valid=status_codes
+        == statuses.index(blockchain_voting_client.BallotStatus.VALID),
+        choices=choices,
+        choices_offsets=choices_offsets,
+        ballots_config=ballots_config,
+    )
+
+
+class TallyBuilder:
+    """Collects decryption results one ballot at a time into columns for
+    `compute_tally`."""
+
+    def __init__(self):
+        self._district_ids = array.array("q")
+        self._is_valid = array.array("b")
+        self._choices = array.array("I")
+        self._choices_offsets = array.array("Q", [0])
+
+    def __len__(self) -> int:
+        return len(self._district_ids)
+
+    def add(self, district_id: int, decrypted_choices: list[int] | None):
+        """Adds a ballot, None choices stand for an invalid ballot."""
+        self._district_ids.append(district_id)
+        self._is_valid.append(decrypted_choices is not None)
+        if decrypted_choices is not None:
+            self._choices.extend(decrypted_choices)
+        self._choices_offsets.append(len(self._choices))
+
+    def add_ballot(self, ballot: blockchain_voting_client.Ballot):
+        """Adds a ballot that is already decrypted in the blockchain."""
+        if ballot.status == blockchain_voting_client.BallotStatus.UNKNOWN:
+            raise ValueError(f"Ballot {ballot.index} is not decrypted")
+        self.add(
+            ballot.district_id,
+            (
+                ballot.decrypted_choices
+                if ballot.status == blockchain_voting_client.BallotStatus.VALID
+                else None
+            ),
+        )
+
+    def build(self, ballots_config: list[schema_pb2.BallotConfig]) -> Tally:
+        return compute_tally(
+            ballot_district_ids=np.frombuffer(self._district_ids, dtype=np.int64),
+            is_valid=np.frombuffer(self._is_valid, dtype=np.int8),
+            choices=np.frombuffer(self._choices, dtype=np.uint32),
+            choices_offsets=np.frombuffer(self._choices_offsets, dtype=np.uint64),
+            ballots_config=ballots_config,
+        )
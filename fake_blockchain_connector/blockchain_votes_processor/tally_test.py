@@ -0,0 +1,115 @@
+import collections
+import dataclasses
+import json
+import random
+
+import ballot_store
+import blockchain_voting_client
+import synthetic_ballots
+import tally
+
+
+def _decrypted_ballots() -> (
+    tuple[list[blockchain_voting_client.Ballot], synthetic_ballots.SyntheticElection]
+):
+    election = synthetic_ballots.generate_election(
+        num_ballots=200, num_districts=4, max_choices=3, invalid_share=0.2
+    )
+    rng = random.Random(0)
+    ballots = []
+    for ballot, choices in zip(election.ballots, election.expected_choices):
+        district_id = ballot.district_id
+        # Ballots of a district missing from the ballots config.
+        if rng.random() < 0.05:
+            district_id = 100
+        ballots.append(
+            dataclasses.replace(
+                ballot,
+                district_id=district_id,
+                status=(
+                    blockchain_voting_client.BallotStatus.INVALID
+                    if choices is None
+                    else blockchain_voting_client.BallotStatus.VALID
+                ),
+                decrypted_choices=choices,
+            )
+        )
+    return ballots, election
+
+
+def _expected_results(
+    ballots: list[blockchain_voting_client.Ballot],
+) -> blockchain_voting_client.VotingResults:
+    """The votings service's tally_results, one ballot at a time."""
+    district_ids = {1, 2, 3, 4}
+    invalid = 0
+    valid = 0
+    district_valid = collections.Counter()
+    district_invalid = collections.Counter()
+    district_tally = collections.defaultdict(collections.Counter)
+    for ballot in ballots:
+        if ballot.district_id not in district_ids:
+            invalid += 1
+        elif ballot.status == blockchain_voting_client.BallotStatus.VALID:
+            valid += 1
+            district_valid[ballot.district_id] += 1
+            district_tally[ballot.district_id].update(ballot.decrypted_choices)
+        else:
+            invalid += 1
+            district_invalid[ballot.district_id] += 1
+    # The way the results come over JSON, with string keys.
+    return blockchain_voting_client.VotingResults.from_json(
+        json.loads(
+            json.dumps(
+                {
+                    "invalid_ballots_amount": invalid,
+                    "unique_valid_ballots_amount": valid,
+                    "district_results": {
+                        district_id: {
+                            "district_id": district_id,
+                            "unique_valid_ballots_amount": district_valid[district_id],
+                            "invalid_ballots_amount": district_invalid[district_id],
+                            "tally": district_tally[district_id],
+                        }
+                        for district_id in district_valid.keys()
+                        | district_invalid.keys()
+                    },
+                }
+            )
+        )
+    )
+
+
+def test_builder_and_store_tallies_match_votings_service():
+    ballots, election = _decrypted_ballots()
+    expected = _expected_results(ballots)
+
+    builder = tally.TallyBuilder()
+    for ballot in ballots:
+        builder.add_ballot(ballot)
+    builder_tally = builder.build(election.ballots_config)
+    store_tally = tally.tally_ballot_store(
+        ballot_store.BallotStore.from_ballots(ballots), election.ballots_config
+    )
+
+    assert builder_tally.wrong_district_ballots > 0
+    assert tally.compare(builder_tally.to_voting_results(), expected) == []
+    assert tally.compare(store_tally.to_voting_results(), expected) == []
+
+
+def test_compare_reports_mismatches():
+    ballots, election = _decrypted_ballots()
+    expected = _expected_results(ballots)
+
+    builder = tally.TallyBuilder()
+    for ballot in ballots:
+        builder.add_ballot(ballot)
+    # One more ballot for a candidate of district 1.
+    candidate_id = min(election.ballots_config[0].options)
+    builder.add(1, [candidate_id])
+    mismatches = tally.compare(
+        builder.build(election.ballots_config).to_voting_results(), expected
+    )
+
+    assert len(mismatches) == 3
+    assert f"District 1 candidate {candidate_id}" in mismatches[-1]
@@ -0,0 +1,465 @@
+"""In-process simulator of the Exonum votings service API.
+
+Serves the votings service endpoints and the explorer transaction API the
+BlockchainVotingClient uses, over ballots of a synthetic election, so that
+fetching, decryption, publishing and finalization can run without the Rust
+blockchain. Transactions are applied with the rules of the votings service
+when the block after their submission is committed.
+"""
+
+import asyncio
+import collections
+import dataclasses
+import datetime
+import hashlib
+import random
+from typing import Any, Awaitable, Callable
+
+import aiohttp.web
+from exonum_client.module_manager import ModuleManager
+import nacl.public
+
+import ballot_store
+import blockchain_voting_client
+import synthetic_ballots
+
+from exonum_modules.main import transactions_pb2
+
+_VOTING_API_PREFIX = "/api" + blockchain_voting_client._VOTING_API_PREFIX
+_EXPLORER_PREFIX = "/api/explorer/v1/"
+
+_TRANSACTIONS = {
+    blockchain_voting_client._STOP_VOTING_MESSAGE_ID: transactions_pb2.TxStopVoting,
+    blockchain_voting_client._PUBLISH_DECRYPTION_KEY_MESSAGE_ID: (
+        transactions_pb2.TxPublishDecryptionKey
+    ),
+    blockchain_voting_client._PUBLISH_DECRYPTION_RESULT_MESSAGE_ID: (
+        transactions_pb2.TxPublishDecryptedBallot
+    ),
+    blockchain_voting_client._FINALIZE_VOTING_MESSAGE_ID: (
+        transactions_pb2.TxFinalizeVoting
+    ),
+}
+
+# Endpoints failing with `error_rate` by default: the ones the client retries.
+DEFAULT_ERROR_ENDPOINTS = frozenset({"ballot-by-index", "ballots-by-index-range"})
+
+
+class TransactionError(Exception):
+    """A transaction that the votings service rejects when executing it."""
+
+
+@dataclasses.dataclass
+class _Decryption:
+    status: blockchain_voting_client.BallotStatus
+    decrypted_choices: list[int] | None
+    decrypt_tx_hash_hex: str
+
+
+@dataclasses.dataclass
+class _Transaction:
+    method_id: int
+    arguments: Any
+    committed: bool = False
+    error: str | None = None
+
+
+def _is_valid_choices(
+    choices: list[int], options: set[int], min_choices: int, max_choices: int
+) -> bool:
+    """validate_decrypted_choices of the votings service.
+
+    As there, only adjacent duplicates are noticed.
+    """
+    unique_adjacent = [
+        choice
+        for position, choice in enumerate(choices)
+        if position == 0 or choices[position - 1] != choice
+    ]
+    return (
+        min_choices <= len(choices) <= max_choices
+        and len(unique_adjacent) == len(choices)
+        and set(choices) <= options
+    )
+
+
+class VotingsServiceSimulator:
+    """Votings service of a single voting.
+
+    Every request waits `latency`. A block is committed every `commit_delay`
+    with all the transactions submitted before it. Requests to
+    `error_endpoints` fail with 503 with probability `error_rate`.
+    """
+
+    def __init__(
+        self,
+        election: synthetic_ballots.SyntheticElection,
+        *,
+        voting_id: str = "voting",
+        state: blockchain_voting_client.VotingState = (
+            blockchain_voting_client.VotingState.STOPPED
+        ),
+        latency: datetime.timedelta = datetime.timedelta(0),
+        commit_delay: datetime.timedelta = datetime.timedelta(seconds=0.01),
+        error_rate: float = 0.0,
+        error_endpoints: frozenset[str] = DEFAULT_ERROR_ENDPOINTS,
+        with_range_endpoint: bool = False,
+        seed: int = 0,
+    ):
+        self.voting_id = voting_id
+        self.state = state
+        self.latency = latency
+        self.commit_delay = commit_delay
+        self.error_rate = error_rate
+        self.error_endpoints = error_endpoints
+        self.requests: collections.Counter[str] = collections.Counter()
+        self.height = 0
+
+        self._rng = random.Random(seed)
+        self._ballots_config = election.ballots_config
+        self._district_rules = {
+            config.district_id: (
+                set(config.options),
+                config.min_choices,
+                config.max_choices,
+            )
+            for config in election.ballots_config
+        }
+        self._public_key = election.first_layer_private_key.public_key
+        self._private_key: nacl.public.PrivateKey | None = None
+        self._ballots = ballot_store.BallotStore.from_ballots(election.ballots)
+        self._decryptions: dict[int, _Decryption] = {}
+        self._decrypted_ballots = 0
+        self._invalid_ballots = 0
+        for ballot in election.ballots:
+            if ballot.status == blockchain_voting_client.BallotStatus.UNKNOWN:
+                continue
+            self._decryptions[ballot.index] = _Decryption(
+                ballot.status, ballot.decrypted_choices, ballot.decrypt_tx_hash_hex
+            )
+            if ballot.status == blockchain_voting_client.BallotStatus.VALID:
+                self._decrypted_ballots += 1
+            else:
+                self._invalid_ballots += 1
+        self._voting_results: dict[str, Any] | None = None
+
+        self._transactions: dict[str, _Transaction] = {}
+        self._pool: list[str] = []
+        self._block_producer: asyncio.Task | None = None
+
+        self.app = aiohttp.web.Application()
+        for endpoint, handler in (
+            ("voting-state", self._voting_state),
+            ("crypto-system-settings", self._crypto_system_settings),
+            ("ballots-config", self._ballots_config_handler),
+            ("stored-ballots-amount", self._stored_ballots_amount),
+            ("ballot-by-index", self._ballot_by_index),
+            ("decryption-statistics", self._decryption_statistics),
+            ("voting-results", self._voting_results_handler),
+        ):
+            self._add_get(_VOTING_API_PREFIX, endpoint, handler)
+        if with_range_endpoint:
+            self._add_get(
+                _VOTING_API_PREFIX,
+                blockchain_voting_client._BALLOTS_BY_INDEX_RANGE_ENDPOINT,
+                self._ballots_by_index_range,
+            )
+        self._add_get(_EXPLORER_PREFIX, "transactions", self._transaction_status)
+        self._add_get(_EXPLORER_PREFIX, "blocks", self._blocks)
+        self.app.router.add_post(
+            _EXPLORER_PREFIX + "transactions",
+            self._with_faults("transactions", self._submit),
+        )
+        self.app.on_startup.append(self._start_block_producer)
+        self.app.on_cleanup.append(self._stop_block_producer)
+
+    def _add_get(
+        self,
+        prefix: str,
+        endpoint: str,
+        handler: Callable[[aiohttp.web.Request], Awaitable[aiohttp.web.Response]],
+    ):
+        self.app.router.add_get(prefix + endpoint, self._with_faults(endpoint, handler))
+
+    def _with_faults(
+        self,
+        endpoint: str,
+        handler: Callable[[aiohttp.web.Request], Awaitable[aiohttp.web.Response]],
+    ) -> Callable[[aiohttp.web.Request], Awaitable[aiohttp.web.Response]]:
+        async def _handle(request: aiohttp.web.Request) -> aiohttp.web.Response:
+            self.requests[endpoint] += 1
+            await asyncio.sleep(self.latency.total_seconds())
+            if (
+                endpoint in self.error_endpoints
+                and self._rng.random() < self.error_rate
+            ):
+                return aiohttp.web.Response(status=503, text="Injected error")
+            if (
+                endpoint not in ("transactions", "blocks")
+                and request.query.get("voting_id") != self.voting_id
+            ):
+                return aiohttp.web.json_response(
+                    {"title": "Voting does not exist"}, status=400
+                )
+            return await handler(request)
+
+        return _handle
+
+    # Blocks and transactions.
+
+    async def _start_block_producer(self, unused_app: aiohttp.web.Application):
+        self._block_producer = asyncio.create_task(self._produce_blocks())
+
+    async def _stop_block_producer(self, unused_app: aiohttp.web.Application):
+        if self._block_producer is not None:
+            self._block_producer.cancel()
+            await asyncio.gather(self._block_producer, return_exceptions=True)
+
+    async def _produce_blocks(self):
+        while True:
+            await asyncio.sleep(self.commit_delay.total_seconds())
+            self.commit_block()
+
+    def commit_block(self):
+        """Executes the transactions in the pool in submission order."""
+        pool, self._pool = self._pool, []
+        for tx_hash in pool:
+            transaction = self._transactions[tx_hash]
+            try:
+                self._execute(tx_hash, transaction)
+            except TransactionError as e:
+                transaction.error = str(e)
+            transaction.committed = True
+        self.height += 1
+
+    def _execute(self, tx_hash: str, transaction: _Transaction):
+        arguments = transaction.arguments
+        if arguments.voting_id != self.voting_id:
+            raise TransactionError("Voting does not exist")
+
+        match transaction.method_id:
+            case blockchain_voting_client._STOP_VOTING_MESSAGE_ID:
+                self._require_state(blockchain_voting_client.VotingState.IN_PROCESS)
+                self.state = blockchain_voting_client.VotingState.STOPPED
+            case blockchain_voting_client._PUBLISH_DECRYPTION_KEY_MESSAGE_ID:
+                self._require_state(blockchain_voting_client.VotingState.STOPPED)
+                private_key = nacl.public.PrivateKey(arguments.private_key.data)
+                if private_key.public_key != self._public_key:
+                    raise TransactionError("Private key does not match public key")
+                self._private_key = private_key
+            case blockchain_voting_client._PUBLISH_DECRYPTION_RESULT_MESSAGE_ID:
+                self._require_state(blockchain_voting_client.VotingState.STOPPED)
+                self._publish_decrypted_ballot(tx_hash, arguments)
+            case blockchain_voting_client._FINALIZE_VOTING_MESSAGE_ID:
+                self._require_state(blockchain_voting_client.VotingState.STOPPED)
+                self._voting_results = self._tally_results()
+                self.state = blockchain_voting_client.VotingState.FINISHED
+
+    def _require_state(self, state: blockchain_voting_client.VotingState):
+        if self.state != state:
+            raise TransactionError(f"Forbidden in voting state {self.state.value}")
+
+    def _publish_decrypted_ballot(
+        self, tx_hash: str, tx: transactions_pb2.TxPublishDecryptedBallot
+    ):
+        if not 0 <= tx.ballot_index < len(self._ballots):
+            raise TransactionError("Ballot does not exist")
+        decryption = self._decryptions.get(tx.ballot_index)
+        if decryption is not None:
+            decryption.decrypt_tx_hash_hex = tx_hash
+            return
+
+        options, min_choices, max_choices = self._district_rules.get(
+            self._ballots.district_ids[tx.ballot_index], (set(), 0, 0)
+        )
+        choices = list(tx.decrypted_choices)
+        if not tx.is_invalid and _is_valid_choices(
+            choices, options, min_choices, max_choices
+        ):
+            self._decryptions[tx.ballot_index] = _Decryption(
+                blockchain_voting_client.BallotStatus.VALID, choices, tx_hash
+            )
+            self._decrypted_ballots += 1
+        else:
+            self._decryptions[tx.ballot_index] = _Decryption(
+                blockchain_voting_client.BallotStatus.INVALID, None, tx_hash
+            )
+            self._invalid_ballots += 1
+
+    def _tally_results(self) -> dict[str, Any]:
+        """tally_results of the votings service."""
+        invalid_ballots_amount = 0
+        unique_valid_ballots_amount = 0
+        district_results = {}
+        for index, district_id in enumerate(self._ballots.district_ids.tolist()):
+            if district_id not in self._district_rules:
+                invalid_ballots_amount += 1
+                continue
+            district_result = district_results.setdefault(
+                district_id,
+                {
+                    "district_id": district_id,
+                    "tally": collections.Counter(),
+                    "invalid_ballots_amount": 0,
+                    "unique_valid_ballots_amount": 0,
+                },
+            )
+            decryption = self._decryptions.get(index)
+            if (
+                decryption is not None
+                and decryption.status == blockchain_voting_client.BallotStatus.VALID
+            ):
+                unique_valid_ballots_amount += 1
+                district_result["unique_valid_ballots_amount"] += 1
+                district_result["tally"].update(decryption.decrypted_choices)
+            else:
+                invalid_ballots_amount += 1
+                district_result["invalid_ballots_amount"] += 1
+        return {
+            "district_results": district_results,
+            "invalid_ballots_amount": invalid_ballots_amount,
+            "unique_valid_ballots_amount": unique_valid_ballots_amount,
+        }
+
+    async def _submit(self, request: aiohttp.web.Request) -> aiohttp.web.Response:
+        tx_raw = bytes.fromhex((await request.json())["tx_body"])
+        messages_module = ModuleManager.import_main_module("exonum.messages")
+        signed_message = messages_module.SignedMessage()
+        signed_message.ParseFromString(tx_raw)
+        core_message = messages_module.CoreMessage()
+        core_message.ParseFromString(signed_message.payload)
+
+        method_id = core_message.any_tx.call_info.method_id
+        transaction_class = _TRANSACTIONS.get(method_id)
+        if transaction_class is None:
+            return aiohttp.web.json_response(
+                {"title": f"Unknown transaction {method_id}"}, status=400
+            )
+        arguments = transaction_class()
+        arguments.ParseFromString(core_message.any_tx.arguments)
+
+        tx_hash = hashlib.sha256(tx_raw).hexdigest()
+        if tx_hash not in self._transactions:
+            self._transactions[tx_hash] = _Transaction(method_id, arguments)
+            self._pool.append(tx_hash)
+        return aiohttp.web.json_response({"tx_hash": tx_hash})
+
+    async def _transaction_status(
+        self, request: aiohttp.web.Request
+    ) -> aiohttp.web.Response:
+        transaction = self._transactions.get(request.query["hash"])
+        if transaction is None:
+            return aiohttp.web.json_response(
+                {"title": "Transaction not found"}, status=404
+            )
+        if not transaction.committed:
+            return aiohttp.web.json_response({"type": "in-pool"})
+        if transaction.error is None:
+            status = {"type": "success"}
+        else:
+            status = {"type": "service_error", "description": transaction.error}
+        return aiohttp.web.json_response({"type": "committed", "status": status})
+
+    async def _blocks(
+        self, unused_request: aiohttp.web.Request
+    ) -> aiohttp.web.Response:
+        return aiohttp.web.json_response(
+            {"range": {"start": self.height, "end": self.height + 1}, "blocks": []}
+        )
+
+    # Votings service API.
+
+    async def _voting_state(
+        self, unused_request: aiohttp.web.Request
+    ) -> aiohttp.web.Response:
+        return aiohttp.web.json_response({"state": self.state.value})
+
+    async def _crypto_system_settings(
+        self, unused_request: aiohttp.web.Request
+    ) -> aiohttp.web.Response:
+        return aiohttp.web.json_response(
+            {
+                "public_key": self._public_key.encode().hex(),
+                "private_key": (
+                    None
+                    if self._private_key is None
+                    else self._private_key.encode().hex()
+                ),
+            }
+        )
+
+    async def _ballots_config_handler(
+        self, unused_request: aiohttp.web.Request
+    ) -> aiohttp.web.Response:
+        return aiohttp.web.json_response(
+            [list(config.SerializeToString()) for config in self._ballots_config]
+        )
+
+    async def _stored_ballots_amount(
+        self, unused_request: aiohttp.web.Request
+    ) -> aiohttp.web.Response:
+        return aiohttp.web.json_response({"stored_ballots_amount": len(self._ballots)})
+
+    def _ballot_json(self, index: int) -> dict[str, Any]:
+        ballot = self._ballots[index]
+        decryption = self._decryptions.get(index)
+        if decryption is not None:
+            ballot = dataclasses.replace(
+                ballot,
+                status=decryption.status,
+                decrypted_choices=decryption.decrypted_choices,
+                decrypt_tx_hash_hex=decryption.decrypt_tx_hash_hex,
+            )
+        return {
+            "index": ballot.index,
+            "sid": ballot.sid,
+            "voter": ballot.voter_key_hex,
+            "district_id": ballot.district_id,
+            "encrypted_choice": {
+                "message": ballot.encrypted_choice.encrypted_message.hex(),
+                "nonce": ballot.encrypted_choice.nonce.data.hex(),
+                "public_key": ballot.encrypted_choice.public_key.data.hex(),
+            },
+            "decrypted_choices": ballot.decrypted_choices,
+            "store_tx_hash": ballot.store_tx_hash_hex,
+            "decrypt_tx_hash": ballot.decrypt_tx_hash_hex,
+            "status": ballot.status.value,
+        }
+
+    async def _ballot_by_index(
+        self, request: aiohttp.web.Request
+    ) -> aiohttp.web.Response:
+        index = int(request.query["ballot_index"])
+        if not 0 <= index < len(self._ballots):
+            return aiohttp.web.json_response(
+                {"title": "Ballot does not exist"}, status=400
+            )
+        return aiohttp.web.json_response(self._ballot_json(index))
+
+    async def _ballots_by_index_range(
+        self, request: aiohttp.web.Request
+    ) -> aiohttp.web.Response:
+        start = int(request.query["from_index"])
+        stop = min(int(request.query["to_index"]), len(self._ballots))
+        return aiohttp.web.json_response(
+            [self._ballot_json(index) for index in range(start, stop)]
+        )
+
+    async def _decryption_statistics(
+        self, unused_request: aiohttp.web.Request
+    ) -> aiohttp.web.Response:
+        return aiohttp.web.json_response(
+            {
+                "decrypted_ballots_amount": self._decrypted_ballots,
+                "invalid_ballots_amount": self._invalid_ballots,
+            }
+        )
+
+    async def _voting_results_handler(
+        self, unused_request: aiohttp.web.Request
+    ) -> aiohttp.web.Response:
+        if self._voting_results is None:
+            return aiohttp.web.json_response(
+                {"title": "Forbidden for this voting state"}, status=400
+            )
+        return aiohttp.web.json_response(self._voting_results)
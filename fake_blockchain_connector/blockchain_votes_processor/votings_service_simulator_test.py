@@ -0,0 +1,96 @@
+import asyncio
+import datetime
+import urllib.parse
+
+import exonum_client.crypto
+import pytest
+
+import blockchain_voting_client
+import config
+import finalize_voting
+import stand_in_services
+import synthetic_ballots
+import tally
+import votings_service_simulator
+
+_SERVICE_KEY_PAIR = exonum_client.crypto.KeyPair.generate()
+
+
+async def _with_client(simulator, coro_fn):
+    async with stand_in_services.serve(simulator.app) as base_url:
+        url = urllib.parse.urlsplit(base_url)
+        async with blockchain_voting_client.BlockchainVotingClient(
+            voting_id=simulator.voting_id,
+            url=url.hostname,
+            public_api_port=url.port,
+            private_api_port=url.port,
+            service_api_private_key_hex=_SERVICE_KEY_PAIR.secret_key.hex(),
+            service_api_public_key_hex=_SERVICE_KEY_PAIR.public_key.hex(),
+            tx_timeout=datetime.timedelta(seconds=10),
+        ) as client:
+            return await coro_fn(client)
+
+
+def _expected_results(
+    election: synthetic_ballots.SyntheticElection,
+) -> blockchain_voting_client.VotingResults:
+    builder = tally.TallyBuilder()
+    for ballot, choices in zip(election.ballots, election.expected_choices):
+        builder.add(ballot.district_id, choices)
+    return builder.build(election.ballots_config).to_voting_results()
+
+
+def test_finalize_voting_end_to_end(monkeypatch):
+    monkeypatch.setattr(config, "FORGING_DO_FORGING", False)
+    election = synthetic_ballots.generate_election(
+        num_ballots=60, num_districts=3, max_choices=2, invalid_share=0.2
+    )
+    simulator = votings_service_simulator.VotingsServiceSimulator(
+        election,
+        voting_id="e2e_voting",
+        commit_delay=datetime.timedelta(milliseconds=5),
+        error_rate=0.3,
+        with_range_endpoint=True,
+    )
+
+    async def run(client):
+        mismatches = await finalize_voting.finalize_voting(
+            voting_client=client,
+            re_encryption_private_key=election.re_encryption_private_key,
+            first_layer_private_key=election.first_layer_private_key,
+            decrypt_workers=1,
+            fetch_batch_size=10,
+        )
+        return mismatches, await client.voting_state(), await client.voting_results()
+
+    mismatches, voting_state, voting_results = asyncio.run(_with_client(simulator, run))
+
+    assert mismatches == []
+    assert voting_state == blockchain_voting_client.VotingState.FINISHED
+    assert tally.compare(_expected_results(election), voting_results) == []
+    # Injected errors were retried.
+    assert simulator.requests["ballots-by-index-range"] > len(election.ballots) // 10
+
+
+def test_rejected_transaction_fails_on_commit():
+    election = synthetic_ballots.generate_election(num_ballots=1)
+    simulator = votings_service_simulator.VotingsServiceSimulator(
+        election, state=blockchain_voting_client.VotingState.IN_PROCESS
+    )
+
+    async def run(client):
+        # Ballots are only decrypted once the voting is stopped.
+        with pytest.raises(ValueError, match="Forbidden in voting state InProcess"):
+            await client.publish_decrypted_ballot(
+                ballot_index=0, decrypted_choices=[1], is_invalid=False
+            )
+        await client.stop_voting()
+        await client.publish_decrypted_ballot(
+            ballot_index=0,
+            decrypted_choices=election.expected_choices[0],
+            is_invalid=False,
+        )
+        return await client.decryption_statistics()
+
+    statistics = asyncio.run(_with_client(simulator, run))
+    assert statistics.decrypted_ballots_amount == 1